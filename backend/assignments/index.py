@@ -1,13 +1,21 @@
 import json
 import os
+import sys
 import psycopg2
 import jwt
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from pydantic import BaseModel, Field
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.pagination import wants_page, parse_page, split_page
+from common.logger import log_action
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+BULK_MAX_COURSES = int(os.environ.get('BULK_ASSIGN_MAX_COURSES', '50'))
+BULK_MAX_USERS = int(os.environ.get('BULK_ASSIGN_MAX_USERS', '10000'))
 
 class AssignCourseRequest(BaseModel):
     courseId: int = Field(..., ge=1)
@@ -15,9 +23,14 @@ class AssignCourseRequest(BaseModel):
     dueDate: Optional[str] = None
     notes: Optional[str] = None
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
+class BulkAssignRequest(BaseModel):
+    courseIds: List[int] = Field(..., min_length=1, max_length=BULK_MAX_COURSES)
+    userIds: Optional[List[int]] = Field(None, min_length=1, max_length=BULK_MAX_USERS)
+    department: Optional[str] = Field(None, min_length=1)
+    role: Optional[str] = Field(None, min_length=1)
+    position: Optional[str] = Field(None, min_length=1)
+    dueDate: Optional[str] = None
+    notes: Optional[str] = None
 
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
@@ -40,6 +53,73 @@ def require_admin(headers: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Op
     
     return payload, None
 
+ASSIGNMENT_COLUMNS = (
+    "SELECT id, course_id, user_id, assigned_by, assigned_at, due_date, status, notes "
+    "FROM course_assignments_v2 "
+)
+
+# Все назначения пачки одним запросом: пары курс x пользователь вставляются через ON CONFLICT DO NOTHING,
+# прогресс создается только для действительно новых назначений (как в одиночном POST)
+BULK_ASSIGN_SQL = (
+    "WITH targets AS ("
+    "    SELECT u.id FROM users_v2 u WHERE COALESCE(u.is_active, true) {user_filter}"
+    "), courses AS ("
+    "    SELECT id, lessons_count FROM courses_v2 WHERE id = ANY(%(course_ids)s)"
+    "), inserted AS ("
+    "    INSERT INTO course_assignments_v2 (course_id, user_id, assigned_by, assigned_at, due_date, status, notes, created_at) "
+    "    SELECT c.id, t.id, %(assigned_by)s, %(now)s, %(due_date)s, 'assigned', %(notes)s, %(now)s "
+    "    FROM courses c CROSS JOIN targets t "
+    "    ON CONFLICT (course_id, user_id) DO NOTHING RETURNING course_id, user_id"
+    "), progress AS ("
+    "    INSERT INTO course_progress_v2 (course_id, user_id, completed_lessons, total_lessons, completed, started_at, created_at, updated_at) "
+    "    SELECT i.course_id, i.user_id, 0, c.lessons_count, false, %(now)s, %(now)s, %(now)s "
+    "    FROM inserted i JOIN courses c ON c.id = i.course_id "
+    "    ON CONFLICT (course_id, user_id) DO NOTHING RETURNING 1"
+    ") "
+    "SELECT (SELECT COUNT(*) FROM targets), (SELECT COUNT(*) FROM inserted), (SELECT COUNT(*) FROM progress), "
+    "(SELECT COALESCE(array_agg(c), '{{}}') FROM unnest(%(course_ids)s::int[]) c WHERE c NOT IN (SELECT id FROM courses)), "
+    "(SELECT COALESCE(array_agg(u), '{{}}') FROM unnest(%(user_ids)s::int[]) u WHERE u NOT IN (SELECT id FROM targets))"
+)
+
+def bulk_assign(cur, assign_req: BulkAssignRequest, assigned_by: int) -> Dict[str, Any]:
+    '''
+    Назначает курсы courseIds всем пользователям из userIds и/или фильтра department / role / position
+    Уже назначенные пары пропускаются, неактивные пользователи не выбираются
+    Returns: число созданных и пропущенных назначений, ненайденные курсы и пользователи
+    '''
+    course_ids = sorted(set(assign_req.courseIds))
+    user_ids = sorted(set(assign_req.userIds)) if assign_req.userIds else []
+    conditions = []
+    params: Dict[str, Any] = {
+        'course_ids': course_ids,
+        'user_ids': user_ids,
+        'assigned_by': assigned_by,
+        'now': datetime.utcnow(),
+        'due_date': assign_req.dueDate,
+        'notes': assign_req.notes,
+    }
+    if user_ids:
+        conditions.append("u.id = ANY(%(user_ids)s)")
+    for field in ('department', 'role', 'position'):
+        value = getattr(assign_req, field)
+        if value:
+            conditions.append(f"u.{field} = %({field})s")
+            params[field] = value
+    user_filter = ''.join(f"AND {condition} " for condition in conditions)
+
+    cur.execute(BULK_ASSIGN_SQL.format(user_filter=user_filter), params)
+    users_matched, created, progress_created, missing_course_ids, missing_user_ids = cur.fetchone()
+    courses_found = len(course_ids) - len(missing_course_ids)
+    return {
+        'created': created,
+        'skipped': users_matched * courses_found - created,
+        'progressCreated': progress_created,
+        'usersMatched': users_matched,
+        'coursesMatched': courses_found,
+        'missingCourseIds': sorted(missing_course_ids),
+        'missingUserIds': sorted(missing_user_ids),
+    }
+
 def format_assignment_response(assignment_row: tuple) -> Dict[str, Any]:
     return {
         'id': assignment_row[0],
@@ -52,12 +132,15 @@ def format_assignment_response(assignment_row: tuple) -> Dict[str, Any]:
         'notes': assignment_row[7],
     }
 
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Назначение курсов студентам (только админ)
     POST - назначить курс студенту
+    POST ?action=bulk - назначить курсы списку пользователей или отделу / роли / должности
     GET ?userId=x - все назначения студента
     GET ?courseId=x - все назначения курса
+    GET ?limit=n&cursor=c - постранично (фильтры userId, courseId, status)
     DELETE ?courseId=x&userId=x - отменить назначение
     DELETE ?id=x - удалить назначение по ID
     '''
@@ -79,6 +162,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     headers = event.get('headers', {})
     query_params = event.get('queryStringParameters', {}) or {}
     assignment_id = query_params.get('id')
+    action = query_params.get('action')
     user_id_param = query_params.get('userId')
     course_id_param = query_params.get('courseId')
     
@@ -101,6 +185,55 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         except ValueError:
             pass
     
+    if method == 'GET' and (wants_page(query_params) or query_params.get('status')):
+        # Постраничный режим и фильтр по статусу: keyset по id (новые назначения первыми)
+        try:
+            limit, after = parse_page(query_params, key_size=1) if wants_page(query_params) else (None, None)
+            conditions, params = [], []
+            if user_id_param:
+                conditions.append("user_id = %s")
+                params.append(int(user_id_param))
+            if course_id_param:
+                conditions.append("course_id = %s")
+                params.append(int(course_id_param))
+            if query_params.get('status'):
+                conditions.append("status = %s")
+                params.append(query_params['status'])
+            if after:
+                conditions.append("id < %s")
+                params.append(int(after[0]))
+        except (ValueError, TypeError) as e:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        where = ("WHERE " + " AND ".join(conditions) + " ") if conditions else ""
+        if limit is None:
+            cur.execute(ASSIGNMENT_COLUMNS + where + "ORDER BY assigned_at DESC", params)
+            response_data = {'assignments': [format_assignment_response(a) for a in cur.fetchall()]}
+        else:
+            cur.execute(ASSIGNMENT_COLUMNS + where + "ORDER BY id DESC LIMIT %s", params + [limit + 1])
+            assignments, next_cursor = split_page(cur.fetchall(), limit, key=lambda row: [row[0]])
+            response_data = {
+                'assignments': [format_assignment_response(a) for a in assignments],
+                'nextCursor': next_cursor
+            }
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(response_data, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'GET':
         # GET без параметров - все assignments (только для админа)
         if not user_id_param and not course_id_int:
@@ -161,6 +294,49 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
     
+    if method == 'POST' and action == 'bulk':
+        try:
+            body_data = json.loads(event.get('body') or '{}')
+            bulk_req = BulkAssignRequest(**body_data)
+        except Exception as e:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Некорректные данные: {str(e)}'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        if not (bulk_req.userIds or bulk_req.department or bulk_req.role or bulk_req.position):
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Укажите userIds или фильтр department / role / position'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        result = bulk_assign(cur, bulk_req, int(payload['user_id']))
+        conn.commit()
+        
+        log_action('info', 'assignment.bulk',
+                  f"Массовое назначение курсов {bulk_req.courseIds}: создано {result['created']}, пропущено {result['skipped']}",
+                  user_id=payload.get('user_id'),
+                  details={**result, 'courseIds': bulk_req.courseIds, 'department': bulk_req.department,
+                           'role': bulk_req.role, 'position': bulk_req.position})
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(result, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
         assign_req = AssignCourseRequest(**body_data)
@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import psycopg2
 import bcrypt
 import jwt
@@ -7,27 +8,9 @@ from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, EmailStr, Field, ValidationError
 
-def log_action(conn, level: str, action: str, message: str, user_id: Optional[int] = None, 
-               ip_address: Optional[str] = None, user_agent: Optional[str] = None, 
-               details: Optional[Dict[str, Any]] = None) -> None:
-    try:
-        with conn.cursor() as cur:
-            cur.execute('''
-                INSERT INTO system_logs (level, action, message, user_id, ip_address, user_agent, details)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (level, action, message, user_id, ip_address, user_agent, json.dumps(details) if details else None))
-            conn.commit()
-    except Exception as e:
-        print(f"[WARNING] Failed to create log: {e}")
-
-def get_client_ip(event: Dict[str, Any]) -> Optional[str]:
-    request_context = event.get('requestContext', {})
-    identity = request_context.get('identity', {})
-    return identity.get('sourceIp')
-
-def get_user_agent(event: Dict[str, Any]) -> Optional[str]:
-    headers = event.get('headers', {})
-    return headers.get('User-Agent') or headers.get('user-agent')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.logger import log_action, get_client_ip, get_user_agent
 
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
@@ -50,10 +33,6 @@ class UserResponse(BaseModel):
     registrationDate: str
     lastActive: str
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
-
 def create_jwt_token(user_id: int, email: str, role: str) -> str:
     payload = {
         'user_id': user_id,
@@ -87,6 +66,7 @@ def format_user_response(user_row: tuple) -> Dict[str, Any]:
         'lastActive': user_row[10].isoformat() if user_row[10] else None,
     }
 
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Аутентификация пользователей: вход, выход, проверка токена
@@ -113,7 +93,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     if method == 'POST' and action == 'login':
         body_data = json.loads(event.get('body', '{}'))
-        print(f"[DEBUG] Login attempt - body: {body_data}")
         login_req = LoginRequest(**body_data)
         
         conn = get_db_connection()
@@ -128,9 +107,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         user = cur.fetchone()
         
         if not user:
-            print(f"[DEBUG] User not found: {login_req.email}")
             log_action(
-                conn, 'warning', 'user.failed_login',
+                'warning', 'user.failed_login',
                 f'Неудачная попытка входа: пользователь не найден',
                 ip_address=get_client_ip(event),
                 user_agent=get_user_agent(event),
@@ -145,12 +123,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        print(f"[DEBUG] User found: {user[1]}, is_active: {user[8]}")
-        
         if not user[8]:
-            print(f"[DEBUG] User account disabled: {user[1]}")
             log_action(
-                conn, 'warning', 'user.failed_login',
+                'warning', 'user.failed_login',
                 f'Попытка входа в отключенную учетную запись: {user[2]}',
                 user_id=user[0],
                 ip_address=get_client_ip(event),
@@ -167,21 +142,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         password_hash = user[11]
-        print(f"[DEBUG] Checking password for: {user[1]}")
-        print(f"[DEBUG] Password hash from DB: {password_hash[:20]}...")
-        print(f"[DEBUG] Password to check: {login_req.password}")
-        
         try:
             password_match = bcrypt.checkpw(login_req.password.encode('utf-8'), password_hash.encode('utf-8'))
-            print(f"[DEBUG] Password match result: {password_match}")
         except Exception as e:
-            print(f"[DEBUG] Password check exception: {e}")
+            print(f"[WARNING] Password check failed: {e}")
             password_match = False
         
         if not password_match:
-            print(f"[DEBUG] Password check failed for: {user[1]}")
             log_action(
-                conn, 'warning', 'user.failed_login',
+                'warning', 'user.failed_login',
                 f'Неверный пароль для пользователя: {user[2]}',
                 user_id=user[0],
                 ip_address=get_client_ip(event),
@@ -197,8 +166,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        print(f"[DEBUG] Login successful for user: {user[1]}")
-        
         cur.execute(
             "UPDATE users_v2 SET last_active = %s WHERE id = %s",
             (datetime.utcnow(), user[0])
@@ -206,7 +173,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         conn.commit()
         
         log_action(
-            conn, 'success', 'user.login',
+            'success', 'user.login',
             f'Пользователь {user[2]} успешно вошел в систему',
             user_id=user[0],
             ip_address=get_client_ip(event),
@@ -0,0 +1,167 @@
+'''
+Бенчмарк каталога курсов студента (GET /courses для роли student)
+Сравнивает старую схему (4 последовательных запроса + коррелированные COUNT)
+с одним запросом fetch_student_catalog из backend/courses/index.py.
+
+Данные генерируются во временной схеме bench_catalog, которая удаляется в конце,
+поэтому рабочие таблицы не затрагиваются.
+
+Запуск:
+    DATABASE_URL=postgresql://... python backend/benchmarks/catalog_bench.py \
+        --courses 1000 --assignments 50000 --users 5000 --iterations 200
+'''
+import os
+import sys
+import time
+import random
+import argparse
+import importlib.util
+import statistics
+import psycopg2
+from typing import List, Callable
+
+BENCH_SCHEMA = 'bench_catalog'
+
+def load_courses_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'courses', 'index.py')
+    spec = importlib.util.spec_from_file_location('courses_index', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def seed(conn, courses: int, users: int, assignments: int, lessons_per_course: int) -> None:
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    cur.execute(f"SET search_path TO {BENCH_SCHEMA}")
+    cur.execute(
+        "CREATE TABLE courses_v2 (id SERIAL PRIMARY KEY, title VARCHAR(255) NOT NULL, description TEXT, "
+        "duration INTEGER DEFAULT 0, lessons_count INTEGER DEFAULT 0, category VARCHAR(100), image TEXT, "
+        "published BOOLEAN DEFAULT false, pass_score INTEGER DEFAULT 70, level VARCHAR(50), instructor VARCHAR(255), "
+        "status VARCHAR(50) DEFAULT 'draft', start_date TIMESTAMP, end_date TIMESTAMP, "
+        "access_type VARCHAR(20) DEFAULT 'closed', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    cur.execute("CREATE TABLE lessons_v2 (id SERIAL PRIMARY KEY, course_id INTEGER NOT NULL, title VARCHAR(255) NOT NULL)")
+    cur.execute(
+        "CREATE TABLE course_assignments_v2 (id SERIAL PRIMARY KEY, course_id INTEGER NOT NULL, "
+        "user_id INTEGER NOT NULL, UNIQUE(course_id, user_id))"
+    )
+    cur.execute(
+        "CREATE TABLE course_progress_v2 (id SERIAL PRIMARY KEY, course_id INTEGER NOT NULL, "
+        "user_id INTEGER NOT NULL, UNIQUE(course_id, user_id))"
+    )
+
+    rnd = random.Random(42)
+    # 60% закрытых, 30% открытых, 10% архивных
+    cur.execute(
+        "INSERT INTO courses_v2 (title, published, status, access_type) "
+        "SELECT 'Курс ' || g, true, "
+        "CASE WHEN g %% 10 = 0 THEN 'archived' ELSE 'published' END, "
+        "CASE WHEN g %% 10 IN (1, 2, 3) THEN 'open' ELSE 'closed' END "
+        "FROM generate_series(1, %s) g",
+        (courses,)
+    )
+    cur.execute(
+        "INSERT INTO lessons_v2 (course_id, title) "
+        "SELECT c, 'Урок ' || l FROM generate_series(1, %s) c, generate_series(1, %s) l ORDER BY c, l",
+        (courses, lessons_per_course)
+    )
+    pairs = set()
+    while len(pairs) < assignments:
+        pairs.add((rnd.randint(1, courses), rnd.randint(1, users)))
+    rows = list(pairs)
+    args = ','.join(cur.mogrify('(%s,%s)', row).decode() for row in rows)
+    cur.execute(f"INSERT INTO course_assignments_v2 (course_id, user_id) VALUES {args}")
+    # Прогресс есть примерно у половины назначений
+    args = ','.join(cur.mogrify('(%s,%s)', row).decode() for row in rows[::2])
+    cur.execute(f"INSERT INTO course_progress_v2 (course_id, user_id) VALUES {args}")
+    cur.execute("CREATE INDEX ON lessons_v2(course_id)")
+    cur.execute("CREATE INDEX ON course_assignments_v2(user_id)")
+    cur.execute("CREATE INDEX ON course_progress_v2(user_id)")
+    conn.commit()
+    # VACUUM нельзя выполнять внутри транзакции
+    conn.autocommit = True
+    cur.execute("VACUUM ANALYZE")
+    conn.autocommit = False
+    cur.close()
+
+def legacy_catalog(cur, user_id: int) -> List[tuple]:
+    '''Старая реализация из courses/index.py (до объединения в один запрос)'''
+    columns = (
+        "SELECT c.id, c.title, c.description, c.duration, "
+        "(SELECT COUNT(*) FROM lessons_v2 WHERE course_id = c.id) as lessons_count, "
+        "c.category, c.image, c.published, c.pass_score, c.level, c.instructor, "
+        "c.status, c.start_date, c.end_date, c.access_type FROM courses_v2 c "
+    )
+    cur.execute(columns + "WHERE c.published = true AND c.access_type = 'open' AND c.status != 'archived'")
+    open_courses = list(cur.fetchall())
+    cur.execute("SELECT course_id FROM course_assignments_v2 WHERE user_id = %s", (user_id,))
+    assigned_course_ids = [row[0] for row in cur.fetchall()]
+    closed_courses = []
+    if assigned_course_ids:
+        placeholders = ','.join(str(cid) for cid in assigned_course_ids)
+        cur.execute(columns + f"WHERE c.published = true AND c.access_type = 'closed' AND c.status != 'archived' AND c.id IN ({placeholders})")
+        closed_courses = list(cur.fetchall())
+    cur.execute("SELECT DISTINCT cp.course_id FROM course_progress_v2 cp WHERE cp.user_id = %s", (user_id,))
+    progress_course_ids = [row[0] for row in cur.fetchall()]
+    archived_courses = []
+    if progress_course_ids:
+        placeholders = ','.join(str(cid) for cid in progress_course_ids)
+        cur.execute(columns + f"WHERE c.status = 'archived' AND c.id IN ({placeholders})")
+        archived_courses = list(cur.fetchall())
+    courses = open_courses + closed_courses + archived_courses
+    courses.sort(key=lambda x: x[0], reverse=True)
+    return courses
+
+def measure(conn, fetch: Callable, user_ids: List[int]) -> List[float]:
+    cur = conn.cursor()
+    timings = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        fetch(cur, user_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    cur.close()
+    return timings
+
+def report(name: str, timings: List[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<12} p50={statistics.median(timings):7.2f}ms  p95={p95:7.2f}ms  mean={statistics.mean(timings):7.2f}ms")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк каталога курсов студента')
+    parser.add_argument('--courses', type=int, default=1000)
+    parser.add_argument('--assignments', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--lessons-per-course', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    courses_module = load_courses_module()
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        print(f"Seeding {args.courses} courses, {args.assignments} assignments...")
+        seed(conn, args.courses, args.users, args.assignments, args.lessons_per_course)
+
+        rnd = random.Random(7)
+        user_ids = [rnd.randint(1, args.users) for _ in range(args.iterations)]
+
+        # Результаты обеих реализаций должны совпадать
+        cur = conn.cursor()
+        for user_id in user_ids[:20]:
+            if legacy_catalog(cur, user_id) != courses_module.fetch_student_catalog(cur, user_id):
+                print(f"[ERROR] Catalog mismatch for user {user_id}")
+                sys.exit(1)
+        cur.close()
+
+        report('legacy', measure(conn, legacy_catalog, user_ids))
+        report('single', measure(conn, courses_module.fetch_student_catalog, user_ids))
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
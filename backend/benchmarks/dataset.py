@@ -0,0 +1,232 @@
+'''
+Генератор синтетического набора данных для бенчмарков функций (схема v2)
+По умолчанию (scale=1): 20k users_v2, 500 courses_v2, 20k lessons_v2,
+~1M course_progress_v2 / course_assignments_v2, 2M test_results.
+
+ВНИМАНИЕ: seed() очищает (TRUNCATE) рабочие таблицы схемы v2, поэтому
+запускать его можно только на отдельной базе для бенчмарков с примененными миграциями.
+
+Идентификаторы детерминированы (TRUNCATE ... RESTART IDENTITY и упорядоченные вставки),
+поэтому DatasetShape может выбирать существующие id без запросов к базе:
+    пользователь 1 - admin, 2..users - студенты
+    уроки курса c: (c-1)*lessons_per_course + 1 .. c*lessons_per_course, каждый 10-й - тест
+    тест j курса c: (c-1)*tests_per_course + j, вопросы теста t: (t-1)*questions_per_test + 1 ..
+    награда курса c имеет id c
+'''
+import random
+import bcrypt
+from typing import Dict, Any, List
+
+BENCH_PASSWORD = 'bench-password'
+
+SEEDED_TABLES = [
+    'system_logs', 'user_rewards_v2', 'test_attempts_v2', 'test_results', 'lesson_completions',
+    'course_progress_v2', 'course_assignments_v2', 'questions_v2', 'tests_v2',
+    'lesson_materials_v2', 'lessons_v2', 'rewards_v2', 'courses_v2', 'users_v2',
+]
+
+class DatasetShape:
+    '''
+    Размеры набора данных и выбор случайных существующих сущностей
+    Args:
+        scale - множитель размеров (1.0 - полный набор, 0.01 - для CI)
+    '''
+    def __init__(self, scale: float = 1.0, lessons_per_course: int = 40, courses_per_user: int = 50,
+                 questions_per_test: int = 10):
+        self.users = max(int(20000 * scale), 10)
+        self.courses = max(int(500 * scale), 2)
+        self.lessons_per_course = max(lessons_per_course - lessons_per_course % 10, 10)
+        self.tests_per_course = self.lessons_per_course // 10
+        self.questions_per_test = questions_per_test
+        self.courses_per_user = min(courses_per_user, self.courses)
+        self.test_results = max(int(2000000 * scale), 100)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'users': self.users,
+            'courses': self.courses,
+            'lessons': self.courses * self.lessons_per_course,
+            'progress': (self.users - 1) * self.courses_per_user,
+            'testResults': self.test_results,
+        }
+
+    def user_course(self, user_id: int, k: int) -> int:
+        '''k-й курс, назначенный пользователю (та же формула, что и в seed)'''
+        return (user_id * 7 + k * 13) % self.courses + 1
+
+    def sample(self, rnd: random.Random) -> Dict[str, Any]:
+        '''Случайный студент и связанные с ним курс, урок и тест'''
+        user_id = rnd.randint(2, self.users)
+        course_id = self.user_course(user_id, rnd.randint(1, self.courses_per_user))
+        first_lesson = (course_id - 1) * self.lessons_per_course
+        test_no = rnd.randint(1, self.tests_per_course)
+        test_id = (course_id - 1) * self.tests_per_course + test_no
+        first_question = (test_id - 1) * self.questions_per_test
+        return {
+            'admin_id': 1,
+            'user_id': user_id,
+            'user_email': f'user{user_id}@bench-corp.ru',
+            'password': BENCH_PASSWORD,
+            'course_id': course_id,
+            'lesson_id': first_lesson + rnd.randint(1, self.lessons_per_course),
+            'test_lesson_id': first_lesson + test_no * 10,
+            'test_id': test_id,
+            'reward_id': course_id,
+            # Правильный ответ на вопрос q - индекс q % 4, часть ответов намеренно неверна
+            'answers': {
+                str(q): (q % 4 if rnd.random() < 0.8 else (q + 1) % 4)
+                for q in range(first_question + 1, first_question + self.questions_per_test + 1)
+            },
+        }
+
+def existing_tables(cur, names: List[str]) -> List[str]:
+    cur.execute("SELECT name FROM unnest(%s::text[]) name WHERE to_regclass(name) IS NOT NULL", (names,))
+    found = {row[0] for row in cur.fetchall()}
+    return [name for name in names if name in found]
+
+def seed(conn, shape: DatasetShape, log=print) -> None:
+    '''Очищает таблицы v2 и заполняет их синтетическими данными'''
+    cur = conn.cursor()
+    tables = existing_tables(cur, SEEDED_TABLES)
+    cur.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE")
+    params = {
+        'users': shape.users,
+        'courses': shape.courses,
+        'lessons': shape.lessons_per_course,
+        'tests': shape.tests_per_course,
+        'questions': shape.questions_per_test,
+        'per_user': shape.courses_per_user,
+        'results': shape.test_results,
+        'password_hash': bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8'),
+    }
+
+    log(f"users_v2: {shape.users}")
+    cur.execute(
+        "INSERT INTO users_v2 (email, name, password_hash, role, position, department, is_active) "
+        "SELECT 'user' || g || '@bench-corp.ru', 'Сотрудник ' || g, %(password_hash)s, "
+        "CASE WHEN g = 1 THEN 'admin' ELSE 'student' END, 'Должность ' || (g %% 20), 'Отдел ' || (g %% 25), true "
+        "FROM generate_series(1, %(users)s) g ORDER BY g",
+        params
+    )
+
+    log(f"courses_v2: {shape.courses}, rewards_v2: {shape.courses}")
+    cur.execute(
+        "INSERT INTO courses_v2 (title, description, duration, lessons_count, category, published, pass_score, "
+        "level, instructor, status, access_type) "
+        "SELECT 'Курс ' || g, 'Описание курса ' || g, 60, %(lessons)s, 'Категория ' || (g %% 8), true, 70, "
+        "'beginner', 'Преподаватель ' || (g %% 30), "
+        "CASE WHEN g %% 50 = 0 THEN 'archived' ELSE 'published' END, "
+        "CASE WHEN g %% 3 = 0 THEN 'open' ELSE 'closed' END "
+        "FROM generate_series(1, %(courses)s) g ORDER BY g",
+        params
+    )
+    cur.execute(
+        "INSERT INTO rewards_v2 (name, icon, color, course_id, description) "
+        "SELECT 'Награда ' || g, 'Award', '#f59e0b', g, 'За завершение курса ' || g "
+        "FROM generate_series(1, %(courses)s) g ORDER BY g",
+        params
+    )
+
+    log(f"lessons_v2: {shape.courses * shape.lessons_per_course}")
+    cur.execute(
+        "INSERT INTO lessons_v2 (course_id, title, content, type, \"order\", duration, description, test_id) "
+        "SELECT c, 'Урок ' || i, repeat('Текст урока. ', 50), "
+        "CASE WHEN i %% 10 = 0 THEN 'test' ELSE 'text' END, i, 10, 'Описание урока ' || i, "
+        "CASE WHEN i %% 10 = 0 THEN (c - 1) * %(tests)s + i / 10 END "
+        "FROM generate_series(1, %(courses)s) c, generate_series(1, %(lessons)s) i ORDER BY c, i",
+        params
+    )
+    cur.execute(
+        "INSERT INTO lesson_materials_v2 (lesson_id, title, type, url) "
+        "SELECT l, 'Материал ' || l, 'pdf', 'https://cdn.poehali.dev/projects/bench/bucket/documents/' || l || '.pdf' "
+        "FROM generate_series(1, %(courses)s * %(lessons)s) l WHERE l %% 4 = 0 ORDER BY l",
+        params
+    )
+
+    log(f"tests_v2: {shape.courses * shape.tests_per_course}, "
+        f"questions_v2: {shape.courses * shape.tests_per_course * shape.questions_per_test}")
+    cur.execute(
+        "INSERT INTO tests_v2 (course_id, lesson_id, title, pass_score, time_limit, attempts, questions_count, status) "
+        "SELECT c, (c - 1) * %(lessons)s + j * 10, 'Тест ' || j, 70, 30, 3, %(questions)s, 'published' "
+        "FROM generate_series(1, %(courses)s) c, generate_series(1, %(tests)s) j ORDER BY c, j",
+        params
+    )
+    cur.execute(
+        "INSERT INTO questions_v2 (test_id, type, text, options, correct_answer, points, \"order\") "
+        "SELECT t, 'single', 'Вопрос ' || q, '[\"A\", \"B\", \"C\", \"D\"]'::jsonb, "
+        "to_jsonb(((t - 1) * %(questions)s + q) %% 4), 1, q "
+        "FROM generate_series(1, %(courses)s * %(tests)s) t, generate_series(1, %(questions)s) q ORDER BY t, q",
+        params
+    )
+
+    log(f"course_assignments_v2 / course_progress_v2: {(shape.users - 1) * shape.courses_per_user}")
+    pairs = (
+        "SELECT u, (u * 7 + k * 13) %% %(courses)s + 1 AS c, (u * 31 + k * 17) %% 10 AS h "
+        "FROM generate_series(2, %(users)s) u, generate_series(1, %(per_user)s) k"
+    )
+    cur.execute(
+        "INSERT INTO course_assignments_v2 (course_id, user_id, assigned_by, status) "
+        f"SELECT c, u, 1, 'assigned' FROM ({pairs}) p ORDER BY u, c ON CONFLICT DO NOTHING",
+        params
+    )
+    # 30% не начали, 50% прошли несколько уроков, 20% завершили курс
+    cur.execute(
+        "INSERT INTO course_progress_v2 (course_id, user_id, completed_lessons, total_lessons, test_score, "
+        "completed, completed_lesson_ids, last_accessed_lesson, completed_at, earned_rewards) "
+        "SELECT c, u, n, %(lessons)s, CASE WHEN n = %(lessons)s THEN 85 ELSE 0 END, n = %(lessons)s, "
+        "(SELECT COALESCE(jsonb_agg(((c - 1) * %(lessons)s + i)::text ORDER BY i), '[]'::jsonb) "
+        " FROM generate_series(1, n) i), "
+        "CASE WHEN n > 0 THEN (c - 1) * %(lessons)s + n END, "
+        "CASE WHEN n = %(lessons)s THEN NOW() END, "
+        "CASE WHEN n = %(lessons)s THEN jsonb_build_array(c) ELSE '[]'::jsonb END "
+        f"FROM (SELECT u, c, CASE WHEN h < 3 THEN 0 WHEN h < 8 THEN h ELSE %(lessons)s END AS n FROM ({pairs}) p) s "
+        "ORDER BY u, c ON CONFLICT DO NOTHING",
+        params
+    )
+    if 'lesson_completions' in tables:
+        cur.execute(
+            "INSERT INTO lesson_completions (user_id, course_id, lesson_id, completed_at) "
+            "SELECT cp.user_id, cp.course_id, lesson_id::int, cp.updated_at "
+            "FROM course_progress_v2 cp, jsonb_array_elements_text(cp.completed_lesson_ids) lesson_id "
+            "ON CONFLICT DO NOTHING"
+        )
+
+    log(f"test_results: {shape.test_results}")
+    cur.execute("SELECT COUNT(*) FROM course_progress_v2")
+    params['progress'] = cur.fetchone()[0]
+    # Ответы зависят от "способности" попытки и трудности вопроса, чтобы анализ заданий
+    # и перепроверка работали на правдоподобных данных; score согласован с ответами
+    cur.execute(
+        "INSERT INTO test_results (user_id, test_id, lesson_id, course_id, score, earned_points, total_points, "
+        "passed, answers, results, completed_at) "
+        "SELECT cp.user_id, t.test_id, "
+        "((cp.course_id - 1) * %(lessons)s + r.j * 10)::text, cp.course_id, "
+        "a.earned * 100 / %(questions)s, a.earned, %(questions)s, a.earned * 100 / %(questions)s >= 70, "
+        "a.answers, a.results, NOW() - make_interval(secs => r.g) "
+        "FROM (SELECT g, g %% %(progress)s + 1 AS progress_id, (g / %(progress)s) %% %(tests)s + 1 AS j, "
+        "      (g * 37) %% 101 AS ability FROM generate_series(1, %(results)s) g) r "
+        "JOIN course_progress_v2 cp ON cp.id = r.progress_id "
+        "CROSS JOIN LATERAL (SELECT (cp.course_id - 1) * %(tests)s + r.j AS test_id) t "
+        "CROSS JOIN LATERAL ("
+        "    SELECT jsonb_object_agg(q.qid::text, CASE WHEN q.ok THEN q.qid %% 4 ELSE (q.qid + 1 + (r.g + q.q) %% 3) %% 4 END) AS answers, "
+        "           jsonb_agg(jsonb_build_object('questionId', q.qid::text, 'isCorrect', q.ok, 'points', q.ok::int) ORDER BY q.q) AS results, "
+        "           SUM(q.ok::int)::int AS earned "
+        "    FROM (SELECT n AS q, (t.test_id - 1) * %(questions)s + n AS qid, "
+        "                 (r.g * 31 + n * 53) %% 100 < r.ability + (n * 7) %% 31 - 15 AS ok "
+        "          FROM generate_series(1, %(questions)s) n) q"
+        ") a "
+        "ORDER BY r.g",
+        params
+    )
+    cur.execute(
+        "INSERT INTO test_attempts_v2 (user_id, test_id, lesson_id, course_id, attempts_used, max_attempts, best_score) "
+        "SELECT user_id, MIN(test_id), lesson_id, MIN(course_id), LEAST(COUNT(*), 3), 3, MAX(score) "
+        "FROM test_results GROUP BY user_id, lesson_id ON CONFLICT DO NOTHING"
+    )
+    conn.commit()
+
+    log("VACUUM ANALYZE")
+    conn.autocommit = True
+    cur.execute("VACUUM ANALYZE")
+    conn.autocommit = False
+    cur.close()
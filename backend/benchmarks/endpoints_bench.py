@@ -0,0 +1,249 @@
+'''
+Бенчмарк задержек по эндпоинтам: вызывает handler функций в процессе
+со смесью типовых запросов из scenarios.json на синтетическом наборе данных (dataset.py)
+
+Для каждого сценария выводит p50/p95/p99, среднее число SQL запросов на вызов
+и пиковую память Python (tracemalloc, отдельный проход).
+Результат можно сохранить как JSON baseline и сравнивать с ним следующие запуски.
+
+Работает только с отдельной базой BENCH_DATABASE_URL (с примененными миграциями),
+флаг --seed полностью перезаписывает в ней таблицы v2.
+
+Запуск:
+    BENCH_DATABASE_URL=postgresql://... python backend/benchmarks/endpoints_bench.py --seed --scale 1
+    BENCH_DATABASE_URL=postgresql://... python backend/benchmarks/endpoints_bench.py \
+        --iterations 2000 --save-baseline baseline.json
+    BENCH_DATABASE_URL=postgresql://... python backend/benchmarks/endpoints_bench.py \
+        --iterations 2000 --baseline baseline.json --max-regression 20
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import contextlib
+import statistics
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+import jwt
+import psycopg2
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, '..'))
+sys.path.append(os.path.join(BENCH_DIR, '..', 'local'))
+
+from dataset import DatasetShape, seed
+from server import build_event, load_handler, InvocationContext
+
+SCENARIOS_PATH = os.path.join(BENCH_DIR, 'scenarios.json')
+JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
+METRICS = ('p50', 'p95', 'p99')
+
+def make_token(user_id: int, role: str) -> str:
+    payload = {
+        'user_id': user_id,
+        'email': f'user{user_id}@bench-corp.ru',
+        'role': role,
+        'exp': datetime.utcnow() + timedelta(hours=24),
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+
+def fill(template: Any, values: Dict[str, Any]) -> Any:
+    '''Подставляет значения вместо "{name}"; плейсхолдер объекта (например {answers}) подставляется как есть'''
+    if isinstance(template, dict):
+        return {key: fill(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [fill(value, values) for value in template]
+    if isinstance(template, str):
+        value = values.get(template[1:-1]) if template.startswith('{') and template.endswith('}') else None
+        if isinstance(value, (dict, list)):
+            return value
+        return template.format(**values)
+    return template
+
+def build_request(scenario: Dict[str, Any], values: Dict[str, Any]) -> Dict[str, Any]:
+    headers = {'Content-Type': 'application/json', 'User-Agent': 'endpoints-bench'}
+    role = scenario.get('role')
+    if role:
+        user_id = values['admin_id'] if role == 'admin' else values['user_id']
+        headers['X-Auth-Token'] = make_token(user_id, role)
+    query = '&'.join(f'{key}={fill(value, values)}' for key, value in scenario.get('query', {}).items())
+    body = json.dumps(fill(scenario['body'], values)).encode('utf-8') if 'body' in scenario else b''
+    return build_event(scenario['method'], '/', query, headers, body, '127.0.0.1')
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    index = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+class EndpointBench:
+    '''
+    Args:
+        shape - размеры набора данных (для выбора существующих id)
+        scenarios - описания запросов из scenarios.json
+    '''
+    def __init__(self, shape: DatasetShape, scenarios: List[Dict[str, Any]], rnd_seed: int = 7):
+        from common.db import get_query_count, reset_query_count
+        self.get_query_count = get_query_count
+        self.reset_query_count = reset_query_count
+        self.shape = shape
+        self.scenarios = {scenario['name']: scenario for scenario in scenarios}
+        self.handlers = {
+            name: load_handler(name) for name in sorted({scenario['function'] for scenario in scenarios})
+        }
+        self.rnd = random.Random(rnd_seed)
+        self.devnull = open(os.devnull, 'w')
+
+    def call(self, name: str) -> Dict[str, Any]:
+        scenario = self.scenarios[name]
+        event = build_request(scenario, self.shape.sample(self.rnd))
+        self.reset_query_count()
+        started = time.perf_counter()
+        # Отладочный вывод функций не должен попадать в отчет
+        with contextlib.redirect_stdout(self.devnull):
+            response = self.handlers[scenario['function']](event, InvocationContext(scenario['function']))
+        elapsed = (time.perf_counter() - started) * 1000
+        return {'ms': elapsed, 'queries': self.get_query_count(), 'status': response.get('statusCode', 200)}
+
+    def plan(self, iterations: int) -> List[str]:
+        '''Перемешанная очередь вызовов пропорционально весам сценариев'''
+        total_weight = sum(scenario.get('weight', 1) for scenario in self.scenarios.values())
+        queue = []
+        for name, scenario in self.scenarios.items():
+            queue.extend([name] * max(1, round(iterations * scenario.get('weight', 1) / total_weight)))
+        self.rnd.shuffle(queue)
+        return queue
+
+    def run(self, iterations: int, warmup: int, memory_samples: int) -> Dict[str, Dict[str, Any]]:
+        for name in self.scenarios:
+            for _ in range(warmup):
+                self.call(name)
+
+        samples: Dict[str, List[Dict[str, Any]]] = {name: [] for name in self.scenarios}
+        for name in self.plan(iterations):
+            samples[name].append(self.call(name))
+
+        # Память меряем отдельно: tracemalloc заметно замедляет вызовы
+        peaks: Dict[str, float] = {}
+        tracemalloc.start()
+        for name in self.scenarios:
+            peak = 0
+            for _ in range(memory_samples):
+                tracemalloc.reset_peak()
+                self.call(name)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            peaks[name] = peak / 1024
+        tracemalloc.stop()
+
+        report = {}
+        for name, results in samples.items():
+            timings = sorted(result['ms'] for result in results)
+            report[name] = {
+                'requests': len(results),
+                'p50': round(percentile(timings, 0.50), 3),
+                'p95': round(percentile(timings, 0.95), 3),
+                'p99': round(percentile(timings, 0.99), 3),
+                'mean': round(statistics.mean(timings), 3),
+                'queries': round(statistics.mean(result['queries'] for result in results), 2),
+                'maxQueries': max(result['queries'] for result in results),
+                'errors': sum(1 for result in results if result['status'] >= 400),
+                'peakKb': round(peaks[name], 1),
+            }
+        return report
+
+def print_report(report: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None) -> None:
+    header = f"{'endpoint':<26}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KB':>10}{'err':>5}"
+    if baseline:
+        header += f"{'p95 vs base':>13}"
+    print(header)
+    for name, row in report.items():
+        line = (f"{name:<26}{row['requests']:>6}{row['p50']:>10.2f}{row['p95']:>10.2f}{row['p99']:>10.2f}"
+                f"{row['queries']:>9.1f}{row['peakKb']:>10.1f}{row['errors']:>5}")
+        base_row = (baseline or {}).get('endpoints', {}).get(name)
+        if base_row and base_row.get('p95'):
+            line += f"{(row['p95'] / base_row['p95'] - 1) * 100:>+12.1f}%"
+        print(line)
+
+def compare(report: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    '''Список регрессий: рост p50/p95/p99 больше max_regression % или рост числа запросов'''
+    regressions = []
+    for name, row in report.items():
+        base_row = baseline.get('endpoints', {}).get(name)
+        if not base_row:
+            continue
+        for metric in METRICS:
+            if base_row.get(metric) and row[metric] > base_row[metric] * (1 + max_regression / 100):
+                regressions.append(f"{name}: {metric} {base_row[metric]:.2f}ms -> {row[metric]:.2f}ms")
+        if row['queries'] > base_row.get('queries', row['queries']):
+            regressions.append(f"{name}: queries {base_row['queries']} -> {row['queries']}")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк задержек по эндпоинтам')
+    parser.add_argument('--scale', type=float, default=1.0, help='Множитель размера набора данных')
+    parser.add_argument('--seed', action='store_true', help='Пересоздать набор данных перед запуском')
+    parser.add_argument('--iterations', type=int, default=2000, help='Всего вызовов (делятся по весам)')
+    parser.add_argument('--warmup', type=int, default=3, help='Прогревочных вызовов на сценарий')
+    parser.add_argument('--memory-samples', type=int, default=5, help='Вызовов на сценарий для замера памяти')
+    parser.add_argument('--only', default='', help='Сценарии через запятую')
+    parser.add_argument('--scenarios', default=SCENARIOS_PATH)
+    parser.add_argument('--save-baseline', help='Сохранить результат в JSON')
+    parser.add_argument('--baseline', help='Сравнить с сохраненным JSON')
+    parser.add_argument('--max-regression', type=float, default=20.0, help='Допустимый рост задержки, %%')
+    args = parser.parse_args()
+
+    if 'BENCH_DATABASE_URL' not in os.environ:
+        print('[ERROR] BENCH_DATABASE_URL is not set (use a dedicated benchmark database)')
+        sys.exit(2)
+    os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+    shape = DatasetShape(args.scale)
+
+    if args.seed:
+        conn = psycopg2.connect(os.environ['BENCH_DATABASE_URL'])
+        try:
+            started = time.perf_counter()
+            seed(conn, shape)
+            print(f"Seeded in {time.perf_counter() - started:.1f}s: {shape.as_dict()}")
+        finally:
+            conn.close()
+
+    with open(args.scenarios, 'r', encoding='utf-8') as f:
+        scenarios = json.load(f)['scenarios']
+    only = {name for name in args.only.split(',') if name}
+    if only:
+        scenarios = [scenario for scenario in scenarios if scenario['name'] in only]
+
+    bench = EndpointBench(shape, scenarios)
+    report = bench.run(args.iterations, args.warmup, args.memory_samples)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'createdAt': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'dataset': shape.as_dict(),
+                'iterations': args.iterations,
+                'endpoints': report,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if baseline:
+        if baseline.get('dataset') != shape.as_dict():
+            print(f"[WARNING] Baseline dataset {baseline.get('dataset')} differs from {shape.as_dict()}")
+        regressions = compare(report, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"[REGRESSION] {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+'''
+Бенчмарк подготовленных операторов (common/prepared.py) для функций tests и test-attempts
+Сравнивает два режима на одном наборе данных:
+    plain    - DB_PREPARED_STATEMENTS=0, обычные параметризованные запросы (план строится на каждый вызов)
+    prepared - PREPARE один раз на соединение пула, затем EXECUTE
+
+Выводит:
+    время планирования каждого зарегистрированного оператора (EXPLAIN ANALYZE, медиана),
+    p50/p95 и пропускную способность (вызовов/сек) горячих путей GET и start/record
+
+Работает с отдельной базой BENCH_DATABASE_URL, заполненной dataset.py (endpoints_bench.py --seed).
+Записи, созданные start/record/check, остаются в базе, EXPLAIN ANALYZE откатывается.
+
+Запуск:
+    BENCH_DATABASE_URL=postgresql://... python backend/benchmarks/prepared_bench.py --iterations 2000
+'''
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+from typing import Dict, Any, List
+
+import psycopg2
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, '..'))
+
+from dataset import DatasetShape
+
+# Сценарии в формате scenarios.json: горячие пути, переведенные на подготовленные операторы
+SCENARIOS = [
+    {"name": "tests.get", "function": "tests", "method": "GET", "role": "student", "query": {"id": "{test_id}"}},
+    {"name": "tests.results", "function": "tests", "method": "GET", "role": "student",
+     "query": {"action": "results", "lessonId": "{test_lesson_id}"}},
+    {"name": "tests.check", "function": "tests", "method": "POST", "role": "student", "query": {"action": "check"},
+     "body": {"testId": "{test_id}", "lessonId": "{test_lesson_id}", "answers": "{answers}"}},
+    {"name": "test-attempts.get", "function": "test-attempts", "method": "GET", "role": "student",
+     "query": {"lessonId": "{test_lesson_id}"}},
+    {"name": "test-attempts.course", "function": "test-attempts", "method": "GET", "role": "student",
+     "query": {"courseId": "{course_id}"}},
+    {"name": "test-attempts.start", "function": "test-attempts", "method": "POST", "role": "student",
+     "query": {"action": "start"}, "body": {"lessonId": "{test_lesson_id}"}},
+    {"name": "test-attempts.record", "function": "test-attempts", "method": "POST", "role": "student",
+     "query": {"action": "record"},
+     "body": {"lessonId": "{test_lesson_id}", "courseId": "{course_id}", "testId": "{test_id}", "score": 80, "passed": True}},
+]
+
+def statement_values(sample: Dict[str, Any]) -> Dict[str, Any]:
+    '''Значения всех параметров зарегистрированных операторов для одного случайного пользователя'''
+    return {
+        'user_id': sample['user_id'],
+        'test_id': sample['test_id'],
+        'course_id': sample['course_id'],
+        'lesson_id': str(sample['test_lesson_id']),
+        'lesson_num': sample['test_lesson_id'],
+        'score': 80,
+        'earned_points': 8,
+        'total_points': 10,
+        'passed': True,
+        'answers': json.dumps(sample['answers']),
+        'results': '[]',
+    }
+
+def planning_ms(explain_rows: List[tuple]) -> float:
+    plan = explain_rows[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Planning Time']
+
+def measure_planning(conn, statements, shape: DatasetShape, rnd: random.Random, runs: int) -> Dict[str, Dict[str, float]]:
+    '''Медианное время планирования: обычный запрос против EXECUTE подготовленного оператора'''
+    report = {}
+    cur = conn.cursor()
+    for statement in statements:
+        plain, prepared = [], []
+        cur.execute(statement.prepare_sql)
+        for _ in range(runs):
+            values = statement_values(shape.sample(rnd))
+            cur.execute('SAVEPOINT bench')
+            cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + statement.sql, values)
+            plain.append(planning_ms(cur.fetchall()))
+            cur.execute('ROLLBACK TO SAVEPOINT bench')
+            cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + statement.execute_sql, statement.bind(values))
+            prepared.append(planning_ms(cur.fetchall()))
+            cur.execute('ROLLBACK TO SAVEPOINT bench')
+        conn.rollback()
+        cur.execute(f'DEALLOCATE {statement.name}')
+        report[statement.name] = {
+            'plain': round(statistics.median(plain), 4),
+            'prepared': round(statistics.median(prepared), 4),
+        }
+    cur.close()
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк подготовленных операторов tests / test-attempts')
+    parser.add_argument('--scale', type=float, default=1.0, help='Масштаб набора данных (как при --seed)')
+    parser.add_argument('--iterations', type=int, default=1000, help='Вызовов на режим')
+    parser.add_argument('--warmup', type=int, default=20, help='Прогревочных вызовов на сценарий')
+    parser.add_argument('--planning-runs', type=int, default=30, help='Замеров EXPLAIN на оператор')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('BENCH_DATABASE_URL')
+    if not dsn:
+        sys.exit('BENCH_DATABASE_URL не задан: бенчмарк нельзя запускать на рабочей базе')
+    os.environ['DATABASE_URL'] = dsn
+    os.environ.setdefault('DB_QUERY_LOG', '0')
+
+    from endpoints_bench import EndpointBench, print_report
+    from common import prepared
+
+    shape = DatasetShape(args.scale)
+    bench = EndpointBench(shape, SCENARIOS)
+    statements = [prepared.STATEMENTS[name] for name in sorted(prepared.STATEMENTS)]
+
+    conn = psycopg2.connect(dsn)
+    planning = measure_planning(conn, statements, shape, random.Random(11), args.planning_runs)
+    conn.close()
+    print(f"{'statement':<28}{'plan ms (plain)':>17}{'plan ms (prepared)':>20}")
+    for name, row in planning.items():
+        print(f"{name:<28}{row['plain']:>17.4f}{row['prepared']:>20.4f}")
+
+    for mode, enabled in (('plain', False), ('prepared', True)):
+        prepared.PREPARED_ENABLED = enabled
+        bench.rnd = random.Random(7)
+        report = bench.run(args.iterations, args.warmup, memory_samples=1)
+        calls = sum(row['requests'] for row in report.values())
+        busy_seconds = sum(row['requests'] * row['mean'] for row in report.values()) / 1000
+        print(f"\n{mode}: {calls / busy_seconds:.0f} вызовов/сек")
+        print_report(report)
+
+if __name__ == '__main__':
+    main()
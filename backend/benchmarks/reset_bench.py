@@ -0,0 +1,192 @@
+'''
+Бенчмарк сброса прогресса курса (POST /progress?action=reset, resetType=reset_tests)
+Сравнивает старую схему (UPDATE course_progress_v2 на каждого слушателя в цикле Python)
+с reset_course_progress из backend/progress/index.py (постоянное число запросов).
+
+Данные генерируются во временной схеме bench_reset, которая удаляется в конце;
+каждый прогон выполняется в транзакции и откатывается, поэтому обе реализации
+работают с одинаковыми данными. Результаты сверяются построчно.
+
+Запуск:
+    BENCH_DATABASE_URL=postgresql://... python backend/benchmarks/reset_bench.py --learners 10000 --runs 5
+'''
+import os
+import sys
+import time
+import argparse
+import importlib.util
+import statistics
+import psycopg2
+from typing import List, Callable, Tuple
+
+BENCH_SCHEMA = 'bench_reset'
+COURSE_ID = 1
+
+def load_progress_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'progress', 'index.py')
+    spec = importlib.util.spec_from_file_location('progress_index', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def seed(conn, learners: int, lessons: int) -> None:
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    cur.execute(f"SET search_path TO {BENCH_SCHEMA}")
+    cur.execute("CREATE TABLE lessons_v2 (id SERIAL PRIMARY KEY, course_id INTEGER NOT NULL, type VARCHAR(50))")
+    cur.execute(
+        "CREATE TABLE course_progress_v2 (id SERIAL PRIMARY KEY, course_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+        "completed_lessons INTEGER DEFAULT 0, test_score INTEGER DEFAULT 0, completed BOOLEAN DEFAULT false, "
+        "completed_at TIMESTAMP, completed_lesson_ids JSONB DEFAULT '[]'::jsonb, earned_rewards JSONB DEFAULT '[]'::jsonb, "
+        "UNIQUE(course_id, user_id))"
+    )
+    cur.execute("CREATE TABLE test_results (id SERIAL PRIMARY KEY, user_id INTEGER, course_id INTEGER)")
+    cur.execute("CREATE TABLE test_results_v2 (id SERIAL PRIMARY KEY, user_id INTEGER, course_id INTEGER)")
+    cur.execute("CREATE TABLE test_attempts_v2 (id SERIAL PRIMARY KEY, user_id INTEGER, course_id INTEGER)")
+    cur.execute(
+        "CREATE TABLE lesson_completions (id SERIAL PRIMARY KEY, user_id INTEGER NOT NULL, course_id INTEGER NOT NULL, "
+        "lesson_id INTEGER NOT NULL, UNIQUE(user_id, lesson_id))"
+    )
+    # Каждый 5-й урок курса - тест; второй курс нужен, чтобы сброс не задевал чужие строки
+    cur.execute(
+        "INSERT INTO lessons_v2 (course_id, type) "
+        "SELECT c, CASE WHEN l %% 5 = 0 THEN 'test' ELSE 'text' END "
+        "FROM generate_series(1, 2) c, generate_series(1, %s) l ORDER BY c, l",
+        (lessons,)
+    )
+    # Слушатель u прошел первые (u %% (lessons + 1)) уроков курса
+    cur.execute(
+        "INSERT INTO course_progress_v2 (course_id, user_id, completed_lessons, test_score, completed, "
+        "completed_at, completed_lesson_ids, earned_rewards) "
+        "SELECT c, u, n, 80, n = %(lessons)s, CASE WHEN n = %(lessons)s THEN NOW() END, "
+        "(SELECT COALESCE(jsonb_agg(((c - 1) * %(lessons)s + i)::text ORDER BY i), '[]'::jsonb) FROM generate_series(1, n) i), "
+        "CASE WHEN n = %(lessons)s THEN '[1]'::jsonb ELSE '[]'::jsonb END "
+        "FROM (SELECT c, u, u %% (%(lessons)s + 1) AS n FROM generate_series(1, 2) c, generate_series(1, %(learners)s) u) s",
+        {'lessons': lessons, 'learners': learners}
+    )
+    cur.execute(
+        "INSERT INTO lesson_completions (user_id, course_id, lesson_id) "
+        "SELECT cp.user_id, cp.course_id, e::int FROM course_progress_v2 cp, jsonb_array_elements_text(cp.completed_lesson_ids) e"
+    )
+    for table in ('test_results', 'test_results_v2', 'test_attempts_v2'):
+        cur.execute(
+            f"INSERT INTO {table} (user_id, course_id) "
+            "SELECT u, c FROM generate_series(1, 2) c, generate_series(1, %s) u, generate_series(1, 2) k",
+            (learners,)
+        )
+    for table in ('test_results', 'test_results_v2', 'test_attempts_v2', 'lesson_completions', 'lessons_v2'):
+        cur.execute(f"CREATE INDEX ON {table}(course_id)")
+    conn.commit()
+    conn.autocommit = True
+    cur.execute("VACUUM ANALYZE")
+    conn.autocommit = False
+    cur.close()
+
+def legacy_reset_tests(cur, course_id: int) -> None:
+    '''Старая реализация resetType=reset_tests из progress/index.py (UPDATE на каждого слушателя)'''
+    cur.execute("DELETE FROM test_results WHERE course_id = %s", (course_id,))
+    cur.execute("DELETE FROM test_results_v2 WHERE course_id = %s", (course_id,))
+    cur.execute("DELETE FROM test_attempts_v2 WHERE course_id = %s", (course_id,))
+    cur.execute(
+        "DELETE FROM lesson_completions WHERE course_id = %s AND lesson_id IN "
+        "(SELECT id FROM lessons_v2 WHERE course_id = %s AND type = 'test')",
+        (course_id, course_id)
+    )
+    # Счетчик каждого слушателя пересчитывается по оставшимся завершениям отдельными запросами
+    cur.execute("SELECT user_id FROM course_progress_v2 WHERE course_id = %s AND completed_lessons > 0", (course_id,))
+    for (user_id,) in cur.fetchall():
+        cur.execute(
+            "SELECT COUNT(*) FROM lesson_completions WHERE course_id = %s AND user_id = %s",
+            (course_id, user_id)
+        )
+        completed_lessons = cur.fetchone()[0]
+        cur.execute(
+            "UPDATE course_progress_v2 SET completed_lessons = %s, test_score = 0, completed = false, "
+            "completed_at = NULL, earned_rewards = '[]'::jsonb WHERE course_id = %s AND user_id = %s",
+            (completed_lessons, course_id, user_id)
+        )
+
+class CountingCursor(psycopg2.extensions.cursor):
+    executed = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.executed += 1
+        return super().execute(query, vars)
+
+def snapshot(cur) -> List[tuple]:
+    '''Счетчики прогресса и завершенные уроки (источник completedLessonIds) всех слушателей'''
+    cur.execute(
+        "SELECT course_id, user_id, completed_lessons, test_score, completed, completed_at, earned_rewards "
+        "FROM course_progress_v2 ORDER BY course_id, user_id"
+    )
+    rows = cur.fetchall()
+    cur.execute("SELECT course_id, user_id, lesson_id FROM lesson_completions ORDER BY course_id, user_id, lesson_id")
+    rows += cur.fetchall()
+    cur.execute(
+        "SELECT (SELECT COUNT(*) FROM test_results), (SELECT COUNT(*) FROM test_results_v2), "
+        "(SELECT COUNT(*) FROM test_attempts_v2)"
+    )
+    return rows + [cur.fetchone()]
+
+def measure(conn, reset: Callable, runs: int) -> Tuple[List[float], int, List[tuple]]:
+    timings, statements, state = [], 0, []
+    for _ in range(runs):
+        cur = conn.cursor(cursor_factory=CountingCursor)
+        CountingCursor.executed = 0
+        started = time.perf_counter()
+        reset(cur)
+        timings.append((time.perf_counter() - started) * 1000)
+        statements = CountingCursor.executed
+        state = snapshot(cur)
+        conn.rollback()
+        cur.close()
+    return timings, statements, state
+
+def report(name: str, timings: List[float], statements: int) -> None:
+    print(f"{name:<12} median={statistics.median(timings):9.1f}ms  min={min(timings):9.1f}ms  statements={statements}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк сброса прогресса курса')
+    parser.add_argument('--learners', type=int, default=10000)
+    parser.add_argument('--lessons', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('BENCH_DATABASE_URL')
+    if not dsn:
+        sys.exit('BENCH_DATABASE_URL не задан: бенчмарк нельзя запускать на рабочей базе')
+    os.environ['DATABASE_URL'] = dsn
+    os.environ.setdefault('DB_QUERY_LOG', '0')
+
+    progress_module = load_progress_module()
+    conn = psycopg2.connect(dsn)
+    try:
+        print(f"Seeding {args.learners} learners x {args.lessons} lessons...")
+        seed(conn, args.learners, args.lessons)
+
+        def set_path(reset: Callable) -> Callable:
+            def run(cur):
+                cur.execute(f"SET LOCAL search_path TO {BENCH_SCHEMA}")
+                reset(cur)
+            return run
+
+        legacy_timings, legacy_statements, legacy_state = measure(
+            conn, set_path(lambda cur: legacy_reset_tests(cur, COURSE_ID)), args.runs)
+        set_timings, set_statements, set_state = measure(
+            conn, set_path(lambda cur: progress_module.reset_course_progress(cur, COURSE_ID, 'reset_tests')), args.runs)
+
+        if legacy_state != set_state:
+            print("[ERROR] Set-based reset produced a different state than the legacy loop")
+            sys.exit(1)
+        report('legacy', legacy_timings, legacy_statements - 1)
+        report('set-based', set_timings, set_statements - 1)
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+'''
+Бенчмарк клиента хранилища (common/storage.py)
+1. Создание клиента boto3 на каждый вызов (как было в upload/download/lessons) против общего
+   get_s3_client: сеть не нужна, измеряется загрузка моделей botocore и сборка клиента.
+2. Путь загрузки изображения (put оригинала + варианты image_variants + get для хэша)
+   на локальном файловом бэкенде STORAGE_BACKEND=local - без S3 и сети.
+
+Запуск:
+    python backend/benchmarks/storage_bench.py --runs 20 --images 10
+'''
+import os
+import io
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from typing import List, Callable
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def measure(fn: Callable[[], object], runs: int) -> List[float]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def report(name: str, timings: List[float]) -> None:
+    print(f"{name:<40} median={statistics.median(timings):8.2f}ms  max={max(timings):8.2f}ms")
+
+def bench_client(runs: int) -> None:
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    os.environ['STORAGE_BACKEND'] = 's3'
+    import boto3
+    from common import storage
+    storage.STORAGE_BACKEND = 's3'
+
+    def per_call():
+        boto3.client('s3',
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev'),
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+        )
+
+    storage.reset_s3_client()
+    report('boto3.client на каждый вызов', measure(per_call, runs))
+    report('get_s3_client (первый вызов)', measure(storage.get_s3_client, 1))
+    report('get_s3_client (теплый контейнер)', measure(storage.get_s3_client, runs))
+
+def bench_local_images(images: int) -> None:
+    from PIL import Image
+    from common import storage
+    from common.image_variants import store_variants
+
+    root = tempfile.mkdtemp(prefix='storage-bench-')
+    storage.STORAGE_BACKEND = 'local'
+    os.environ['STORAGE_LOCAL_DIR'] = root
+    storage.reset_s3_client()
+    s3 = storage.get_s3_client()
+
+    source = Image.effect_noise((2400, 1600), 64).convert('RGB')
+    buffer = io.BytesIO()
+    source.save(buffer, 'JPEG', quality=90)
+    data = buffer.getvalue()
+
+    counter = iter(range(images))
+
+    def upload_image():
+        key = f'images/bench-{next(counter)}.jpg'
+        s3.put_object(Bucket='files', Key=key, Body=data, ContentType='image/jpeg')
+        s3.get_object(Bucket='files', Key=key)['Body'].read()
+        store_variants(s3, 'files', key, data)
+
+    try:
+        report(f'загрузка изображения {len(data) // 1024} КБ + варианты', measure(upload_image, images))
+    finally:
+        storage.reset_s3_client()
+        shutil.rmtree(root, ignore_errors=True)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк клиента хранилища')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--images', type=int, default=10)
+    args = parser.parse_args()
+    bench_client(args.runs)
+    bench_local_images(args.images)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import os
+import time
+import threading
+import functools
+import psycopg2
+import psycopg2.extensions
+from typing import Dict, Any, Optional, Callable, List
+
+from common.query_stats import InstrumentedCursor, current_stats, start_stats, finish_invocation
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_CHECKOUT_TIMEOUT', '10'))
+POOL_VALIDATE_AFTER = float(os.environ.get('DB_POOL_VALIDATE_AFTER', '30'))
+POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))
+
+class PoolTimeout(Exception):
+    '''Не удалось получить соединение из пула за отведенное время'''
+    pass
+
+def get_query_count() -> int:
+    '''Сколько запросов выполнено в текущем вызове (или с последнего reset_query_count())'''
+    return current_stats().queries
+
+def reset_query_count() -> None:
+    start_stats()
+
+class PooledConnection(psycopg2.extensions.connection):
+    '''
+    Соединение из пула: close() возвращает его в пул вместо разрыва,
+    поэтому существующий код обработчиков (conn.close()) работает без изменений
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool: Optional['ConnectionPool'] = None
+        self._checked_out = False
+        self._created_at = time.monotonic()
+        self._released_at = self._created_at
+
+    def close(self) -> None:
+        if self._pool is None:
+            super().close()
+            return
+        if self._checked_out:
+            self._pool.release(self)
+
+    def discard(self) -> None:
+        '''Физически закрывает соединение'''
+        self._pool = None
+        if not self.closed:
+            super().close()
+
+class ConnectionPool:
+    '''
+    Пул соединений, живущий на уровне модуля между теплыми вызовами функции
+    Args:
+        dsn - строка подключения
+        max_size - максимум одновременно выданных соединений
+        timeout - сколько ждать свободного слота (сек)
+    '''
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE, timeout: float = POOL_CHECKOUT_TIMEOUT):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle: List[PooledConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._local = threading.local()
+
+    def _connect(self) -> PooledConnection:
+        conn = psycopg2.connect(self.dsn, connection_factory=PooledConnection)
+        conn.cursor_factory = InstrumentedCursor
+        conn._pool = self
+        return conn
+
+    def _is_usable(self, conn: PooledConnection) -> bool:
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if now - conn._created_at > POOL_MAX_LIFETIME:
+            return False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        # Дешевый пинг только для соединений, которые долго простаивали
+        if now - conn._released_at > POOL_VALIDATE_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _checked_out_here(self) -> List[PooledConnection]:
+        conns = getattr(self._local, 'connections', None)
+        if conns is None:
+            conns = []
+            self._local.connections = conns
+        return conns
+
+    def acquire(self) -> PooledConnection:
+        '''Выдает соединение из пула (или открывает новое)'''
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'Нет свободных соединений (max_size={self.max_size})')
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    conn = self._connect()
+                    break
+                if self._is_usable(conn):
+                    break
+                conn.discard()
+        except Exception:
+            self._slots.release()
+            raise
+        conn._checked_out = True
+        self._checked_out_here().append(conn)
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        '''Возвращает соединение в пул, откатывая незавершенную транзакцию'''
+        if not conn._checked_out:
+            return
+        conn._checked_out = False
+        conns = self._checked_out_here()
+        if conn in conns:
+            conns.remove(conn)
+        try:
+            if conn.closed or time.monotonic() - conn._created_at > POOL_MAX_LIFETIME:
+                conn.discard()
+                return
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            conn._released_at = time.monotonic()
+            with self._lock:
+                self._idle.append(conn)
+        except psycopg2.Error as e:
+            print(f"[WARNING] Discarding broken pooled connection: {e}")
+            conn.discard()
+        finally:
+            self._slots.release()
+
+    def release_all(self) -> None:
+        '''Возвращает все соединения, выданные в текущем потоке (конец вызова)'''
+        for conn in list(self._checked_out_here()):
+            self.release(conn)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.discard()
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    '''Пул модуля, создается лениво при первом обращении'''
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ['DATABASE_URL'])
+    return _pool
+
+def get_db_connection() -> PooledConnection:
+    '''Соединение на время вызова; conn.close() возвращает его в пул'''
+    return get_pool().acquire()
+
+_invocation = threading.local()
+_end_of_invocation: List[Callable[[], None]] = []
+
+def at_invocation_end(callback: Callable[[], None]) -> None:
+    '''Регистрирует функцию, которую pooled_handler вызывает после каждого вызова обработчика'''
+    if callback not in _end_of_invocation:
+        _end_of_invocation.append(callback)
+
+def in_invocation() -> bool:
+    '''True, если текущий поток выполняет обработчик под pooled_handler'''
+    return getattr(_invocation, 'depth', 0) > 0
+
+def pooled_handler(handler: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    '''
+    Декоратор для handler: по завершении вызова возвращает в пул все соединения,
+    которые обработчик не закрыл (например, при исключении валидации),
+    и выполняет зарегистрированные at_invocation_end функции (сброс буфера логов).
+    В ответ добавляется заголовок Server-Timing со статистикой запросов к базе
+    '''
+    function_name = os.path.basename(os.path.dirname(os.path.abspath(handler.__code__.co_filename)))
+
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        outermost = getattr(_invocation, 'depth', 0) == 0
+        if outermost:
+            start_stats()
+        _invocation.depth = getattr(_invocation, 'depth', 0) + 1
+        response = None
+        try:
+            response = handler(event, context)
+            return response
+        finally:
+            _invocation.depth -= 1
+            if _pool is not None:
+                _pool.release_all()
+            if _invocation.depth == 0:
+                for callback in _end_of_invocation:
+                    try:
+                        callback()
+                    except Exception as e:
+                        print(f"[WARNING] End-of-invocation callback failed: {e}")
+                if _pool is not None:
+                    _pool.release_all()
+            if outermost:
+                try:
+                    finish_invocation(function_name, event or {}, response)
+                except Exception as e:
+                    print(f"[WARNING] Failed to report query stats: {e}")
+    return wrapper
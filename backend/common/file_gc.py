@@ -0,0 +1,234 @@
+'''
+Сборка мусора в бакете files: удаляет объекты, на которые не ссылается ни одна запись БД
+Удаление курса и теста не трогает обложки, материалы и картинки вопросов - они остаются в бакете.
+Бакет читается постранично (list_objects_v2 по 1000 ключей), ссылки собираются из
+courses_v2.image, lessons_v2 (image_url, video_url), lesson_materials_v2.url, questions_v2.image_url,
+users_v2.avatar, rewards_v2.icon, таблиц v1 и ссылок внутри текстов (content, описания). Удаляются только объекты старше grace периода -
+файл, загруженный, но еще не сохраненный в форме курса, не пропадет.
+
+Отчет без удаления (сколько байт освободится):
+    DATABASE_URL=postgresql://... AWS_ACCESS_KEY_ID=... AWS_SECRET_ACCESS_KEY=... \
+        python backend/common/file_gc.py --dry-run
+'''
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, List, Set
+from urllib.parse import unquote, urlparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.file_locations import candidate_keys, forget_locations
+from common.storage import delete_keys, DELETE_BATCH_SIZE
+
+FILE_GC_GRACE_HOURS = int(os.environ.get('FILE_GC_GRACE_HOURS', '168'))
+REPORT_SAMPLE_SIZE = 20
+
+# Поля, в которые форма сохраняет URL загруженного файла целиком (таблицы v1 тоже - они не удалены)
+URL_COLUMNS = (
+    ('courses_v2', 'image'),
+    ('lessons_v2', 'image_url'),
+    ('lessons_v2', 'video_url'),
+    ('lesson_materials_v2', 'url'),
+    ('questions_v2', 'image_url'),
+    ('users_v2', 'avatar'),
+    ('rewards_v2', 'icon'),
+    ('courses', 'image'),
+    ('lessons', 'video_url'),
+    ('lesson_materials', 'url'),
+    ('users', 'avatar'),
+    ('rewards', 'icon'),
+)
+# Текст и JSON, внутри которых могут быть ссылки (HTML/Markdown уроков, описания, варианты ответов)
+TEXT_COLUMNS = (
+    ('lessons_v2', 'content'),
+    ('lessons_v2', 'description'),
+    ('courses_v2', 'description'),
+    ('tests_v2', 'description'),
+    ('questions_v2', 'text'),
+    ('questions_v2', 'options::text'),
+    ('questions_v2', 'matching_pairs::text'),
+    ('rewards_v2', 'description'),
+    ('lessons', 'content'),
+    ('lessons', 'description'),
+    ('courses', 'description'),
+    ('tests', 'description'),
+    ('questions', 'text'),
+    ('questions', 'options::text'),
+    ('questions', 'matching_pairs::text'),
+    ('rewards', 'description'),
+)
+REFERENCES_SQL = " UNION ALL ".join(
+    [f"SELECT {column} FROM {table} WHERE {column} LIKE '%/bucket/%'" for table, column in URL_COLUMNS]
+    + [f"SELECT '/bucket/' || (regexp_matches({column}, '/bucket/([^\\s\"''<>()\\[\\]`]+)', 'g'))[1] "
+       f"FROM {table} WHERE {column} LIKE '%/bucket/%'" for table, column in TEXT_COLUMNS]
+)
+# Знаки препинания после ссылки в обычном тексте ("см. .../bucket/documents/a.pdf.") - не часть ключа
+TRAILING_PUNCTUATION = '.,;:!?'
+# Загрузки внутри grace периода (в т.ч. повторные загрузки старого содержимого - дедупликация)
+RECENT_UPLOADS_SQL = (
+    "SELECT object_key FROM file_uploads WHERE status != 'aborted' AND created_at > %(cutoff)s "
+    "UNION SELECT object_key FROM file_objects WHERE last_referenced_at > %(cutoff)s"
+)
+VARIANTS_SQL = "SELECT object_key, variants FROM file_objects WHERE variants IS NOT NULL"
+# Перед удалением пачки: объект мог получить новую ссылку за время обхода бакета
+RECHECK_SQL = "SELECT object_key FROM file_objects WHERE object_key = ANY(%s) AND last_referenced_at > %s"
+STALE_UPLOADS_SQL = (
+    "SELECT id, object_key, multipart_upload_id FROM file_uploads "
+    "WHERE status = 'pending' AND created_at < %s"
+)
+
+def reference_key(url: str) -> Optional[str]:
+    '''Ключ объекта из любого URL с /bucket/ (CDN, S3_PUBLIC_URL, относительные ссылки в content)'''
+    path = urlparse(url.strip().rstrip(TRAILING_PUNCTUATION)).path
+    if '/bucket/' not in path:
+        return None
+    key = unquote(path.split('/bucket/', 1)[1])
+    return key or None
+
+def referenced_keys(cur, cutoff: datetime) -> Set[str]:
+    '''
+    Ключи, которые удалять нельзя: ссылки из БД со всеми путями, по которым download их найдет,
+    уменьшенные копии изображений и загрузки моложе cutoff
+    '''
+    keys: Set[str] = set()
+    cur.execute(REFERENCES_SQL)
+    for (url,) in cur:
+        key = reference_key(url)
+        if key:
+            keys.update(candidate_keys(key))
+
+    cur.execute(RECENT_UPLOADS_SQL, {'cutoff': cutoff.replace(tzinfo=None)})
+    keys.update(row[0] for row in cur)
+
+    cur.execute(VARIANTS_SQL)
+    for object_key, variants in cur.fetchall():
+        if object_key in keys:
+            keys.update(item['key'] for item in variants.get('items', []))
+    return keys
+
+def forget_objects(cur, keys: List[str]) -> None:
+    '''Удаленные объекты убираются из таблицы хэшей и индекса расположения'''
+    cur.execute("DELETE FROM file_objects WHERE object_key = ANY(%s)", (keys,))
+    forget_locations(cur, keys)
+
+def abort_stale_uploads(cur, s3, bucket: str, cutoff: datetime, dry_run: bool) -> int:
+    '''Незавершенные presigned загрузки старше cutoff: части multipart занимают место, пока не отменены'''
+    cur.execute(STALE_UPLOADS_SQL, (cutoff.replace(tzinfo=None),))
+    stale = cur.fetchall()
+    if dry_run:
+        return len(stale)
+    for upload_id, object_key, multipart_upload_id in stale:
+        if multipart_upload_id:
+            try:
+                s3.abort_multipart_upload(Bucket=bucket, Key=object_key, UploadId=multipart_upload_id)
+            except Exception as e:
+                print(f'Failed to abort multipart upload {object_key}: {e}')
+    if stale:
+        cur.execute("UPDATE file_uploads SET status = 'aborted' WHERE id = ANY(%s)", ([row[0] for row in stale],))
+    return len(stale)
+
+def collect_garbage(conn, s3, bucket: str, grace_hours: int = FILE_GC_GRACE_HOURS,
+                    dry_run: bool = True) -> Dict[str, Any]:
+    '''
+    Обходит бакет и удаляет объекты без ссылок старше grace_hours
+    dry_run - только отчет: число и объем объектов, которые будут удалены, по папкам
+    '''
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    cur = conn.cursor()
+    keep = referenced_keys(cur, cutoff)
+    conn.rollback()
+
+    report: Dict[str, Any] = {
+        'dryRun': dry_run,
+        'graceHours': grace_hours,
+        'referenced': len(keep),
+        'scanned': 0,
+        'scannedBytes': 0,
+        'orphans': 0,
+        'orphanBytes': 0,
+        'deleted': 0,
+        'deletedBytes': 0,
+        'errors': [],
+        'byFolder': {},
+        'sample': [],
+    }
+    pending: Dict[str, int] = {}
+
+    def flush() -> None:
+        keys = list(pending)
+        cur.execute(RECHECK_SQL, (keys, cutoff.replace(tzinfo=None)))
+        touched = {row[0] for row in cur.fetchall()}
+        keys = [key for key in keys if key not in touched]
+        result = delete_keys(s3, bucket, keys)
+        if result['deleted']:
+            forget_objects(cur, result['deleted'])
+        conn.commit()
+        report['deleted'] += len(result['deleted'])
+        report['deletedBytes'] += sum(pending[key] for key in result['deleted'])
+        report['errors'].extend(result['errors'])
+        pending.clear()
+
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, PaginationConfig={'PageSize': 1000}):
+        for item in page.get('Contents', []):
+            key, size = item['Key'], item.get('Size') or 0
+            report['scanned'] += 1
+            report['scannedBytes'] += size
+            if key in keep or item['LastModified'] > cutoff:
+                continue
+            report['orphans'] += 1
+            report['orphanBytes'] += size
+            folder = report['byFolder'].setdefault(key.split('/', 1)[0] if '/' in key else '', {'count': 0, 'bytes': 0})
+            folder['count'] += 1
+            folder['bytes'] += size
+            if len(report['sample']) < REPORT_SAMPLE_SIZE:
+                report['sample'].append(key)
+            if not dry_run:
+                pending[key] = size
+                if len(pending) >= DELETE_BATCH_SIZE:
+                    flush()
+    if pending:
+        flush()
+
+    report['staleUploads'] = abort_stale_uploads(cur, s3, bucket, cutoff, dry_run)
+    conn.commit()
+    cur.close()
+    report['durationMs'] = (time.perf_counter() - started) * 1000
+    return report
+
+def main() -> None:
+    import argparse
+    import psycopg2
+    from common.storage import get_s3_client
+
+    parser = argparse.ArgumentParser(description='Удаление объектов бакета без ссылок из БД')
+    parser.add_argument('--bucket', default='files')
+    parser.add_argument('--grace-hours', type=int, default=FILE_GC_GRACE_HOURS,
+                        help='Не удалять объекты моложе (часов)')
+    parser.add_argument('--dry-run', action='store_true', help='Только отчет, ничего не удалять')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL не задан')
+
+    s3 = get_s3_client()
+    conn = psycopg2.connect(dsn)
+    try:
+        report = collect_garbage(conn, s3, args.bucket, args.grace_hours, args.dry_run)
+    finally:
+        conn.close()
+    for folder, stats in sorted(report['byFolder'].items()):
+        print(f"{folder or '(root)'}: {stats['count']} objects, {stats['bytes']} bytes")
+    for key in report['sample']:
+        print(f"  {key}")
+    for error in report['errors']:
+        print(f"error {error['key']}: {error['code']} {error['message']}")
+    print(f"{'dry run: ' if report['dryRun'] else ''}scanned={report['scanned']} ({report['scannedBytes']} bytes) "
+          f"referenced={report['referenced']} orphans={report['orphans']} reclaimable={report['orphanBytes']} bytes "
+          f"deleted={report['deleted']} ({report['deletedBytes']} bytes) staleUploads={report['staleUploads']} "
+          f"total={report['durationMs']:.0f}ms")
+
+if __name__ == '__main__':
+    main()
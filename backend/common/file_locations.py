@@ -0,0 +1,132 @@
+'''
+Индекс расположения файлов бакета files: запрошенный ключ -> ключ, под которым объект реально лежит
+Миграции V0032/V0033 переносили документы между images/ и documents/, поэтому старые URL
+могут указывать не туда. download сначала смотрит в индекс и обращается к хранилищу один раз;
+промах индекса проверяется head_object по возможным путям, найденный путь записывается в индекс.
+
+Заполнение индекса по текущему содержимому бакета (один раз после выкладки):
+    DATABASE_URL=postgresql://... AWS_ACCESS_KEY_ID=... AWS_SECRET_ACCESS_KEY=... \
+        python backend/common/file_locations.py
+'''
+import os
+import sys
+import time
+import psycopg2.extras
+from typing import Dict, Any, Optional, List, Set, Iterable
+
+LOOKUP_SQL = "SELECT object_key, size, content_type, etag FROM file_locations WHERE requested_key = %s"
+REMEMBER_SQL = (
+    "INSERT INTO file_locations (requested_key, object_key, size, content_type, etag) VALUES %s "
+    "ON CONFLICT (requested_key) DO UPDATE SET object_key = EXCLUDED.object_key, size = EXCLUDED.size, "
+    "content_type = COALESCE(EXCLUDED.content_type, file_locations.content_type), etag = EXCLUDED.etag, "
+    "resolved_at = NOW()"
+)
+FORGET_SQL = "DELETE FROM file_locations WHERE object_key = ANY(%s)"
+
+def candidate_keys(file_key: str) -> List[str]:
+    '''Список возможных путей файла: старые загрузки могли попасть в другую папку'''
+    possible_keys = [file_key]
+    if file_key.startswith('documents/'):
+        possible_keys.append(file_key.replace('documents/', 'images/'))
+        possible_keys.append(file_key.replace('documents/', ''))
+    elif file_key.startswith('images/'):
+        possible_keys.append(file_key.replace('images/', 'documents/'))
+        possible_keys.append(file_key.replace('images/', ''))
+    else:
+        possible_keys.append(f'images/{file_key}')
+        possible_keys.append(f'documents/{file_key}')
+    return possible_keys
+
+def alias_keys(object_key: str) -> List[str]:
+    '''Запрошенные ключи, для которых candidate_keys может привести к object_key'''
+    if object_key.startswith('images/'):
+        name = object_key[len('images/'):]
+        return [object_key, f'documents/{name}', name]
+    if object_key.startswith('documents/'):
+        name = object_key[len('documents/'):]
+        return [object_key, f'images/{name}', name]
+    return [object_key, f'images/{object_key}', f'documents/{object_key}']
+
+def lookup_location(cur, requested_key: str) -> Optional[Dict[str, Any]]:
+    '''Returns: {key, size, contentType, etag} из индекса или None'''
+    cur.execute(LOOKUP_SQL, (requested_key,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return {'key': row[0], 'size': row[1], 'contentType': row[2], 'etag': row[3]}
+
+def remember_location(cur, requested_key: str, object_key: str, size: Optional[int],
+                      content_type: Optional[str] = None, etag: Optional[str] = None) -> None:
+    psycopg2.extras.execute_values(cur, REMEMBER_SQL, [(requested_key, object_key, size, content_type, etag)])
+
+def forget_locations(cur, object_keys: List[str]) -> None:
+    '''Объекты удалены из хранилища - все запрошенные ключи, ведущие к ним, убираются из индекса'''
+    if object_keys:
+        cur.execute(FORGET_SQL, (list(object_keys),))
+
+def resolve_listing(objects: Dict[str, Dict[str, Any]]) -> Iterable[tuple]:
+    '''
+    Строки индекса по списку объектов бакета {ключ: {size, etag}}
+    Порядок проверки путей тот же, что у download: запрошенный ключ, затем соседняя папка, затем без папки
+    '''
+    seen: Set[str] = set()
+    for object_key in objects:
+        for requested_key in alias_keys(object_key):
+            if requested_key in seen:
+                continue
+            seen.add(requested_key)
+            resolved = next((key for key in candidate_keys(requested_key) if key in objects), None)
+            if resolved:
+                stored = objects[resolved]
+                yield (requested_key, resolved, stored['size'], None, stored['etag'])
+
+def scan_bucket(conn, s3, bucket: str, batch_size: int = 1000) -> Dict[str, Any]:
+    '''
+    Заполняет индекс по листингу бакета: list_objects_v2 возвращает по 1000 ключей за запрос,
+    содержимое объектов не читается
+    '''
+    started = time.perf_counter()
+    objects: Dict[str, Dict[str, Any]] = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket):
+        for item in page.get('Contents', []):
+            objects[item['Key']] = {'size': item.get('Size'), 'etag': (item.get('ETag') or '').strip('"') or None}
+
+    cur = conn.cursor()
+    rows = list(resolve_listing(objects))
+    for offset in range(0, len(rows), batch_size):
+        psycopg2.extras.execute_values(cur, REMEMBER_SQL, rows[offset:offset + batch_size], page_size=batch_size)
+        conn.commit()
+    cur.close()
+    return {
+        'objects': len(objects),
+        'locations': len(rows),
+        'aliases': sum(1 for row in rows if row[0] != row[1]),
+        'durationMs': (time.perf_counter() - started) * 1000,
+    }
+
+def main() -> None:
+    import argparse
+    import psycopg2
+    from common.storage import get_s3_client
+
+    parser = argparse.ArgumentParser(description='Заполнение индекса расположения файлов по листингу бакета')
+    parser.add_argument('--bucket', default='files')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL не задан')
+
+    s3 = get_s3_client()
+    conn = psycopg2.connect(dsn)
+    try:
+        report = scan_bucket(conn, s3, args.bucket, args.batch_size)
+    finally:
+        conn.close()
+    print(f"objects={report['objects']} locations={report['locations']} aliases={report['aliases']} "
+          f"total={report['durationMs']:.0f}ms")
+
+if __name__ == '__main__':
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    main()
@@ -0,0 +1,123 @@
+import os
+import json
+import base64
+import hashlib
+from typing import Dict, Any, Optional, List, Tuple, Iterable
+
+from common.file_locations import forget_locations
+
+# Объект без проверенной хранилищем контрольной суммы перечитывается для хэша только до этого размера;
+# больше - не дедуплицируется (байты не должны возвращаться через функцию)
+DEDUP_HASH_MAX_BYTES = int(os.environ.get('DEDUP_HASH_MAX_BYTES', str(8 * 1024 * 1024)))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Объект уже есть - еще одна ссылка на него
+ACQUIRE_SQL = (
+    "UPDATE file_objects SET ref_count = ref_count + 1, last_referenced_at = NOW() "
+    "WHERE sha256 = %s RETURNING object_key, size, content_type, variants"
+)
+# Новый объект; если такой хэш успели записать параллельно - ссылка на уже сохраненный ключ
+REGISTER_SQL = (
+    "INSERT INTO file_objects (sha256, object_key, size, content_type, ref_count) "
+    "VALUES (%s, %s, %s, %s, 1) "
+    "ON CONFLICT (sha256) DO UPDATE SET ref_count = file_objects.ref_count + 1, last_referenced_at = NOW() "
+    "RETURNING object_key"
+)
+RELEASE_SQL = (
+    "UPDATE file_objects SET ref_count = GREATEST(ref_count - 1, 0) "
+    "WHERE object_key = %s RETURNING ref_count"
+)
+DROP_SQL = "DELETE FROM file_objects WHERE object_key = %s AND ref_count = 0 RETURNING variants"
+
+def sha256_chunks(chunks: Iterable[bytes]) -> Tuple[str, int]:
+    '''Потоковый SHA-256: в памяти только текущий кусок. Returns: (hex, размер)'''
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+def checksum_to_hex(checksum: Optional[str]) -> Optional[str]:
+    '''ChecksumSHA256 / x-amz-checksum-sha256 (base64) -> hex, как в file_objects.sha256'''
+    if not checksum:
+        return None
+    try:
+        return base64.b64decode(checksum).hex()
+    except ValueError:
+        return None
+
+def hex_to_checksum(sha256: str) -> str:
+    return base64.b64encode(bytes.fromhex(sha256)).decode('ascii')
+
+def sha256_object(s3, bucket: str, key: str) -> Tuple[str, int]:
+    '''Хэш объекта хранилища, читается потоком по HASH_CHUNK_SIZE'''
+    response = s3.get_object(Bucket=bucket, Key=key)
+    return sha256_chunks(response['Body'].iter_chunks(chunk_size=HASH_CHUNK_SIZE))
+
+def acquire_object(cur, sha256: str) -> Optional[Dict[str, Any]]:
+    '''Ищет объект по хэшу и добавляет ссылку. Returns: {key, size, contentType, variants} или None'''
+    cur.execute(ACQUIRE_SQL, (sha256,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return {'key': row[0], 'size': row[1], 'contentType': row[2], 'variants': row[3]}
+
+def register_object(cur, sha256: str, object_key: str, size: int, content_type: str) -> str:
+    '''
+    Записывает объект в таблицу хэшей с одной ссылкой
+    Returns: ключ, под которым содержимое хранится (не object_key - если дубль записан раньше)
+    '''
+    cur.execute(REGISTER_SQL, (sha256, object_key, size, content_type))
+    return cur.fetchone()[0]
+
+def find_object(cur, sha256: str) -> Optional[str]:
+    '''Ключ объекта с таким содержимым без добавления ссылки (None - еще не хранится)'''
+    cur.execute("SELECT object_key FROM file_objects WHERE sha256 = %s", (sha256,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def get_variants(cur, sha256: str) -> Optional[Dict[str, Any]]:
+    '''Уменьшенные копии изображения (common.image_variants), записанные при первой загрузке'''
+    cur.execute("SELECT variants FROM file_objects WHERE sha256 = %s", (sha256,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def set_variants(cur, sha256: str, variants: Optional[Dict[str, Any]]) -> None:
+    cur.execute(
+        "UPDATE file_objects SET variants = %s WHERE sha256 = %s",
+        (json.dumps(variants) if variants else None, sha256)
+    )
+
+def release_objects(cur, object_keys: List[str]) -> List[str]:
+    '''
+    Снимает по одной ссылке с объектов (удаление материала, урока)
+    Returns: ключи, которые можно удалить из хранилища: ссылок не осталось
+    (вместе с уменьшенными копиями изображения) или объект не учтен в file_objects
+    (загружен до дедупликации)
+    '''
+    deletable = []
+    for object_key in object_keys:
+        cur.execute(RELEASE_SQL, (object_key,))
+        row = cur.fetchone()
+        if row is None:
+            deletable.append(object_key)
+        elif row[0] == 0:
+            cur.execute(DROP_SQL, (object_key,))
+            dropped = cur.fetchone()
+            deletable.append(object_key)
+            if dropped and dropped[0]:
+                deletable.extend(item['key'] for item in dropped[0].get('items', []))
+    # Удаляемые объекты больше не должны находиться через индекс download
+    forget_locations(cur, deletable)
+    return deletable
+
+def key_from_url(url: str) -> Optional[str]:
+    '''Ключ объекта из CDN URL вида https://cdn.poehali.dev/projects/{ACCESS_KEY}/bucket/{key}'''
+    if not url:
+        return None
+    public_url = os.environ.get('S3_PUBLIC_URL')
+    if 'cdn.poehali.dev' not in url and not (public_url and url.startswith(public_url)):
+        return None
+    parts = url.split('/bucket/')
+    return parts[1] if len(parts) == 2 and parts[1] else None
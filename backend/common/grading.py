@@ -0,0 +1,171 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+
+from common.prepared import register_statement, execute_prepared
+
+ANSWER_KEY_CACHE_SIZE = int(os.environ.get('ANSWER_KEY_CACHE_SIZE', '256'))
+
+# Версия ключа - tests_v2.updated_at: все изменения теста и его вопросов обновляют это поле.
+# Запрос выполняется на каждой проверке, поэтому готовится один раз на соединение
+TEST_VERSION = register_statement(
+    'grading_test_version',
+    "SELECT t.updated_at, (SELECT l.course_id FROM lessons_v2 l WHERE l.id = %(lesson_id)s) "
+    "FROM tests_v2 t WHERE t.id = %(test_id)s",
+    ('integer', 'integer')
+)
+TEST_KEY_QUERY = "SELECT title, pass_score, updated_at FROM tests_v2 WHERE id = %s"
+QUESTIONS_KEY_QUERY = (
+    "SELECT id, type, correct_answer, points, matching_pairs FROM questions_v2 "
+    "WHERE test_id = %s ORDER BY \"order\""
+)
+
+class CompiledQuestion:
+    '''Вопрос в виде, готовом к проверке: тип, нормализованный правильный ответ, баллы'''
+    __slots__ = ('id', 'type', 'expected', 'points')
+
+    def __init__(self, question_id: int, question_type: str, correct_answer: Any, points: int,
+                 matching_pairs: Optional[list]):
+        self.id = str(question_id)
+        self.type = question_type
+        self.points = points
+        self.expected = normalize_expected(question_type, correct_answer, matching_pairs)
+
+    def is_correct(self, user_answer: Any) -> bool:
+        if self.type == 'single':
+            # Для single choice сравниваем числовые индексы
+            return user_answer == self.expected
+        if self.expected is None:
+            return False
+        if self.type == 'multiple':
+            if not isinstance(user_answer, list):
+                return False
+            try:
+                return sorted(user_answer) == self.expected
+            except TypeError:
+                return False
+        if self.type == 'matching':
+            # Для matching проверяем порядок правых элементов
+            return isinstance(user_answer, list) and user_answer == self.expected
+        if self.type == 'text':
+            return isinstance(user_answer, str) and user_answer.strip().lower() == self.expected
+        return False
+
+def normalize_expected(question_type: str, correct_answer: Any, matching_pairs: Optional[list]) -> Any:
+    '''Правильный ответ в форме для сравнения (None - на вопрос нельзя ответить верно)'''
+    if question_type == 'single':
+        return correct_answer
+    if question_type == 'multiple':
+        if not isinstance(correct_answer, list):
+            return None
+        try:
+            return sorted(correct_answer)
+        except TypeError:
+            return None
+    if question_type == 'matching':
+        return [pair['right'] for pair in matching_pairs] if matching_pairs else None
+    if question_type == 'text':
+        return correct_answer.strip().lower() if isinstance(correct_answer, str) else None
+    return None
+
+class AnswerKey:
+    '''
+    Скомпилированный ключ ответов теста
+    Args:
+        test_id - ID теста
+        version - tests_v2.updated_at на момент компиляции
+    '''
+    def __init__(self, test_id: int, version: Any, title: str, pass_score: int,
+                 questions: List[CompiledQuestion]):
+        self.test_id = test_id
+        self.version = version
+        self.title = title
+        self.pass_score = pass_score
+        self.questions = questions
+        self.total_points = sum(question.points for question in questions)
+
+    def grade(self, answers: Dict[str, Any]) -> Dict[str, Any]:
+        '''Проверяет ответы: {questionId: ответ} -> баллы, процент и результаты по вопросам'''
+        earned_points = 0
+        results = []
+        for question in self.questions:
+            is_correct = question.is_correct(answers.get(question.id))
+            if is_correct:
+                earned_points += question.points
+            results.append({
+                'questionId': question.id,
+                'isCorrect': is_correct,
+                'points': question.points if is_correct else 0
+            })
+        total_points = self.total_points
+        score = round((earned_points / total_points * 100)) if total_points > 0 else 0
+        return {
+            'score': score,
+            'earnedPoints': earned_points,
+            'totalPoints': total_points,
+            'passed': score >= self.pass_score,
+            'results': results,
+        }
+
+def compile_answer_key(cur, test_id: int) -> Optional[AnswerKey]:
+    '''Читает тест и его вопросы и собирает ключ ответов (None - теста нет)'''
+    cur.execute(TEST_KEY_QUERY, (test_id,))
+    test_row = cur.fetchone()
+    if not test_row:
+        return None
+    cur.execute(QUESTIONS_KEY_QUERY, (test_id,))
+    questions = [
+        CompiledQuestion(row[0], row[1], row[2], row[3], row[4])
+        for row in cur.fetchall()
+    ]
+    title = test_row[0] or f"Тест #{test_id}"
+    pass_score = test_row[1] if test_row[1] is not None else 70
+    return AnswerKey(test_id, test_row[2], title, pass_score, questions)
+
+class AnswerKeyCache:
+    '''
+    LRU кэш ключей ответов в памяти процесса (живет между теплыми вызовами)
+    Каждое обращение сверяет версию теста одним запросом по первичному ключу,
+    поэтому изменения вопросов из других процессов видны сразу
+    '''
+    def __init__(self, max_size: int = ANSWER_KEY_CACHE_SIZE):
+        self.max_size = max_size
+        self._keys: 'OrderedDict[int, AnswerKey]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cur, test_id: int, lesson_id: Any) -> Tuple[Optional[AnswerKey], Optional[int]]:
+        '''
+        Returns: (ключ ответов или None если теста нет, course_id урока или None если урока нет)
+        '''
+        execute_prepared(cur, TEST_VERSION, {'lesson_id': lesson_id, 'test_id': test_id})
+        version_row = cur.fetchone()
+        if not version_row:
+            self.invalidate(test_id)
+            return None, None
+        version, course_id = version_row
+
+        with self._lock:
+            key = self._keys.get(test_id)
+            if key is not None and key.version == version:
+                self._keys.move_to_end(test_id)
+                self.hits += 1
+                return key, course_id
+
+        self.misses += 1
+        key = compile_answer_key(cur, test_id)
+        if key is None:
+            self.invalidate(test_id)
+            return None, course_id
+        with self._lock:
+            self._keys[test_id] = key
+            self._keys.move_to_end(test_id)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+        return key, course_id
+
+    def invalidate(self, test_id: int) -> None:
+        with self._lock:
+            self._keys.pop(test_id, None)
@@ -0,0 +1,127 @@
+import io
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
+
+from PIL import Image, ImageOps
+
+# Ширины вариантов (px): карточки каталога, превью урока, полноэкранный просмотр
+IMAGE_VARIANT_WIDTHS = [int(width) for width in os.environ.get('IMAGE_VARIANT_WIDTHS', '320,640,1280').split(',') if width]
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', '4'))
+# Больше этого размера исходник не декодируется (защита памяти функции)
+IMAGE_VARIANTS_MAX_BYTES = int(os.environ.get('IMAGE_VARIANTS_MAX_BYTES', str(25 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', str(50 * 1000 * 1000)))
+
+# Растровые форматы, для которых строятся варианты (GIF может быть анимированным, SVG - векторный)
+SOURCE_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+
+FORMATS = {
+    'webp': {'ext': 'webp', 'content_type': 'image/webp', 'pil': 'WEBP', 'options': {'quality': 80, 'method': 4}},
+    'jpeg': {'ext': 'jpg', 'content_type': 'image/jpeg', 'pil': 'JPEG',
+             'options': {'quality': 82, 'optimize': True, 'progressive': True}},
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Pillow отпускает GIL при масштабировании и кодировании, поэтому достаточно потоков
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=IMAGE_VARIANT_WORKERS)
+    return _executor
+
+def wants_variants(content_type: Optional[str], size: int) -> bool:
+    return (content_type or '').split(';')[0].strip().lower() in SOURCE_TYPES and 0 < size <= IMAGE_VARIANTS_MAX_BYTES
+
+def variant_key(original_key: str, width: int, fmt: str) -> str:
+    '''images/<имя>.png -> images/<имя>-320w.webp (рядом с оригиналом)'''
+    stem = posixpath.splitext(original_key)[0]
+    return f"{stem}-{width}w.{FORMATS[fmt]['ext']}"
+
+def _render(image: Image.Image, width: int) -> List[Tuple[int, str, bytes]]:
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.LANCZOS)
+    results = []
+    for fmt, spec in FORMATS.items():
+        target = resized
+        if fmt == 'jpeg' and target.mode != 'RGB':
+            # JPEG без альфа-канала: прозрачность на белом фоне
+            background = Image.new('RGB', target.size, (255, 255, 255))
+            background.paste(target, mask=target.getchannel('A') if 'A' in target.getbands() else None)
+            target = background
+        buffer = io.BytesIO()
+        target.save(buffer, spec['pil'], **spec['options'])
+        results.append((width, fmt, buffer.getvalue()))
+    return results
+
+def render_variants(data: bytes) -> Tuple[Optional[Tuple[int, int, str]], List[Tuple[int, str, bytes]]]:
+    '''
+    Масштабированные копии изображения в WebP и JPEG
+    Ширины больше исходной не строятся (без увеличения)
+    Returns: ((ширина, высота, формат) оригинала или None если не изображение, [(ширина, формат, байты)])
+    '''
+    try:
+        image = Image.open(io.BytesIO(data))
+        # exif_transpose возвращает копию без format, поэтому формат берется до поворота
+        source_format = (image.format or '').lower()
+        if image.width * image.height > IMAGE_MAX_PIXELS:
+            return None, []
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, []
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    widths = [width for width in sorted(set(IMAGE_VARIANT_WIDTHS)) if width < image.width]
+    rendered = _get_executor().map(lambda width: _render(image, width), widths)
+    return (image.width, image.height, source_format), [variant for batch in rendered for variant in batch]
+
+def store_variants(s3, bucket: str, original_key: str, data: bytes) -> Optional[Dict[str, Any]]:
+    '''
+    Строит варианты и параллельно кладет их в бакет рядом с оригиналом
+    Returns: описание для file_objects.variants ({width, height, format, items: [{width, format, key}]}) или None
+    '''
+    dimensions, variants = render_variants(data)
+    if dimensions is None:
+        return None
+
+    def upload(variant: Tuple[int, str, bytes]) -> Dict[str, Any]:
+        width, fmt, body = variant
+        key = variant_key(original_key, width, fmt)
+        s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType=FORMATS[fmt]['content_type'],
+                      CacheControl='public, max-age=31536000, immutable')
+        return {'width': width, 'format': fmt, 'key': key, 'size': len(body)}
+
+    items = list(_get_executor().map(upload, variants))
+    return {'width': dimensions[0], 'height': dimensions[1], 'format': dimensions[2], 'items': items}
+
+def variant_keys(variants: Optional[Dict[str, Any]]) -> List[str]:
+    return [item['key'] for item in (variants or {}).get('items', [])]
+
+def srcset_response(variants: Optional[Dict[str, Any]], base_url: str, original_url: str) -> Optional[Dict[str, Any]]:
+    '''
+    Карта вариантов для ответа: {width, height, variants: {webp: {320: url}}, srcset: {webp: "url 320w, ..."}}
+    Оригинал входит с собственной шириной только в набор своего формата (PNG - ни в один)
+    Формат без вариантов (изображение уже самой малой ширины) в srcset не попадает
+    '''
+    if not variants:
+        return None
+    urls: Dict[str, Dict[str, str]] = {fmt: {} for fmt in FORMATS}
+    for item in sorted(variants['items'], key=lambda item: item['width']):
+        urls[item['format']][str(item['width'])] = f"{base_url}/{item['key']}"
+    # Записи file_objects до появления поля format: формат оригинала неизвестен, оригинал не добавляется
+    original_format = variants.get('format')
+    srcset = {
+        fmt: ', '.join([f"{url} {width}w" for width, url in by_width.items()]
+                       + ([f"{original_url} {variants['width']}w"] if fmt == original_format else []))
+        for fmt, by_width in urls.items()
+        if by_width
+    }
+    return {
+        'width': variants['width'],
+        'height': variants['height'],
+        'variants': urls,
+        'srcset': srcset,
+    }
@@ -0,0 +1,265 @@
+import os
+import json
+import threading
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
+
+from common.grading import CompiledQuestion
+
+ANALYTICS_CHUNK_SIZE = int(os.environ.get('ANALYTICS_CHUNK_SIZE', '5000'))
+ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', '64'))
+# Доля лучших/худших попыток для индекса дискриминации (классические 27%)
+GROUP_SHARE = 0.27
+
+# Отпечаток данных теста: версия вопросов + последняя попытка + число попыток (удаления при сбросе прогресса)
+ANALYTICS_STAMP_QUERY = (
+    "SELECT t.updated_at, s.max_id, s.submissions FROM tests_v2 t, "
+    "LATERAL (SELECT MAX(id) AS max_id, COUNT(*) AS submissions FROM test_results WHERE test_id = t.id) s "
+    "WHERE t.id = %s"
+)
+ANALYTICS_QUESTIONS_QUERY = (
+    "SELECT id, type, text, options, correct_answer, points, matching_pairs FROM questions_v2 "
+    "WHERE test_id = %s ORDER BY \"order\""
+)
+ANALYTICS_CHUNK_QUERY = (
+    "SELECT id, answers FROM test_results WHERE test_id = %s AND id > %s AND id <= %s ORDER BY id LIMIT %s"
+)
+
+class QuestionColumn:
+    '''
+    Вопрос теста и его колонки в матрице попыток
+    single - индекс выбранного варианта (-1 нет ответа), multiple - матрица выбранных вариантов
+    '''
+    def __init__(self, row: tuple):
+        question_id, question_type, text, options, correct_answer, points, matching_pairs = row
+        self.compiled = CompiledQuestion(question_id, question_type, correct_answer, points, matching_pairs)
+        self.id = self.compiled.id
+        self.type = question_type
+        self.text = text
+        self.points = points
+        self.options = options if isinstance(options, list) else []
+        expected = self.compiled.expected
+        # Векторная проверка возможна, только если правильный ответ - корректные индексы вариантов
+        if self.type == 'single':
+            self.expected_index = _option_index(expected, len(self.options))
+            self.vectorized = self.expected_index >= 0
+        elif self.type == 'multiple':
+            indexes = [_option_index(value, len(self.options)) for value in expected or []]
+            self.vectorized = expected is not None and all(index >= 0 for index in indexes) \
+                and len(set(indexes)) == len(indexes)
+            self.expected_mask = np.zeros(len(self.options), dtype=bool)
+            if self.vectorized:
+                self.expected_mask[indexes] = True
+        else:
+            self.vectorized = False
+        self.choices: List[np.ndarray] = []
+        self.selected: List[np.ndarray] = []
+        self.valid: List[np.ndarray] = []
+        self.correct: List[np.ndarray] = []
+
+    def encode(self, answers: List[Dict[str, Any]]) -> None:
+        '''Добавляет колонки для пачки попыток'''
+        values = [answer.get(self.id) for answer in answers]
+        size = len(values)
+        option_count = len(self.options)
+        if self.type == 'single':
+            choices = np.fromiter((_option_index(value, option_count) for value in values),
+                                  dtype=np.int16, count=size)
+            self.choices.append(choices)
+            if self.vectorized:
+                self.correct.append(choices == self.expected_index)
+                return
+        elif self.type == 'multiple':
+            selected = np.zeros((size, option_count), dtype=bool)
+            valid = np.zeros(size, dtype=bool)
+            for row, value in enumerate(values):
+                if not isinstance(value, list):
+                    continue
+                indexes = [_option_index(item, option_count) for item in value]
+                hits = [index for index in indexes if index >= 0]
+                selected[row, hits] = True
+                valid[row] = len(hits) == len(indexes) and len(set(hits)) == len(hits)
+            self.selected.append(selected)
+            self.valid.append(valid)
+            if self.vectorized:
+                self.correct.append(valid & (selected == self.expected_mask).all(axis=1))
+                return
+        self.correct.append(np.fromiter((self.compiled.is_correct(value) for value in values),
+                                        dtype=bool, count=size))
+
+    def option_stats(self, upper: np.ndarray, lower: np.ndarray) -> Optional[List[Dict[str, Any]]]:
+        '''Частоты выбора вариантов (дистракторов) во всей выборке и в группах лучших/худших'''
+        option_count = len(self.options)
+        if self.type == 'single' and self.choices:
+            choices = np.concatenate(self.choices)
+            picked = np.zeros((len(choices), option_count), dtype=bool)
+            answered = choices >= 0
+            picked[np.nonzero(answered)[0], choices[answered]] = True
+            correct_mask = np.arange(option_count) == self.expected_index
+        elif self.type == 'multiple' and self.selected:
+            picked = np.concatenate(self.selected)
+            correct_mask = self.expected_mask
+        else:
+            return None
+        counts = picked.sum(axis=0)
+        shares = picked.mean(axis=0) if len(picked) else np.zeros(option_count)
+        upper_shares = picked[upper].mean(axis=0) if len(upper) else np.zeros(option_count)
+        lower_shares = picked[lower].mean(axis=0) if len(lower) else np.zeros(option_count)
+        return [
+            {
+                'index': index,
+                'text': self.options[index],
+                'isCorrect': bool(correct_mask[index]),
+                'count': int(counts[index]),
+                'share': _round(shares[index]),
+                'upperShare': _round(upper_shares[index]),
+                'lowerShare': _round(lower_shares[index]),
+            }
+            for index in range(option_count)
+        ]
+
+    def no_answer_count(self) -> Optional[int]:
+        if self.type == 'single' and self.choices:
+            return int((np.concatenate(self.choices) < 0).sum())
+        if self.type == 'multiple' and self.selected:
+            return int((~np.concatenate(self.selected).any(axis=1)).sum())
+        return None
+
+def _option_index(value: Any, option_count: int) -> int:
+    '''Индекс варианта ответа или -1 (так же, как сравнение == при проверке: 1, 1.0 и True равны)'''
+    if isinstance(value, (int, float)) and float(value).is_integer() and 0 <= value < option_count:
+        return int(value)
+    return -1
+
+def _round(value: Any) -> Optional[float]:
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), 4)
+
+def _load_answers(raw: Any) -> Dict[str, Any]:
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    return raw if isinstance(raw, dict) else {}
+
+def analyze_test(cur, test_id: int, max_id: int, chunk_size: int = ANALYTICS_CHUNK_SIZE) -> Dict[str, Any]:
+    '''
+    Психометрический анализ заданий теста по всем сохраненным попыткам
+    Ответы проверяются актуальным ключом, поэтому статистика не зависит от устаревших results
+    Попытки читаются пачками по id и сразу кодируются в компактные массивы NumPy
+    Args:
+        max_id - последняя учитываемая попытка (отпечаток кэша)
+    Returns: сводка по тесту и статистика по каждому вопросу
+    '''
+    cur.execute(ANALYTICS_QUESTIONS_QUERY, (test_id,))
+    columns = [QuestionColumn(row) for row in cur.fetchall()]
+
+    last_id = 0
+    while True:
+        cur.execute(ANALYTICS_CHUNK_QUERY, (test_id, last_id, max_id or 0, chunk_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        answers = [_load_answers(row[1]) for row in rows]
+        for column in columns:
+            column.encode(answers)
+        if len(rows) < chunk_size:
+            break
+
+    points = np.array([column.points for column in columns], dtype=np.float64)
+    if columns and columns[0].correct:
+        correct = np.column_stack([np.concatenate(column.correct) for column in columns]).astype(np.float64)
+    else:
+        correct = np.zeros((0, len(columns)), dtype=np.float64)
+    submissions = correct.shape[0]
+
+    item_scores = correct * points
+    totals = item_scores.sum(axis=1)
+    max_points = points.sum()
+    percent = totals / max_points * 100 if max_points > 0 else np.zeros(submissions)
+
+    # Группы 27% лучших и худших попыток по сумме баллов
+    order = np.argsort(totals, kind='stable')
+    group_size = max(1, int(round(submissions * GROUP_SHARE))) if submissions else 0
+    lower = order[:group_size]
+    upper = order[submissions - group_size:] if group_size else order[:0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        difficulty = correct.mean(axis=0) if submissions else np.full(len(columns), np.nan)
+        # Точечно-бисериальная корреляция задания с суммой баллов остальных заданий
+        rest = totals[:, None] - item_scores
+        centered_items = correct - correct.mean(axis=0)
+        centered_rest = rest - rest.mean(axis=0)
+        point_biserial = (centered_items * centered_rest).sum(axis=0) / np.sqrt(
+            (centered_items ** 2).sum(axis=0) * (centered_rest ** 2).sum(axis=0)
+        )
+        discrimination_index = correct[upper].mean(axis=0) - correct[lower].mean(axis=0) \
+            if group_size else np.full(len(columns), np.nan)
+        # Альфа Кронбаха (для заданий 0/1 совпадает с KR-20)
+        alpha = np.nan
+        if len(columns) > 1 and submissions > 1:
+            total_variance = totals.var(ddof=1)
+            if total_variance > 0:
+                alpha = len(columns) / (len(columns) - 1) * (1 - item_scores.var(axis=0, ddof=1).sum() / total_variance)
+
+    questions = []
+    for index, column in enumerate(columns):
+        questions.append({
+            'questionId': column.id,
+            'type': column.type,
+            'text': column.text,
+            'points': column.points,
+            'difficulty': _round(difficulty[index]),
+            'pointBiserial': _round(point_biserial[index]),
+            'discriminationIndex': _round(discrimination_index[index]),
+            'noAnswer': column.no_answer_count(),
+            'options': column.option_stats(upper, lower),
+        })
+
+    return {
+        'testId': test_id,
+        'submissions': submissions,
+        'lastSubmissionId': max_id,
+        'meanScore': _round(percent.mean()) if submissions else None,
+        'stdScore': _round(percent.std()) if submissions else None,
+        'reliability': _round(alpha),
+        'groupSize': group_size,
+        'questions': questions,
+        'computedAt': datetime.utcnow().isoformat(),
+    }
+
+class AnalyticsCache:
+    '''
+    Кэш отчетов в памяти процесса по отпечатку (updated_at теста, последняя попытка, число попыток)
+    Пока новых попыток и правок вопросов нет, отчет отдается без чтения test_results
+    '''
+    def __init__(self, max_size: int = ANALYTICS_CACHE_SIZE):
+        self.max_size = max_size
+        self._reports: 'OrderedDict[int, Tuple[tuple, Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cur, test_id: int) -> Tuple[Optional[Dict[str, Any]], bool]:
+        '''Returns: (отчет или None если теста нет, взят ли отчет из кэша)'''
+        cur.execute(ANALYTICS_STAMP_QUERY, (test_id,))
+        stamp_row = cur.fetchone()
+        if not stamp_row:
+            with self._lock:
+                self._reports.pop(test_id, None)
+            return None, False
+        stamp = tuple(stamp_row)
+
+        with self._lock:
+            cached = self._reports.get(test_id)
+            if cached is not None and cached[0] == stamp:
+                self._reports.move_to_end(test_id)
+                return cached[1], True
+
+        report = analyze_test(cur, test_id, stamp_row[1] or 0)
+        with self._lock:
+            self._reports[test_id] = (stamp, report)
+            self._reports.move_to_end(test_id)
+            while len(self._reports) > self.max_size:
+                self._reports.popitem(last=False)
+        return report, False
@@ -1,9 +1,121 @@
+import os
 import json
+import threading
 import psycopg2
-from typing import Optional, Dict, Any
+import psycopg2.extras
+from typing import Optional, Dict, Any, List, Tuple
+
+from common.db import get_db_connection, at_invocation_end, in_invocation
+
+# Записей в одном INSERT при сбросе буфера в конце вызова
+LOG_BUFFER_MAX_SIZE = int(os.environ.get('LOG_BUFFER_MAX_SIZE', '200'))
+
+LogEntry = Tuple[str, str, str, Optional[int], Optional[str], Optional[str], Optional[str]]
+
+INSERT_LOGS_SQL = (
+    "INSERT INTO system_logs (level, action, message, user_id, ip_address, user_agent, details) VALUES %s"
+)
+INSERT_LOG_SQL = INSERT_LOGS_SQL % "(%s, %s, %s, %s, %s, %s, %s)"
+
+class LogBuffer:
+    '''
+    Буфер записей system_logs на время одного вызова функции
+    Записи копятся в памяти и сохраняются в конце вызова (at_invocation_end), когда соединения
+    обработчика уже возвращены в пул: запись журнала не ждет свободного слота, пока обработчик
+    держит свое соединение, и не затрагивает его транзакцию
+    Args:
+        max_size - сколько записей в одном многострочном INSERT
+    '''
+    def __init__(self, max_size: int = LOG_BUFFER_MAX_SIZE):
+        self.max_size = max_size
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _count_dropped(self, count: int) -> None:
+        if count:
+            with self._dropped_lock:
+                self.dropped += count
+
+    def _take_dropped(self) -> int:
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def _entries(self) -> List[LogEntry]:
+        entries = getattr(self._local, 'entries', None)
+        if entries is None:
+            entries = []
+            self._local.entries = entries
+        return entries
+
+    def add(self, entry: LogEntry) -> None:
+        # Вне обработчика сбросить буфер некому - пишем сразу
+        if not in_invocation():
+            self._count_dropped(1 - self._write([entry]))
+            return
+        self._entries().append(entry)
+
+    def flush(self) -> None:
+        '''Сохраняет накопленные записи текущего потока'''
+        entries = self._entries()
+        self._local.entries = []
+        dropped = self._take_dropped()
+        if dropped:
+            entries.append((
+                'warning', 'system.log_overflow', f'Потеряно записей журнала: {dropped}',
+                None, None, None, json.dumps({'dropped': dropped})
+            ))
+        if not entries:
+            return
+        written = self._write(entries)
+        # Несохраненные записи учитываются и попадут в следующую запись system.log_overflow
+        self._count_dropped(len(entries) - written)
+
+    def _write(self, entries: List[LogEntry]) -> int:
+        '''Пишет записи INSERT по max_size строк в одном соединении. Возвращает число записанных'''
+        try:
+            conn = get_db_connection()
+        except Exception as e:
+            print(f"[WARNING] Failed to write {len(entries)} log entries: {e}")
+            return 0
+        try:
+            return sum(
+                self._write_batch(conn, entries[offset:offset + self.max_size])
+                for offset in range(0, len(entries), self.max_size)
+            )
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn, entries: List[LogEntry]) -> int:
+        '''Одна пачка одним INSERT, при ошибке - по одной записи'''
+        try:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(cur, INSERT_LOGS_SQL, entries, page_size=len(entries))
+            conn.commit()
+            return len(entries)
+        except Exception as e:
+            print(f"[WARNING] Failed to write {len(entries)} log entries in batch: {e}")
+            if conn.closed:
+                return 0
+            conn.rollback()
+            written = 0
+            # Синхронный резервный путь: одна плохая запись не должна терять весь пакет
+            for entry in entries:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(INSERT_LOG_SQL, entry)
+                    conn.commit()
+                    written += 1
+                except Exception as entry_error:
+                    conn.rollback()
+                    print(f"[WARNING] Failed to create log: {entry_error}")
+            return written
+
+_buffer = LogBuffer()
+at_invocation_end(_buffer.flush)
 
 def log_action(
-    conn: psycopg2.extensions.connection,
     level: str,
     action: str,
     message: str,
@@ -13,9 +125,8 @@ def log_action(
     details: Optional[Dict[str, Any]] = None
 ) -> None:
     '''
-    Создает запись в system_logs
+    Добавляет запись в system_logs (сохраняется в конце вызова обработчика)
     Args:
-        conn - psycopg2 connection
         level - 'info', 'success', 'warning', 'error'
         action - тип действия (например 'user.login', 'course.create')
         message - текстовое описание
@@ -24,24 +135,19 @@ def log_action(
         user_agent - User-Agent (опционально)
         details - дополнительная информация в JSON (опционально)
     '''
-    try:
-        with conn.cursor() as cur:
-            cur.execute('''
-                INSERT INTO system_logs 
-                (level, action, message, user_id, ip_address, user_agent, details)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (
-                level, 
-                action, 
-                message, 
-                user_id, 
-                ip_address, 
-                user_agent,
-                json.dumps(details) if details else None
-            ))
-            conn.commit()
-    except Exception as e:
-        print(f"[WARNING] Failed to create log: {e}")
+    _buffer.add((
+        level,
+        action,
+        message,
+        user_id,
+        ip_address,
+        user_agent,
+        json.dumps(details) if details else None
+    ))
+
+def flush_logs() -> None:
+    '''Принудительно сохраняет буфер (обычно вызывается автоматически pooled_handler)'''
+    _buffer.flush()
 
 def get_client_ip(event: Dict[str, Any]) -> Optional[str]:
     '''Извлекает IP адрес клиента из event'''
@@ -0,0 +1,63 @@
+import json
+import base64
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 500
+
+def wants_page(query_params: Dict[str, Any]) -> bool:
+    '''Постраничный режим включается параметром limit или cursor'''
+    return 'limit' in query_params or 'cursor' in query_params
+
+def encode_cursor(values: List[Any]) -> str:
+    '''Непрозрачный курсор: ключ сортировки последней строки страницы'''
+    raw = json.dumps(values, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError('Неверный cursor')
+    if not isinstance(values, list):
+        raise ValueError('Неверный cursor')
+    return values
+
+def parse_page(query_params: Dict[str, Any], key_size: int,
+               default_limit: int = DEFAULT_PAGE_LIMIT) -> Tuple[int, Optional[List[Any]]]:
+    '''
+    Разбирает limit и cursor из query string
+    Args:
+        key_size - число значений в ключе сортировки (для проверки курсора)
+    Returns: (limit, значения ключа после которых начинается страница или None)
+    Raises: ValueError при неверных параметрах
+    '''
+    try:
+        limit = int(query_params.get('limit') or default_limit)
+    except ValueError:
+        raise ValueError('limit должен быть числом')
+    if limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise ValueError(f'limit должен быть от 1 до {MAX_PAGE_LIMIT}')
+    cursor = query_params.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None and len(after) != key_size:
+        raise ValueError('Неверный cursor')
+    return limit, after
+
+def split_page(rows: List[tuple], limit: int, key: Callable[[tuple], List[Any]]) -> Tuple[List[tuple], Optional[str]]:
+    '''Запрос выбирает limit + 1 строк: лишняя строка означает, что есть следующая страница'''
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(key(page[-1]))
+
+def parse_bool(value: Optional[str]) -> Optional[bool]:
+    '''Фильтр true/false из query string (None - фильтр не задан)'''
+    if value is None or value == '':
+        return None
+    if value.lower() in ('true', '1'):
+        return True
+    if value.lower() in ('false', '0'):
+        return False
+    raise ValueError(f'Ожидается true или false: {value}')
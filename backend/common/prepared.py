@@ -0,0 +1,81 @@
+import os
+import re
+import psycopg2
+import psycopg2.errors
+from typing import Dict, Any, Optional, List, Tuple, Sequence, Union
+
+# Отключается (=0), если база стоит за пулером в режиме транзакций, где PREPARE не переживает запрос
+PREPARED_ENABLED = os.environ.get('DB_PREPARED_STATEMENTS', '1') == '1'
+
+_PLACEHOLDER = re.compile(r'%\((\w+)\)s')
+
+class Statement:
+    '''
+    Запрос из реестра: SQL с именованными параметрами %(name)s,
+    который на каждом соединении один раз готовится через PREPARE
+    Args:
+        name - имя подготовленного оператора (уникально в реестре)
+        sql - текст запроса с %(name)s
+        types - типы параметров в порядке первого появления (если вывод типов Postgres не подходит)
+    '''
+    def __init__(self, name: str, sql: str, types: Optional[Sequence[str]] = None):
+        self.name = name
+        self.sql = sql
+        self.params: List[str] = []
+        for param in _PLACEHOLDER.findall(sql):
+            if param not in self.params:
+                self.params.append(param)
+        if types is not None and len(types) != len(self.params):
+            raise ValueError(f'{name}: ожидается {len(self.params)} типов параметров')
+        positional = _PLACEHOLDER.sub(lambda match: f'${self.params.index(match.group(1)) + 1}', sql)
+        # PREPARE выполняется без параметров, поэтому %% из текста запроса становится обычным %
+        positional = positional.replace('%%', '%')
+        type_list = f" ({', '.join(types)})" if types else ''
+        self.prepare_sql = f'PREPARE {name}{type_list} AS {positional}'
+        placeholders = ', '.join(['%s'] * len(self.params))
+        self.execute_sql = f'EXECUTE {name} ({placeholders})' if self.params else f'EXECUTE {name}'
+
+    def bind(self, values: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(values[param] for param in self.params)
+
+STATEMENTS: Dict[str, Statement] = {}
+
+def register_statement(name: str, sql: str, types: Optional[Sequence[str]] = None) -> Statement:
+    '''Добавляет запрос в реестр (повторная регистрация с тем же текстом допускается при перезагрузке модуля)'''
+    existing = STATEMENTS.get(name)
+    if existing is not None and existing.sql != sql:
+        raise ValueError(f'Подготовленный оператор {name} уже зарегистрирован с другим текстом')
+    statement = Statement(name, sql, types)
+    STATEMENTS[name] = statement
+    return statement
+
+def _prepared_on(conn) -> Optional[set]:
+    '''Имена операторов, уже подготовленных на соединении (None - соединение не поддерживает учет)'''
+    prepared = getattr(conn, '_prepared_statements', None)
+    if prepared is None:
+        try:
+            conn._prepared_statements = prepared = set()
+        except AttributeError:
+            return None
+    return prepared
+
+def execute_prepared(cur, statement: Union[Statement, str], values: Dict[str, Any]) -> None:
+    '''
+    Выполняет запрос из реестра: PREPARE при первом использовании на соединении, затем EXECUTE
+    Без поддержки (DB_PREPARED_STATEMENTS=0 или обычное соединение) - обычный параметризованный запрос
+    '''
+    if isinstance(statement, str):
+        statement = STATEMENTS[statement]
+    prepared = _prepared_on(cur.connection) if PREPARED_ENABLED else None
+    if prepared is None:
+        cur.execute(statement.sql, values)
+        return
+    if statement.name not in prepared:
+        cur.execute(statement.prepare_sql)
+        prepared.add(statement.name)
+    try:
+        cur.execute(statement.execute_sql, statement.bind(values))
+    except psycopg2.errors.InvalidSqlStatementName:
+        # Сервер потерял подготовленные операторы (DISCARD ALL / пулер) - подготовим заново в следующий раз
+        prepared.clear()
+        raise
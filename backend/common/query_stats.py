@@ -0,0 +1,140 @@
+import os
+import re
+import json
+import time
+import threading
+import psycopg2.extensions
+from typing import Dict, Any, Optional, List
+
+NPLUSONE_THRESHOLD = int(os.environ.get('DB_NPLUSONE_THRESHOLD', '5'))
+QUERY_LOG_ENABLED = os.environ.get('DB_QUERY_LOG', '1') == '1'
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+def statement_shape(query: Any) -> str:
+    '''
+    Форма запроса без значений: литералы и параметры заменяются на ?,
+    поэтому одинаковые запросы с разными id (N+1) получают одну форму
+    '''
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        query = str(query)
+    shape = _STRING_LITERAL.sub('?', query)
+    shape = shape.replace('%s', '?')
+    shape = re.sub(r'%\(\w+\)s', '?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+class InvocationStats:
+    '''Статистика запросов одного вызова функции'''
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.rows = 0
+        self.db_ms = 0.0
+        self.by_shape: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, query: Any, elapsed_ms: float, rows: int) -> None:
+        self.queries += 1
+        self.db_ms += elapsed_ms
+        if rows > 0:
+            self.rows += rows
+        shape = statement_shape(query)
+        entry = self.by_shape.get(shape)
+        if entry is None:
+            entry = {'count': 0, 'ms': 0.0, 'rows': 0}
+            self.by_shape[shape] = entry
+        entry['count'] += 1
+        entry['ms'] += elapsed_ms
+        entry['rows'] += max(rows, 0)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def repeated_statements(self, threshold: int = NPLUSONE_THRESHOLD) -> List[Dict[str, Any]]:
+        '''Формы запросов, выполненные больше threshold раз (вероятный N+1)'''
+        return [
+            {'statement': shape[:200], 'count': entry['count'], 'ms': round(entry['ms'], 2)}
+            for shape, entry in self.by_shape.items() if entry['count'] > threshold
+        ]
+
+    def server_timing(self) -> str:
+        '''Значение заголовка Server-Timing: db - время в базе, app - весь вызов'''
+        parts = [
+            f'db;dur={self.db_ms:.2f};desc="{self.queries} queries, {self.rows} rows"',
+            f'app;dur={self.total_ms():.2f}',
+        ]
+        repeated = self.repeated_statements()
+        if repeated:
+            parts.append(f'nplus1;desc="{len(repeated)} repeated statement(s)"')
+        return ', '.join(parts)
+
+    def as_log(self, function_name: str, event: Dict[str, Any], status: Optional[int]) -> Dict[str, Any]:
+        slowest = sorted(self.by_shape.items(), key=lambda item: item[1]['ms'], reverse=True)[:3]
+        repeated = self.repeated_statements()
+        return {
+            'level': 'warning' if repeated else 'info',
+            'type': 'invocation',
+            'function': function_name,
+            'method': event.get('httpMethod'),
+            'action': (event.get('queryStringParameters') or {}).get('action'),
+            'status': status,
+            'durationMs': round(self.total_ms(), 2),
+            'dbMs': round(self.db_ms, 2),
+            'queries': self.queries,
+            'rows': self.rows,
+            'slowest': [
+                {'statement': shape[:200], 'count': entry['count'], 'ms': round(entry['ms'], 2)}
+                for shape, entry in slowest
+            ],
+            'nPlusOne': repeated,
+        }
+
+_local = threading.local()
+
+def current_stats() -> InvocationStats:
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        stats = InvocationStats()
+        _local.stats = stats
+    return stats
+
+def start_stats() -> InvocationStats:
+    _local.stats = InvocationStats()
+    return _local.stats
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    '''Курсор, записывающий время, число строк и форму каждого запроса в статистику вызова'''
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            current_stats().record(query, (time.perf_counter() - started) * 1000, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            current_stats().record(query, (time.perf_counter() - started) * 1000, self.rowcount)
+
+def finish_invocation(function_name: str, event: Dict[str, Any], response: Any) -> None:
+    '''Добавляет Server-Timing в ответ и печатает одну структурированную строку со статистикой'''
+    stats = current_stats()
+    status = None
+    if isinstance(response, dict):
+        status = response.get('statusCode')
+        headers = response.get('headers')
+        if headers is None:
+            headers = {}
+            response['headers'] = headers
+        headers['Server-Timing'] = stats.server_timing()
+        headers.setdefault('Timing-Allow-Origin', '*')
+    if QUERY_LOG_ENABLED:
+        print(json.dumps(stats.as_log(function_name, event, status), ensure_ascii=False))
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import psycopg2.extras
+from typing import Dict, Any, Optional, List, Tuple
+
+from common.grading import AnswerKey
+
+REGRADE_BATCH_SIZE = int(os.environ.get('REGRADE_BATCH_SIZE', '2000'))
+REGRADE_MAX_SECONDS = float(os.environ.get('REGRADE_MAX_SECONDS', '20'))
+
+# Keyset по (test_id, id): каждая пачка - короткий индексный проход, память не растет с числом попыток
+SELECT_BATCH_SQL = (
+    "SELECT id, user_id, lesson_id, course_id, score, passed, answers, earned_points, total_points, results "
+    "FROM test_results "
+    "WHERE test_id = %s AND id > %s ORDER BY id LIMIT %s"
+)
+
+UPDATE_RESULTS_SQL = (
+    "UPDATE test_results t SET score = v.score, earned_points = v.earned_points, "
+    "total_points = v.total_points, passed = v.passed, results = v.results::jsonb "
+    "FROM (VALUES %s) AS v(id, score, earned_points, total_points, passed, results) "
+    "WHERE t.id = v.id"
+)
+
+INSERT_COMPLETIONS_SQL = (
+    "INSERT INTO lesson_completions (user_id, course_id, lesson_id) VALUES %s "
+    "ON CONFLICT (user_id, lesson_id) DO NOTHING RETURNING user_id, course_id, lesson_id"
+)
+
+ENSURE_PROGRESS_SQL = (
+    "INSERT INTO course_progress_v2 (course_id, user_id, completed_lessons, total_lessons, "
+    "completed, started_at, created_at, updated_at) "
+    "SELECT v.course_id, v.user_id, 0, c.lessons_count, false, NOW(), NOW(), NOW() "
+    "FROM (VALUES %s) AS v(user_id, course_id) JOIN courses_v2 c ON c.id = v.course_id "
+    "ON CONFLICT (course_id, user_id) DO NOTHING"
+)
+
+# Те же выражения, что и в progress ?action=complete, но для пачки пользователей за один UPDATE:
+# счетчик увеличивается на число впервые засчитанных уроков
+UPDATE_PROGRESS_SQL = (
+    "UPDATE course_progress_v2 cp SET "
+    "completed_lessons = COALESCE(cp.completed_lessons, 0) + v.added, "
+    "total_lessons = c.lessons_count, "
+    "completed = COALESCE(cp.completed_lessons, 0) + v.added >= c.lessons_count, "
+    "completed_at = CASE WHEN COALESCE(cp.completed_lessons, 0) + v.added >= c.lessons_count "
+    "THEN COALESCE(cp.completed_at, NOW()) ELSE NULL END, "
+    "updated_at = NOW() "
+    "FROM (VALUES %s) AS v(user_id, course_id, added) JOIN courses_v2 c ON c.id = v.course_id "
+    "WHERE cp.user_id = v.user_id AND cp.course_id = v.course_id "
+    "RETURNING cp.id, cp.completed AND cp.completed_at = NOW()"
+)
+
+GRANT_REWARDS_SQL = (
+    "UPDATE course_progress_v2 cp SET earned_rewards = COALESCE(cp.earned_rewards, '[]'::jsonb) || COALESCE(("
+    "    SELECT jsonb_agg(r.id) FROM rewards_v2 r WHERE r.course_id = cp.course_id "
+    "    AND NOT COALESCE(cp.earned_rewards, '[]'::jsonb) @> jsonb_build_array(r.id)"
+    "), '[]'::jsonb) "
+    "WHERE cp.id = ANY(%s)"
+)
+
+def _load_answers(raw: Any) -> Dict[str, Any]:
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    return raw if isinstance(raw, dict) else {}
+
+def _load_results(raw: Any) -> Any:
+    return json.loads(raw) if isinstance(raw, str) else raw
+
+def is_stale(row: Tuple, graded: Dict[str, Any]) -> bool:
+    '''Сохраненный результат отличается от перепроверки: балл, зачет, баллы или ответы по вопросам'''
+    old_score, old_passed, old_earned, old_total, old_results = row[4], row[5], row[7], row[8], row[9]
+    return (
+        graded['score'] != old_score
+        or graded['passed'] != old_passed
+        or graded['earnedPoints'] != old_earned
+        or graded['totalPoints'] != old_total
+        or graded['results'] != _load_results(old_results)
+    )
+
+def regrade_test(conn, key: AnswerKey, after_id: int = 0, batch_size: int = REGRADE_BATCH_SIZE,
+                 max_seconds: Optional[float] = REGRADE_MAX_SECONDS) -> Dict[str, Any]:
+    '''
+    Перепроверяет сохраненные ответы test_results по актуальному ключу ответов
+    Строки читаются пачками по id; в базу пишутся результаты, в которых изменилось хоть что-то
+    (балл, зачет, баллы или results по вопросам), каждая пачка фиксируется отдельной транзакцией
+    Если результат стал зачтенным - урок засчитывается и пересчитывается прогресс курса
+    (ранее засчитанные уроки не отзываются)
+    Args:
+        after_id - продолжить с попытки после этого id (nextAfterId прошлого запуска)
+        max_seconds - бюджет времени, после которого возвращается nextAfterId
+    Returns: статистика и пропускная способность
+    '''
+    started = time.perf_counter()
+    stats = {
+        'testId': key.test_id,
+        'processed': 0,
+        'changed': 0,
+        'newlyPassed': 0,
+        'newlyFailed': 0,
+        'lessonsCompleted': 0,
+        'coursesCompleted': 0,
+        'batches': 0,
+        'done': False,
+        'nextAfterId': None,
+    }
+    last_id = after_id
+    cur = conn.cursor()
+    while True:
+        cur.execute(SELECT_BATCH_SQL, (key.test_id, last_id, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            stats['done'] = True
+            break
+        last_id = rows[-1][0]
+
+        updates: List[Tuple] = []
+        passed_now: Dict[Tuple[int, int], int] = {}
+        for row in rows:
+            graded = key.grade(_load_answers(row[6]))
+            result_id, user_id, lesson_id, course_id, old_passed = row[0], row[1], row[2], row[3], row[5]
+            if is_stale(row, graded):
+                updates.append((
+                    result_id, graded['score'], graded['earnedPoints'], graded['totalPoints'],
+                    graded['passed'], json.dumps(graded['results'])
+                ))
+                if graded['passed'] and not old_passed:
+                    stats['newlyPassed'] += 1
+                    if str(lesson_id).isdigit():
+                        passed_now[(user_id, int(lesson_id))] = course_id
+                elif old_passed and not graded['passed']:
+                    stats['newlyFailed'] += 1
+
+        if updates:
+            psycopg2.extras.execute_values(cur, UPDATE_RESULTS_SQL, updates, page_size=len(updates))
+            stats['changed'] += len(updates)
+        if passed_now:
+            complete_lessons(cur, passed_now, stats)
+        conn.commit()
+
+        stats['processed'] += len(rows)
+        stats['batches'] += 1
+        if len(rows) < batch_size:
+            stats['done'] = True
+            break
+        if max_seconds is not None and time.perf_counter() - started >= max_seconds:
+            stats['nextAfterId'] = last_id
+            break
+    cur.close()
+
+    duration = time.perf_counter() - started
+    stats['durationMs'] = round(duration * 1000, 2)
+    stats['rowsPerSecond'] = round(stats['processed'] / duration) if duration > 0 else 0
+    return stats
+
+def complete_lessons(cur, passed_now: Dict[Tuple[int, int], int], stats: Dict[str, Any]) -> None:
+    '''Засчитывает уроки с новым проходным результатом и обновляет прогресс курсов пачкой'''
+    completions = [(user_id, course_id, lesson_id) for (user_id, lesson_id), course_id in passed_now.items()]
+    inserted = psycopg2.extras.execute_values(cur, INSERT_COMPLETIONS_SQL, completions,
+                                              page_size=len(completions), fetch=True)
+    if not inserted:
+        return
+    stats['lessonsCompleted'] += len(inserted)
+
+    added: Dict[Tuple[int, int], int] = {}
+    for user_id, course_id, lesson_id in inserted:
+        added[(user_id, course_id)] = added.get((user_id, course_id), 0) + 1
+    psycopg2.extras.execute_values(cur, ENSURE_PROGRESS_SQL, list(added.keys()), page_size=len(added))
+    progress = psycopg2.extras.execute_values(
+        cur, UPDATE_PROGRESS_SQL,
+        [(user_id, course_id, count) for (user_id, course_id), count in added.items()],
+        page_size=len(added), fetch=True
+    )
+    # Курс завершен именно этой перепроверкой - completed_at проставлен в текущей транзакции
+    completed_ids = [progress_id for progress_id, newly_completed in progress if newly_completed]
+    if completed_ids:
+        cur.execute(GRANT_REWARDS_SQL, (completed_ids,))
+        stats['coursesCompleted'] += len(completed_ids)
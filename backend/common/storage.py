@@ -0,0 +1,255 @@
+'''
+Общий клиент объектного хранилища для функций
+Клиент boto3 создается один раз на теплый контейнер: загрузка моделей botocore и TLS соединение
+не повторяются на каждом вызове, соединения к хранилищу переиспользуются из пула.
+
+STORAGE_BACKEND=local - вместо S3 объекты читаются и пишутся в каталог STORAGE_LOCAL_DIR
+(тот же формат, что у backend/local/fs_s3.py), без сети: для бенчмарков и офлайн запуска.
+'''
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Iterator
+from urllib.parse import urlencode, quote
+from xml.etree import ElementTree
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 's3')
+# Потоки image_variants, параллельные части и удаление пачками делят один пул соединений
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', '20'))
+S3_CONNECT_TIMEOUT = float(os.environ.get('S3_CONNECT_TIMEOUT', '3'))
+S3_READ_TIMEOUT = float(os.environ.get('S3_READ_TIMEOUT', '30'))
+# standard: повтор с экспоненциальной задержкой на 5xx, таймаутах и throttling
+S3_MAX_ATTEMPTS = int(os.environ.get('S3_MAX_ATTEMPTS', '3'))
+S3_RETRY_MODE = os.environ.get('S3_RETRY_MODE', 'standard')
+# delete_objects S3 принимает не больше 1000 ключей за вызов
+DELETE_BATCH_SIZE = 1000
+
+_client = None
+_client_lock = threading.Lock()
+
+def client_config() -> Config:
+    # s3v4: presigned URL для PUT и частей multipart подписываются вместе с Content-Type
+    return Config(
+        signature_version='s3v4',
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=S3_CONNECT_TIMEOUT,
+        read_timeout=S3_READ_TIMEOUT,
+        retries={'max_attempts': S3_MAX_ATTEMPTS, 'mode': S3_RETRY_MODE},
+        tcp_keepalive=True,
+    )
+
+def create_s3_client():
+    '''Новый клиент; в функциях нужен get_s3_client'''
+    if STORAGE_BACKEND == 'local':
+        return LocalStorageClient(os.environ.get('STORAGE_LOCAL_DIR', '.local-s3'))
+    return boto3.client('s3',
+        endpoint_url=os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev'),
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+        config=client_config(),
+    )
+
+def get_s3_client():
+    '''Клиент хранилища, общий для всех вызовов контейнера (клиент boto3 потокобезопасен)'''
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_s3_client()
+    return _client
+
+def reset_s3_client() -> None:
+    '''Сбрасывает общий клиент (смена переменных окружения в бенчмарках)'''
+    global _client
+    with _client_lock:
+        _client = None
+
+def delete_keys(s3, bucket: str, keys: List[str]) -> Dict[str, Any]:
+    '''
+    Удаляет объекты пачками delete_objects по DELETE_BATCH_SIZE ключей (вместо delete_object на каждый)
+    Returns: {deleted: [ключи], errors: [{key, code, message}]}
+    '''
+    deleted: List[str] = []
+    errors: List[Dict[str, str]] = []
+    for offset in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[offset:offset + DELETE_BATCH_SIZE]
+        response = s3.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+        )
+        failed = {error['Key']: error for error in response.get('Errors', [])}
+        deleted.extend(key for key in batch if key not in failed)
+        errors.extend(
+            {'key': key, 'code': error.get('Code', ''), 'message': error.get('Message', '')}
+            for key, error in failed.items()
+        )
+    return {'deleted': deleted, 'errors': errors}
+
+class LocalBody:
+    '''Тело ответа get_object: read() и iter_chunks() как у botocore StreamingBody'''
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+
+    def read(self, amount: Optional[int] = None) -> bytes:
+        end = len(self.data) if amount is None else min(len(self.data), self.position + amount)
+        chunk = self.data[self.position:end]
+        self.position = end
+        return chunk
+
+    def iter_chunks(self, chunk_size: int = 1024) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+class LocalPaginator:
+    def __init__(self, storage, page_size: int = 1000):
+        self.storage = storage
+        self.page_size = page_size
+
+    def paginate(self, Bucket: str, Prefix: str = '', PaginationConfig: Optional[Dict[str, Any]] = None):
+        page_size = (PaginationConfig or {}).get('PageSize') or self.page_size
+        keys = self.storage.list_keys(Bucket, Prefix)
+        for offset in range(0, len(keys), page_size):
+            yield {
+                'Contents': [
+                    {
+                        'Key': key,
+                        'Size': size,
+                        'LastModified': datetime.fromtimestamp(mtime, timezone.utc),
+                        'ETag': f"\"{self.storage._read_meta(Bucket, key).get('etag', '')}\"",
+                    }
+                    for key, size, mtime in keys[offset:offset + page_size]
+                ],
+                'KeyCount': len(keys[offset:offset + page_size]),
+                'IsTruncated': offset + page_size < len(keys),
+            }
+
+class LocalStorageClient:
+    '''
+    Подмножество API клиента boto3 S3 поверх каталога (FilesystemS3 из backend/local/fs_s3.py)
+    Ошибки - botocore ClientError с теми же кодами, что у S3 (NoSuchKey, 404, NoSuchUpload)
+    presigned URL указывают на S3_ENDPOINT_URL: их обслуживает локальный сервер с тем же каталогом
+    '''
+    def __init__(self, root: str):
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'local'))
+        from fs_s3 import FilesystemS3
+        self.storage = FilesystemS3(root)
+        self.endpoint_url = os.environ.get('S3_ENDPOINT_URL', 'http://127.0.0.1:8000/_s3').rstrip('/')
+
+    def _call(self, operation: str, method: str, bucket: str, key: str, query: str = '',
+              headers: Optional[Dict[str, str]] = None, body: bytes = b''):
+        status, response_headers, data = self.storage.handle(method, bucket, key, query, headers or {}, body)
+        if status >= 400:
+            code, message = str(status), ''
+            if data:
+                root = ElementTree.fromstring(data)
+                code = root.findtext('Code') or code
+                message = root.findtext('Message') or ''
+            raise ClientError({'Error': {'Code': code, 'Message': message},
+                               'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+        return response_headers, data
+
+    @staticmethod
+    def _xml_field(data: bytes, field: str) -> Optional[str]:
+        for element in ElementTree.fromstring(data).iter():
+            if element.tag.split('}')[-1] == field:
+                return element.text
+        return None
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes = b'', ContentType: Optional[str] = None, **kwargs):
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        headers = {'content-type': ContentType or ''}
+        if kwargs.get('ChecksumSHA256'):
+            headers['x-amz-checksum-sha256'] = kwargs['ChecksumSHA256']
+        response_headers, _ = self._call('PutObject', 'PUT', Bucket, Key, headers=headers, body=Body)
+        return {'ETag': response_headers['ETag']}
+
+    def _object(self, operation: str, method: str, Bucket: str, Key: str, Range: Optional[str] = None,
+                ChecksumMode: Optional[str] = None):
+        request_headers = {'range': Range} if Range else {}
+        if ChecksumMode:
+            request_headers['x-amz-checksum-mode'] = ChecksumMode
+        headers, data = self._call(operation, method, Bucket, Key, headers=request_headers)
+        response = {
+            'ContentLength': int(headers.get('Content-Length', 0)),
+            'ContentType': headers.get('Content-Type'),
+            'ETag': headers.get('ETag', ''),
+            'AcceptRanges': 'bytes',
+        }
+        if 'Content-Range' in headers:
+            response['ContentRange'] = headers['Content-Range']
+        if 'x-amz-checksum-sha256' in headers:
+            response['ChecksumSHA256'] = headers['x-amz-checksum-sha256']
+        if method == 'GET':
+            response['Body'] = LocalBody(data)
+        return response
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None, **kwargs):
+        return self._object('GetObject', 'GET', Bucket, Key, Range)
+
+    def head_object(self, Bucket: str, Key: str, ChecksumMode: Optional[str] = None, **kwargs):
+        try:
+            return self._object('HeadObject', 'HEAD', Bucket, Key, ChecksumMode=ChecksumMode)
+        except ClientError as e:
+            # HEAD в S3 возвращает только статус
+            e.response['Error']['Code'] = str(e.response['ResponseMetadata']['HTTPStatusCode'])
+            raise
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs):
+        self.storage.delete_object(Bucket, Key)
+        return {}
+
+    def delete_objects(self, Bucket: str, Delete: Dict[str, Any], **kwargs):
+        keys = [item['Key'] for item in Delete.get('Objects', [])]
+        for key in keys:
+            self.storage.delete_object(Bucket, key)
+        return {} if Delete.get('Quiet') else {'Deleted': [{'Key': key} for key in keys]}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, ContentType: Optional[str] = None, **kwargs):
+        _, data = self._call('CreateMultipartUpload', 'POST', Bucket, Key, 'uploads=',
+                             headers={'content-type': ContentType or ''})
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': self._xml_field(data, 'UploadId')}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes, **kwargs):
+        headers, _ = self._call('UploadPart', 'PUT', Bucket, Key,
+                                urlencode({'uploadId': UploadId, 'partNumber': PartNumber}), body=Body)
+        return {'ETag': headers['ETag']}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: Dict[str, Any], **kwargs):
+        parts = ''.join(
+            f"<Part><PartNumber>{part['PartNumber']}</PartNumber><ETag>{part['ETag']}</ETag></Part>"
+            for part in MultipartUpload.get('Parts', [])
+        )
+        body = f'<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>'.encode('utf-8')
+        _, data = self._call('CompleteMultipartUpload', 'POST', Bucket, Key, urlencode({'uploadId': UploadId}), body=body)
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': self._xml_field(data, 'ETag')}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **kwargs):
+        self._call('AbortMultipartUpload', 'DELETE', Bucket, Key, urlencode({'uploadId': UploadId}))
+        return {}
+
+    def generate_presigned_url(self, ClientMethod: str, Params: Dict[str, Any], ExpiresIn: int = 3600, **kwargs) -> str:
+        query: List[tuple] = []
+        if ClientMethod == 'upload_part':
+            query = [('partNumber', Params['PartNumber']), ('uploadId', Params['UploadId'])]
+        elif ClientMethod == 'get_object':
+            query = [('response-content-disposition', Params['ResponseContentDisposition'])
+                     ] if 'ResponseContentDisposition' in Params else []
+            if 'ResponseContentType' in Params:
+                query.append(('response-content-type', Params['ResponseContentType']))
+        url = f"{self.endpoint_url}/{Params['Bucket']}/{quote(Params['Key'])}"
+        return f'{url}?{urlencode(query)}' if query else url
+
+    def get_paginator(self, operation: str) -> LocalPaginator:
+        if operation != 'list_objects_v2':
+            raise NotImplementedError(operation)
+        return LocalPaginator(self.storage)
@@ -0,0 +1,242 @@
+'''
+Массовый импорт пользователей из CSV или JSON Lines (выгрузка HR)
+Строки проверяются моделью CreateUserRequest функции users, пароли хэшируются bcrypt
+в пуле процессов, пользователи пишутся многострочными INSERT пачками с фиксацией каждой пачки.
+
+HTTP запрос принимает не больше USER_IMPORT_MAX_ROWS строк (хэширование должно уложиться в таймаут функции).
+Полная выгрузка HR загружается из командной строки, без ограничения числа строк:
+    DATABASE_URL=postgresql://... python backend/common/user_import.py staff.csv --workers 8
+'''
+import os
+import io
+import csv
+import sys
+import json
+import time
+import bcrypt
+import multiprocessing
+import psycopg2.extras
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple, Type
+
+USER_IMPORT_WORKERS = int(os.environ.get('USER_IMPORT_WORKERS', '0')) or os.cpu_count() or 1
+USER_IMPORT_BATCH_SIZE = int(os.environ.get('USER_IMPORT_BATCH_SIZE', '500'))
+# Время bcrypt на строку на одном CPU (замер gensalt() по умолчанию)
+USER_IMPORT_HASH_SECONDS = 0.37
+# Сколько секунд хэширования допускается в HTTP запросе - с запасом до таймаута функции
+USER_IMPORT_TIME_BUDGET = float(os.environ.get('USER_IMPORT_TIME_BUDGET', '60'))
+# Ограничение для HTTP запроса: 1 процесс - ~160 строк, полные выгрузки HR - через командную строку.
+# USER_IMPORT_WORKERS должен соответствовать vCPU функции, а не числу ядер хоста
+USER_IMPORT_MAX_ROWS = int(os.environ.get('USER_IMPORT_MAX_ROWS', '0')) or max(
+    1, int(USER_IMPORT_TIME_BUDGET * USER_IMPORT_WORKERS / USER_IMPORT_HASH_SECONDS)
+)
+
+IMPORT_FIELDS = ('email', 'name', 'role', 'password', 'position', 'department', 'phone')
+
+EXISTING_EMAILS_SQL = "SELECT email FROM users_v2 WHERE email = ANY(%s)"
+INSERT_USERS_SQL = (
+    "INSERT INTO users_v2 (email, name, password_hash, role, position, department, phone, "
+    "is_active, registration_date, last_active, created_at, updated_at) VALUES %s "
+    "ON CONFLICT (email) DO NOTHING RETURNING email"
+)
+
+_executor: Optional[Executor] = None
+
+def hash_password(password: str) -> str:
+    '''Та же схема, что и в POST /users: bcrypt с солью по умолчанию'''
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def get_executor(workers: int) -> Executor:
+    '''
+    Пул для хэширования, общий для теплых вызовов
+    Процессы запускаются через spawn: fork скопировал бы открытые соединения пула БД
+    Если процессы недоступны (нет /dev/shm в рантайме) - пул потоков, bcrypt отпускает GIL
+    '''
+    global _executor
+    if _executor is not None and getattr(_executor, '_max_workers', workers) == workers:
+        return _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    try:
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    except (OSError, NotImplementedError):
+        _executor = ThreadPoolExecutor(max_workers=workers)
+    return _executor
+
+def hash_passwords(passwords: List[str], workers: int = USER_IMPORT_WORKERS) -> List[str]:
+    global _executor
+    if workers <= 1 or len(passwords) <= 1:
+        return [hash_password(password) for password in passwords]
+    executor = get_executor(workers)
+    chunksize = max(1, len(passwords) // (workers * 4))
+    try:
+        return list(executor.map(hash_password, passwords, chunksize=chunksize))
+    except (OSError, NotImplementedError, BrokenProcessPool):
+        # Пул процессов не смог запустить рабочих - дальше хэшируем в потоках
+        _executor = ThreadPoolExecutor(max_workers=workers)
+        return list(_executor.map(hash_password, passwords))
+
+def parse_import(content: str, fmt: str) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    '''
+    Разбирает CSV (первая строка - заголовок) или JSON Lines
+    Returns: (строки (номер, поля), ошибки разбора)
+    '''
+    rows: List[Tuple[int, Dict[str, Any]]] = []
+    errors: List[Dict[str, Any]] = []
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(content.lstrip('﻿')))
+        for record in reader:
+            fields = {
+                (key or '').strip(): (value.strip() if isinstance(value, str) and value.strip() else None)
+                for key, value in record.items()
+            }
+            # Номер строки файла с учетом заголовка
+            rows.append((reader.line_num, fields))
+        return rows, errors
+    if fmt == 'jsonl':
+        for line_num, line in enumerate(content.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                fields = json.loads(line)
+            except ValueError as e:
+                errors.append({'row': line_num, 'email': None, 'error': f'Некорректный JSON: {str(e)}'})
+                continue
+            if not isinstance(fields, dict):
+                errors.append({'row': line_num, 'email': None, 'error': 'Строка должна быть JSON объектом'})
+                continue
+            rows.append((line_num, fields))
+        return rows, errors
+    raise ValueError('Формат должен быть csv или jsonl')
+
+def _validation_message(error: Exception) -> str:
+    details = getattr(error, 'errors', None)
+    if callable(details):
+        return '; '.join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in details())
+    return str(error)
+
+def import_users(conn, rows: List[Tuple[int, Dict[str, Any]]], model: Type,
+                 parse_errors: Optional[List[Dict[str, Any]]] = None,
+                 batch_size: int = USER_IMPORT_BATCH_SIZE, workers: int = USER_IMPORT_WORKERS) -> Dict[str, Any]:
+    '''
+    Проверяет, хэширует и сохраняет пользователей
+    Существующие email отсеиваются одним запросом на пачку до хэширования
+    Args:
+        rows, parse_errors - результат parse_import
+        model - pydantic модель строки (CreateUserRequest)
+    Returns: число созданных пользователей, ошибки по строкам и пропускная способность
+    '''
+    started = time.perf_counter()
+    report: Dict[str, Any] = {
+        'total': len(rows) + len(parse_errors or []),
+        'created': 0,
+        'failed': 0,
+        'errors': list(parse_errors or []),
+        'workers': workers,
+        'hashMs': 0.0,
+        'insertMs': 0.0,
+    }
+    valid: List[Tuple[int, Any]] = []
+    seen_emails = set()
+    for row_num, fields in rows:
+        try:
+            user = model(**{field: fields.get(field) for field in IMPORT_FIELDS if fields.get(field) is not None})
+        except Exception as e:
+            report['errors'].append({'row': row_num, 'email': fields.get('email'), 'error': _validation_message(e)})
+            continue
+        if user.email in seen_emails:
+            report['errors'].append({'row': row_num, 'email': user.email, 'error': 'Email повторяется в файле'})
+            continue
+        seen_emails.add(user.email)
+        valid.append((row_num, user))
+
+    cur = conn.cursor()
+    for offset in range(0, len(valid), batch_size):
+        batch = valid[offset:offset + batch_size]
+        cur.execute(EXISTING_EMAILS_SQL, ([user.email for _, user in batch],))
+        existing = {row[0] for row in cur.fetchall()}
+        fresh = []
+        for row_num, user in batch:
+            if user.email in existing:
+                report['errors'].append({'row': row_num, 'email': user.email,
+                                         'error': 'Пользователь с таким email уже существует'})
+            else:
+                fresh.append((row_num, user))
+        if not fresh:
+            continue
+
+        hash_started = time.perf_counter()
+        hashes = hash_passwords([user.password for _, user in fresh], workers)
+        report['hashMs'] += (time.perf_counter() - hash_started) * 1000
+
+        insert_started = time.perf_counter()
+        now = datetime.utcnow()
+        values = [
+            (user.email, user.name, password_hash, user.role, user.position, user.department, user.phone,
+             True, now, now, now, now)
+            for (_, user), password_hash in zip(fresh, hashes)
+        ]
+        inserted = psycopg2.extras.execute_values(cur, INSERT_USERS_SQL, values, page_size=len(values), fetch=True)
+        conn.commit()
+        report['insertMs'] += (time.perf_counter() - insert_started) * 1000
+
+        created_emails = {row[0] for row in inserted}
+        report['created'] += len(created_emails)
+        # Email занят параллельной вставкой между проверкой и INSERT
+        for row_num, user in fresh:
+            if user.email not in created_emails:
+                report['errors'].append({'row': row_num, 'email': user.email,
+                                         'error': 'Пользователь с таким email уже существует'})
+    cur.close()
+
+    duration = time.perf_counter() - started
+    report['errors'].sort(key=lambda error: error['row'])
+    report['failed'] = len(report['errors'])
+    report['hashMs'] = round(report['hashMs'], 2)
+    report['insertMs'] = round(report['insertMs'], 2)
+    report['durationMs'] = round(duration * 1000, 2)
+    report['rowsPerSecond'] = round(report['total'] / duration, 1) if duration > 0 else 0
+    return report
+
+def main() -> None:
+    import argparse
+    import importlib.util
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description='Массовый импорт пользователей из CSV / JSON Lines')
+    parser.add_argument('file', help='Файл выгрузки (.csv или .jsonl)')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='Формат (по умолчанию - по расширению)')
+    parser.add_argument('--workers', type=int, default=USER_IMPORT_WORKERS, help='Процессов для bcrypt')
+    parser.add_argument('--batch-size', type=int, default=USER_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL не задан')
+
+    # Модель строки берется из функции users, чтобы проверка совпадала с POST /users
+    users_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'users', 'index.py')
+    spec = importlib.util.spec_from_file_location('users_index', users_path)
+    users_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(users_module)
+
+    fmt = args.format or ('jsonl' if args.file.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(args.file, encoding='utf-8') as source:
+        rows, errors = parse_import(source.read(), fmt)
+
+    conn = psycopg2.connect(dsn)
+    try:
+        report = import_users(conn, rows, users_module.CreateUserRequest, errors, args.batch_size, args.workers)
+    finally:
+        conn.close()
+    for error in report['errors']:
+        print(f"row {error['row']}: {error['email'] or '-'}: {error['error']}")
+    print(f"created={report['created']} failed={report['failed']} workers={report['workers']} "
+          f"hash={report['hashMs']:.0f}ms insert={report['insertMs']:.0f}ms "
+          f"total={report['durationMs']:.0f}ms ({report['rowsPerSecond']} rows/s)")
+
+if __name__ == '__main__':
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    main()
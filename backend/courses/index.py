@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import psycopg2
 import psycopg2.extras
 import jwt
@@ -7,27 +8,9 @@ from datetime import datetime
 from typing import Dict, Any, Optional, List
 from pydantic import BaseModel, Field
 
-def log_action(conn, level: str, action: str, message: str, user_id: Optional[int] = None, 
-               ip_address: Optional[str] = None, user_agent: Optional[str] = None, 
-               details: Optional[Dict[str, Any]] = None) -> None:
-    try:
-        with conn.cursor() as cur:
-            cur.execute('''
-                INSERT INTO system_logs (level, action, message, user_id, ip_address, user_agent, details)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (level, action, message, user_id, ip_address, user_agent, json.dumps(details) if details else None))
-            conn.commit()
-    except Exception as e:
-        print(f"[WARNING] Failed to create log: {e}")
-
-def get_client_ip(event: Dict[str, Any]) -> Optional[str]:
-    request_context = event.get('requestContext', {})
-    identity = request_context.get('identity', {})
-    return identity.get('sourceIp')
-
-def get_user_agent(event: Dict[str, Any]) -> Optional[str]:
-    headers = event.get('headers', {})
-    return headers.get('User-Agent') or headers.get('user-agent')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.logger import log_action, get_client_ip, get_user_agent
 
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
@@ -58,10 +41,6 @@ class UpdateCourseRequest(BaseModel):
     endDate: Optional[str] = None
     accessType: Optional[str] = Field(None, pattern='^(open|closed)$')
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
-
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -110,6 +89,30 @@ def format_course_response(course_row: tuple) -> Dict[str, Any]:
         'accessType': course_row[14],
     }
 
+# Каталог студента одним запросом: открытые + назначенные закрытые курсы
+# и архивные курсы, в которых у студента есть прогресс
+STUDENT_CATALOG_QUERY = (
+    "SELECT c.id, c.title, c.description, c.duration, lc.lessons_count, "
+    "c.category, c.image, c.published, c.pass_score, c.level, c.instructor, "
+    "c.status, c.start_date, c.end_date, c.access_type "
+    "FROM courses_v2 c "
+    "CROSS JOIN LATERAL (SELECT COUNT(*) AS lessons_count FROM lessons_v2 l WHERE l.course_id = c.id) lc "
+    "WHERE (c.published = true AND c.status != 'archived' AND ("
+    "    c.access_type = 'open' "
+    "    OR (c.access_type = 'closed' AND EXISTS ("
+    "        SELECT 1 FROM course_assignments_v2 a WHERE a.course_id = c.id AND a.user_id = %(user_id)s))"
+    ")) "
+    "OR (c.status = 'archived' AND EXISTS ("
+    "    SELECT 1 FROM course_progress_v2 cp WHERE cp.course_id = c.id AND cp.user_id = %(user_id)s)) "
+    "ORDER BY c.id DESC"
+)
+
+def fetch_student_catalog(cur, user_id: int) -> List[tuple]:
+    '''Курсы, видимые студенту, в формате строк для format_course_response'''
+    cur.execute(STUDENT_CATALOG_QUERY, {'user_id': user_id})
+    return cur.fetchall()
+
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление курсами
@@ -168,59 +171,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             courses = cur.fetchall()
         else:
-            user_id_int = int(payload['user_id'])
-            
-            # Опубликованные открытые курсы (не архивные)
-            cur.execute(
-                "SELECT c.id, c.title, c.description, c.duration, "
-                "(SELECT COUNT(*) FROM lessons_v2 WHERE course_id = c.id) as lessons_count, "
-                "c.category, c.image, c.published, c.pass_score, c.level, c.instructor, "
-                "c.status, c.start_date, c.end_date, c.access_type "
-                "FROM courses_v2 c WHERE c.published = true AND c.access_type = 'open' AND c.status != 'archived'"
-            )
-            open_courses = list(cur.fetchall())
-            
-            # Назначенные закрытые курсы (не архивные)
-            cur.execute(
-                "SELECT course_id FROM course_assignments_v2 WHERE user_id = %s",
-                (user_id_int,)
-            )
-            assigned_course_ids = [row[0] for row in cur.fetchall()]
-            
-            closed_courses = []
-            if assigned_course_ids:
-                placeholders = ','.join(str(cid) for cid in assigned_course_ids)
-                cur.execute(
-                    f"SELECT c.id, c.title, c.description, c.duration, "
-                    f"(SELECT COUNT(*) FROM lessons_v2 WHERE course_id = c.id) as lessons_count, "
-                    f"c.category, c.image, c.published, c.pass_score, c.level, c.instructor, "
-                    f"c.status, c.start_date, c.end_date, c.access_type "
-                    f"FROM courses_v2 c WHERE c.published = true AND c.access_type = 'closed' AND c.status != 'archived' AND c.id IN ({placeholders})"
-                )
-                closed_courses = list(cur.fetchall())
-            
-            # Архивные курсы, где есть прогресс у пользователя
-            cur.execute(
-                "SELECT DISTINCT cp.course_id FROM course_progress_v2 cp "
-                "WHERE cp.user_id = %s",
-                (user_id_int,)
-            )
-            progress_course_ids = [row[0] for row in cur.fetchall()]
-            
-            archived_courses = []
-            if progress_course_ids:
-                placeholders = ','.join(str(cid) for cid in progress_course_ids)
-                cur.execute(
-                    f"SELECT c.id, c.title, c.description, c.duration, "
-                    f"(SELECT COUNT(*) FROM lessons_v2 WHERE course_id = c.id) as lessons_count, "
-                    f"c.category, c.image, c.published, c.pass_score, c.level, c.instructor, "
-                    f"c.status, c.start_date, c.end_date, c.access_type "
-                    f"FROM courses_v2 c WHERE c.status = 'archived' AND c.id IN ({placeholders})"
-                )
-                archived_courses = list(cur.fetchall())
-            
-            courses = open_courses + closed_courses + archived_courses
-            courses.sort(key=lambda x: x[0], reverse=True)
+            courses = fetch_student_catalog(cur, int(payload['user_id']))
         
         courses_list = [format_course_response(course) for course in courses]
         
@@ -398,7 +349,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         payload = verify_jwt_token(headers.get('X-Auth-Token') or headers.get('x-auth-token'))
         log_action(
-            conn, 'success', 'course.create',
+            'success', 'course.create',
             f'Создан новый курс: {new_course[1]}',
             user_id=payload.get('user_id') if payload else None,
             ip_address=get_client_ip(event),
@@ -519,7 +470,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             log_act = 'course.archive'
         
         log_action(
-            conn, log_level, log_act,
+            log_level, log_act,
             log_message,
             user_id=payload.get('user_id') if payload else None,
             ip_address=get_client_ip(event),
@@ -552,6 +503,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         try:
+            cur.execute("DELETE FROM lesson_completions WHERE course_id = %s", (course_id,))
             cur.execute("DELETE FROM course_progress_v2 WHERE course_id = %s", (course_id,))
             cur.execute("DELETE FROM course_assignments_v2 WHERE course_id = %s", (course_id,))
             cur.execute("DELETE FROM lessons_v2 WHERE course_id = %s", (course_id,))
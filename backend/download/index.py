@@ -1,31 +1,159 @@
 import json
 import os
-import boto3
+import sys
 import base64
-from typing import Dict, Any
-from urllib.parse import unquote, urlparse
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import unquote, urlparse, quote
+from botocore.exceptions import ClientError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.file_locations import candidate_keys, lookup_location, remember_location, forget_locations
+from common.storage import get_s3_client
+
+BUCKET = 'files'
+# Срок действия presigned ссылки на скачивание, секунды
+DOWNLOAD_URL_EXPIRES = int(os.environ.get('DOWNLOAD_URL_EXPIRES', '300'))
+# Сколько байт функция отдает за один ответ в режиме прокси (ответ функции целиком в памяти и в base64)
+DOWNLOAD_PROXY_MAX_BYTES = int(os.environ.get('DOWNLOAD_PROXY_MAX_BYTES', str(4 * 1024 * 1024)))
+# redirect - 302 на presigned URL хранилища, proxy - отдавать байты через функцию (?proxy=1)
+DOWNLOAD_MODE = os.environ.get('DOWNLOAD_MODE', 'redirect')
+
+CONTENT_TYPES = {
+    '.pdf': 'application/pdf',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.doc': 'application/msword',
+}
+
+def locate_object(s3, file_key: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    '''
+    Ищет файл по возможным путям через head_object (без чтения содержимого)
+    Returns: (ключ, метаданные head_object) или (None, None)
+    '''
+    for key in candidate_keys(file_key):
+        try:
+            head = s3.head_object(Bucket=BUCKET, Key=key)
+            print(f"Found file at: {key}")
+            return key, head
+        except ClientError as e:
+            print(f"Not found at S3 key {key}: {e.response.get('Error', {}).get('Code')}")
+    return None, None
+
+def resolve_location(s3, file_key: str, stale_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    '''
+    Расположение файла: из индекса file_locations без обращения к хранилищу,
+    при промахе - head_object по возможным путям с записью найденного пути в индекс
+    stale_key - объект из индекса оказался удален: его записи сбрасываются и путь ищется заново
+    Returns: {key, size, contentType, etag, indexed} или None если файла нет
+    '''
+    conn = get_db_connection()
+    cur = conn.cursor()
+    if stale_key:
+        forget_locations(cur, [stale_key])
+        conn.commit()
+    location = lookup_location(cur, file_key)
+    if location:
+        location['indexed'] = True
+    else:
+        key, head = locate_object(s3, file_key)
+        if key:
+            location = {
+                'key': key,
+                'size': head.get('ContentLength') or 0,
+                'contentType': head.get('ContentType'),
+                'etag': (head.get('ETag') or '').strip('"'),
+                'indexed': False,
+            }
+            remember_location(cur, file_key, key, location['size'], location['contentType'], location['etag'])
+            conn.commit()
+    cur.close()
+    conn.close()
+    return location
+
+def read_range(s3, key: str, start: int, end: int) -> bytes:
+    response = s3.get_object(Bucket=BUCKET, Key=key, Range=f'bytes={start}-{end}')
+    return response['Body'].read()
+
+def content_type_for(filename: str, stored_type: Optional[str]) -> str:
+    ext = os.path.splitext(filename.lower())[1]
+    if ext in CONTENT_TYPES:
+        return CONTENT_TYPES[ext]
+    if stored_type and stored_type != 'binary/octet-stream':
+        return stored_type
+    return 'application/octet-stream'
+
+def content_disposition(filename: str) -> str:
+    '''attachment с ASCII-именем для старых клиентов и filename* (RFC 5987) для кириллицы'''
+    ascii_name = filename.encode('ascii', 'replace').decode('ascii').replace('?', '_').replace('"', '')
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+def parse_range(header: Optional[str], size: int):
+    '''Разбирает заголовок Range: bytes=a-b | bytes=a- | bytes=-n (один диапазон)'''
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first == '':
+            length = int(last)
+            if length <= 0:
+                return 'invalid'
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return 'invalid'
+    return start, min(end, size - 1)
+
+def redirect_response(s3, key: str, filename: str, content_type: str) -> Dict[str, Any]:
+    url = s3.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': BUCKET,
+            'Key': key,
+            'ResponseContentDisposition': content_disposition(filename),
+            'ResponseContentType': content_type,
+        },
+        ExpiresIn=DOWNLOAD_URL_EXPIRES,
+    )
+    return {
+        'statusCode': 302,
+        'headers': {
+            'Location': url,
+            'Cache-Control': 'no-store',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Прокси для скачивания файлов из S3 хранилища
-    Args: event - dict с httpMethod, queryStringParameters (url, filename)
-    Returns: HTTP response с файлом в base64
+    Скачивание файлов из S3 хранилища
+    Args: event - dict с httpMethod, queryStringParameters (url, filename, proxy), headers (Range)
+    Returns: 302 на короткоживущую presigned ссылку с Content-Disposition;
+             с ?proxy=1 - байты файла через функцию (200 или 206 для Range) частями
+             не больше DOWNLOAD_PROXY_MAX_BYTES, больший файл без Range - тоже 302
+    Путь объекта берется из индекса file_locations: 302 не обращается к хранилищу,
+    прокси делает один get_object
     '''
     method: str = event.get('httpMethod', 'GET')
-    
+
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, Range',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
-    
+
     if method != 'GET':
         return {
             'statusCode': 405,
@@ -33,11 +161,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
-    
+
     params = event.get('queryStringParameters') or {}
     file_url = params.get('url')
     filename = params.get('filename', 'download')
-    
+    proxy = params.get('proxy', '1' if DOWNLOAD_MODE == 'proxy' else '0') in ('1', 'true')
+
     if not file_url:
         return {
             'statusCode': 400,
@@ -45,78 +174,97 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'URL parameter required'}),
             'isBase64Encoded': False
         }
-    
+
     try:
-        # Инициализация S3 клиента
-        s3 = boto3.client('s3',
-            endpoint_url='https://bucket.poehali.dev',
-            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
-        )
-        
+        s3 = get_s3_client()
+
         # Извлекаем путь к файлу из URL
         # URL формат: https://cdn.poehali.dev/projects/{project_id}/bucket/{path}
         parsed = urlparse(file_url)
         path_parts = parsed.path.split('/bucket/')
         if len(path_parts) < 2:
             raise ValueError(f'Invalid URL format: {file_url}')
-        
-        file_key = path_parts[1]  # Например: images/uuid.pdf или documents/uuid.pdf
-        
-        print(f"Attempting to download from S3: {file_key}")
-        
-        # Список возможных путей для поиска файла
-        possible_keys = [file_key]
-        
-        # Добавляем альтернативные пути
-        if file_key.startswith('documents/'):
-            possible_keys.append(file_key.replace('documents/', 'images/'))
-            possible_keys.append(file_key.replace('documents/', ''))
-        elif file_key.startswith('images/'):
-            possible_keys.append(file_key.replace('images/', 'documents/'))
-            possible_keys.append(file_key.replace('images/', ''))
-        else:
-            possible_keys.append(f'images/{file_key}')
-            possible_keys.append(f'documents/{file_key}')
-        
-        # Пробуем найти файл по одному из путей
-        file_data = None
-        last_error = None
-        
-        for key in possible_keys:
-            try:
-                print(f"Trying S3 key: {key}")
-                response = s3.get_object(Bucket='files', Key=key)
-                file_data = response['Body'].read()
-                print(f"Successfully found file at: {key}")
-                break
-            except Exception as e:
-                last_error = e
-                continue
-        
-        if file_data is None:
-            raise Exception(f"File not found in any location. Last error: {str(last_error)}")
-        
-        # Определяем content-type по расширению
-        content_type = 'application/octet-stream'
-        if filename.endswith('.pdf'):
-            content_type = 'application/pdf'
-        elif filename.endswith('.docx'):
-            content_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        elif filename.endswith('.doc'):
-            content_type = 'application/msword'
-        
-        # Кодируем в base64
-        file_base64 = base64.b64encode(file_data).decode('utf-8')
-        
+
+        file_key = unquote(path_parts[1])  # Например: images/uuid.pdf или documents/uuid.pdf
+
+        location = resolve_location(s3, file_key)
+        if location is None:
+            return {
+                'statusCode': 404,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'File not found'}),
+                'isBase64Encoded': False
+            }
+
+        key = location['key']
+        content_type = content_type_for(filename, location['contentType'])
+        size = location['size'] or 0
+
+        headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+        byte_range = parse_range(headers.get('range'), size) if proxy else None
+
+        # Без прокси или слишком большой файл без Range - байты отдает хранилище
+        if not proxy or (byte_range is None and size > DOWNLOAD_PROXY_MAX_BYTES):
+            return redirect_response(s3, key, filename, content_type)
+
+        response_headers = {
+            'Content-Type': content_type,
+            'Content-Disposition': content_disposition(filename),
+            'Accept-Ranges': 'bytes',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'Content-Range, Content-Length, Accept-Ranges'
+        }
+        if location['etag']:
+            response_headers['ETag'] = f"\"{location['etag']}\""
+
+        if byte_range == 'invalid':
+            response_headers['Content-Range'] = f'bytes */{size}'
+            return {
+                'statusCode': 416,
+                'headers': response_headers,
+                'body': '',
+                'isBase64Encoded': False
+            }
+
+        if not size:
+            return {
+                'statusCode': 200,
+                'headers': response_headers,
+                'body': '',
+                'isBase64Encoded': True
+            }
+
+        status_code = 200
+        start, end = 0, size - 1
+        if byte_range:
+            # Диапазон урезается до размера одного ответа, клиент дочитывает следующими Range
+            start, end = byte_range[0], min(byte_range[1], byte_range[0] + DOWNLOAD_PROXY_MAX_BYTES - 1)
+            status_code = 206
+            response_headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        # Читается только нужный диапазон - память ограничена DOWNLOAD_PROXY_MAX_BYTES, а не размером файла
+        try:
+            file_data = read_range(s3, key, start, end)
+        except ClientError as e:
+            if not location['indexed'] or e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                raise
+            # Запись индекса устарела (объект удален в обход upload/lessons) - ищем файл заново
+            location = resolve_location(s3, file_key, stale_key=key)
+            if location is None or location['key'] == key:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'File not found'}),
+                    'isBase64Encoded': False
+                }
+            key = location['key']
+            file_data = read_range(s3, key, start, end)
+        response_headers['Content-Length'] = str(len(file_data))
+
         return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': content_type,
-                'Content-Disposition': f'attachment; filename="{filename}"',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': file_base64,
+            'statusCode': status_code,
+            'headers': response_headers,
+            'body': base64.b64encode(file_data).decode('utf-8'),
             'isBase64Encoded': True
         }
     except Exception as e:
@@ -125,4 +273,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({'error': f'Failed to download file: {str(e)}'}),
             'isBase64Encoded': False
-        }
\ No newline at end of file
+        }
@@ -1,14 +1,15 @@
 import json
 import os
+import sys
 import psycopg2
 import bcrypt
 from datetime import datetime
 from typing import Dict, Any
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
 
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Инициализация администратора: создает или обновляет пароль admin@example.com
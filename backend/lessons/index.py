@@ -1,12 +1,18 @@
 import json
 import os
+import sys
 import psycopg2
 import jwt
-import boto3
 from datetime import datetime
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.pagination import wants_page, parse_page, split_page
+from common.file_store import key_from_url, release_objects
+from common.storage import get_s3_client, delete_keys
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
@@ -46,10 +52,6 @@ class LessonMaterialRequest(BaseModel):
     type: str = Field(..., pattern='^(pdf|doc|link|video)$')
     url: str = Field(..., min_length=1)
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
-
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -102,10 +104,11 @@ def format_lesson_response(lesson_row: tuple, materials: list = None) -> Dict[st
     
     return lesson_data
 
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление уроками
-    GET - все уроки (только админ)
+    GET - все уроки (только админ), фильтр type; постранично с limit и cursor
     GET ?courseId=x - все уроки курса
     GET ?id=x - один урок
     POST - создать урок (только админ)
@@ -184,24 +187,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
         
+        # Уроки вместе с материалами одним запросом (материалы агрегируются в JSON)
         cur.execute(
-            "SELECT id, course_id, title, content, type, \"order\", duration, video_url, "
-            "description, requires_previous, test_id, is_final_test, "
-            "final_test_requires_all_lessons, final_test_requires_all_tests, image_url "
-            "FROM lessons_v2 WHERE course_id = %s ORDER BY \"order\"",
+            "SELECT l.id, l.course_id, l.title, l.content, l.type, l.\"order\", l.duration, l.video_url, "
+            "l.description, l.requires_previous, l.test_id, l.is_final_test, "
+            "l.final_test_requires_all_lessons, l.final_test_requires_all_tests, l.image_url, "
+            "COALESCE(m.materials, '[]'::json) "
+            "FROM lessons_v2 l "
+            "LEFT JOIN LATERAL ("
+            "    SELECT json_agg(json_build_object('id', lm.id, 'title', lm.title, 'type', lm.type, 'url', lm.url) "
+            "                    ORDER BY lm.id) AS materials "
+            "    FROM lesson_materials_v2 lm WHERE lm.lesson_id = l.id"
+            ") m ON true "
+            "WHERE l.course_id = %s ORDER BY l.\"order\"",
             (course_id_int,)
         )
         lessons = cur.fetchall()
         
-        lessons_list = []
-        for lesson in lessons:
-            cur.execute(
-                "SELECT id, title, type, url FROM lesson_materials_v2 WHERE lesson_id = %s",
-                (lesson[0],)
-            )
-            materials_rows = cur.fetchall()
-            materials = [{'id': m[0], 'title': m[1], 'type': m[2], 'url': m[3]} for m in materials_rows]
-            lessons_list.append(format_lesson_response(lesson, materials))
+        lessons_list = [format_lesson_response(lesson[:15], lesson[15]) for lesson in lessons]
         
         cur.close()
         conn.close()
@@ -289,14 +292,47 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        cur.execute(
+        try:
+            limit, after = parse_page(query_params, key_size=3) if wants_page(query_params) else (None, None)
+            conditions, params = [], []
+            if query_params.get('type'):
+                conditions.append("type = %s")
+                params.append(query_params['type'])
+            if after:
+                conditions.append("(course_id, COALESCE(\"order\", 0), id) > (%s, %s, %s)")
+                params.extend(int(value) for value in after)
+        except (ValueError, TypeError) as e:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        where = ("WHERE " + " AND ".join(conditions) + " ") if conditions else ""
+        columns = (
             "SELECT id, course_id, title, content, type, \"order\", duration, video_url, "
             "description, requires_previous, test_id, is_final_test, "
             "final_test_requires_all_lessons, final_test_requires_all_tests, image_url "
-            "FROM lessons_v2 ORDER BY course_id, \"order\""
+            "FROM lessons_v2 "
         )
-        lessons = cur.fetchall()
-        lessons_list = [format_lesson_response(lesson) for lesson in lessons]
+        if limit is None:
+            cur.execute(columns + where + "ORDER BY course_id, \"order\"", params)
+            response_data = {'lessons': [format_lesson_response(lesson) for lesson in cur.fetchall()]}
+        else:
+            cur.execute(
+                columns + where + "ORDER BY course_id, COALESCE(\"order\", 0), id LIMIT %s",
+                params + [limit + 1]
+            )
+            lessons, next_cursor = split_page(
+                cur.fetchall(), limit, key=lambda row: [row[1], row[5] or 0, row[0]]
+            )
+            response_data = {
+                'lessons': [format_lesson_response(lesson) for lesson in lessons],
+                'nextCursor': next_cursor
+            }
         
         cur.close()
         conn.close()
@@ -304,7 +340,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'lessons': lessons_list}, ensure_ascii=False),
+            'body': json.dumps(response_data, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
@@ -670,28 +706,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         # Get materials to delete files from S3
         cur.execute("SELECT url FROM lesson_materials_v2 WHERE lesson_id = %s", (lesson_id,))
-        material_urls = [row[0] for row in cur.fetchall()]
+        material_keys = [key for key in (key_from_url(row[0]) for row in cur.fetchall()) if key]
+        
+        # Файл может быть общим для нескольких загрузок (дедупликация) - удаляем только объекты без ссылок
+        deletable_keys = release_objects(cur, material_keys) if material_keys else []
         
         # Delete files from S3
-        if material_urls:
+        if deletable_keys:
             try:
-                s3 = boto3.client('s3',
-                    endpoint_url='https://bucket.poehali.dev',
-                    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-                    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-                )
+                s3 = get_s3_client()
                 
-                for url in material_urls:
-                    # Extract key from CDN URL
-                    # Format: https://cdn.poehali.dev/projects/{ACCESS_KEY}/bucket/{key}
-                    if 'cdn.poehali.dev' in url:
-                        parts = url.split('/bucket/')
-                        if len(parts) == 2:
-                            key = parts[1]
-                            try:
-                                s3.delete_object(Bucket='files', Key=key)
-                            except Exception as e:
-                                print(f'Failed to delete file {key}: {e}')
+                # Одним delete_objects на пачку до 1000 ключей
+                for error in delete_keys(s3, 'files', deletable_keys)['errors']:
+                    print(f"Failed to delete file {error['key']}: {error['code']} {error['message']}")
             except Exception as e:
                 print(f'S3 cleanup error: {e}')
         
@@ -699,7 +726,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cur.execute("DELETE FROM lesson_materials_v2 WHERE lesson_id = %s", (lesson_id,))
         
         # Delete lesson
-        cur.execute("DELETE FROM lessons_v2 WHERE id = %s", (lesson_id,))
+        cur.execute("DELETE FROM lessons_v2 WHERE id = %s RETURNING course_id", (lesson_id,))
+        deleted_lesson = cur.fetchone()
+        if deleted_lesson:
+            # lessons_count - знаменатель прогресса курса, ведется на создании и удалении урока
+            cur.execute(
+                "UPDATE courses_v2 SET lessons_count = GREATEST(lessons_count - 1, 0), updated_at = NOW() WHERE id = %s",
+                (deleted_lesson[0],)
+            )
         
         conn.commit()
         cur.close()
@@ -0,0 +1,91 @@
+'''
+Число запросов GET ?courseId не зависит от числа уроков и материалов курса
+Запуск: python -m pytest backend/lessons/test_index.py
+'''
+import os
+import sys
+import json
+import importlib.util
+
+import jwt
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_query_count
+from common.query_stats import current_stats
+
+_spec = importlib.util.spec_from_file_location('lessons_index', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.py'))
+lessons = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(lessons)
+
+COURSE_ID = 7
+
+class FakeCursor:
+    '''Курсор без базы: отвечает заготовленными строками и учитывает запросы так же, как InstrumentedCursor'''
+    def __init__(self, lesson_count: int, materials_per_lesson: int, access_type: str):
+        self.lesson_count = lesson_count
+        self.materials_per_lesson = materials_per_lesson
+        self.access_type = access_type
+        self.rows = []
+
+    def execute(self, query, vars=None):
+        if 'FROM courses_v2' in query:
+            self.rows = [(self.access_type,)]
+        elif 'FROM course_assignments_v2' in query:
+            self.rows = [(1,)]
+        elif 'FROM lessons_v2 l' in query:
+            self.rows = [self.lesson_row(lesson_id) for lesson_id in range(1, self.lesson_count + 1)]
+        else:
+            raise AssertionError(f'Неожиданный запрос: {query}')
+        current_stats().record(query, 0.0, len(self.rows))
+
+    def lesson_row(self, lesson_id: int) -> tuple:
+        materials = [
+            {'id': lesson_id * 100 + n, 'title': f'm{n}', 'type': 'pdf', 'url': f'/bucket/documents/{lesson_id}-{n}.pdf'}
+            for n in range(self.materials_per_lesson)
+        ]
+        return (lesson_id, COURSE_ID, f'Урок {lesson_id}', '', 'text', lesson_id, 10, None,
+                None, False, None, False, False, False, None, materials)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, cursor: FakeCursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        pass
+
+def get_course_lessons(monkeypatch, lesson_count: int, materials_per_lesson: int, role: str, access_type: str = 'open'):
+    cursor = FakeCursor(lesson_count, materials_per_lesson, access_type)
+    monkeypatch.setattr(lessons, 'get_db_connection', lambda: FakeConnection(cursor))
+    token = jwt.encode({'user_id': 1, 'role': role, 'email': 'u@example.com'}, lessons.JWT_SECRET, algorithm=lessons.JWT_ALGORITHM)
+    response = lessons.handler({
+        'httpMethod': 'GET',
+        'queryStringParameters': {'courseId': str(COURSE_ID)},
+        'headers': {'X-Auth-Token': token},
+    }, None)
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])['lessons'], get_query_count()
+
+@pytest.mark.parametrize('role, access_type, expected_queries', [
+    ('admin', 'open', 1),
+    ('student', 'open', 2),
+    ('student', 'closed', 3),
+])
+def test_course_lessons_query_count_is_constant(monkeypatch, role, access_type, expected_queries):
+    for lesson_count, materials_per_lesson in [(1, 0), (5, 3), (50, 10)]:
+        lessons_list, queries = get_course_lessons(monkeypatch, lesson_count, materials_per_lesson, role, access_type)
+        assert len(lessons_list) == lesson_count
+        assert all(len(lesson['materials']) == materials_per_lesson for lesson in lessons_list)
+        assert queries == expected_queries, f'{lesson_count} уроков: {queries} запросов'
@@ -0,0 +1,306 @@
+'''
+Файловая замена S3 для локального запуска (см. server.py)
+Поддерживает подмножество S3 REST API, которым пользуются функции:
+PutObject, GetObject (с Range), HeadObject, DeleteObject, DeleteObjects, ListObjectsV2
+и multipart загрузка (CreateMultipartUpload, UploadPart, CompleteMultipartUpload, AbortMultipartUpload).
+Объекты лежат в <root>/<bucket>/<key>, метаданные - в <root>/.meta/<bucket>/<key>.json,
+части незавершенных multipart загрузок - в <root>/.multipart/<uploadId>/
+Подписи запросов не проверяются; заголовок x-amz-checksum-sha256 у PUT проверяется, как в S3.
+'''
+import os
+import json
+import uuid
+import base64
+import shutil
+import hashlib
+import mimetypes
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple, List
+from urllib.parse import parse_qs
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+S3_NS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+RESPONSE_OVERRIDES = {
+    'response-content-type': 'Content-Type',
+    'response-content-disposition': 'Content-Disposition',
+    'response-cache-control': 'Cache-Control',
+}
+
+class FilesystemS3:
+    '''
+    Args:
+        root - каталог, в котором хранятся бакеты
+    '''
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, bucket: str, key: str, meta: bool = False) -> str:
+        base = os.path.join(self.root, '.meta', bucket) if meta else os.path.join(self.root, bucket)
+        path = os.path.abspath(os.path.join(base, key + ('.json' if meta else '')))
+        if not path.startswith(base + os.sep):
+            raise ValueError(f'Invalid key: {key}')
+        return path
+
+    def _read_meta(self, bucket: str, key: str) -> Dict[str, Any]:
+        try:
+            with open(self._path(bucket, key, meta=True), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+            return {'contentType': content_type, 'etag': ''}
+
+    def put_object(self, bucket: str, key: str, body: bytes, content_type: Optional[str],
+                   etag: Optional[str] = None, checksum_sha256: Optional[str] = None) -> str:
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        etag = etag or hashlib.md5(body).hexdigest()
+        meta_path = self._path(bucket, key, meta=True)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            meta = {'contentType': content_type or 'application/octet-stream', 'etag': etag}
+            if checksum_sha256:
+                meta['checksumSha256'] = checksum_sha256
+            json.dump(meta, f)
+        return etag
+
+    def delete_object(self, bucket: str, key: str) -> None:
+        for path in (self._path(bucket, key), self._path(bucket, key, meta=True)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def list_keys(self, bucket: str, prefix: str = '') -> List[Tuple[str, int, float]]:
+        base = os.path.join(self.root, bucket)
+        keys = []
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                key = os.path.relpath(path, base).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    stat = os.stat(path)
+                    keys.append((key, stat.st_size, stat.st_mtime))
+        keys.sort()
+        return keys
+
+    def handle(self, method: str, bucket: str, key: str, query: str,
+               headers: Dict[str, str], body: bytes) -> Response:
+        '''Обрабатывает S3 запрос вида /<bucket>/<key>?<query>'''
+        params = parse_qs(query, keep_blank_values=True)
+        try:
+            if not key:
+                if method == 'GET':
+                    return self._list_objects(bucket, params)
+                if method == 'POST' and 'delete' in params:
+                    return self._delete_objects(bucket, body)
+                if method in ('PUT', 'HEAD'):
+                    return 200, {}, b''
+                return error_response(405, 'MethodNotAllowed', method)
+            if 'uploads' in params and method == 'POST':
+                return self._create_multipart(bucket, key, headers)
+            if 'uploadId' in params:
+                upload_id = params['uploadId'][0]
+                if method == 'PUT' and 'partNumber' in params:
+                    return self._upload_part(upload_id, int(params['partNumber'][0]), body)
+                if method == 'POST':
+                    return self._complete_multipart(bucket, key, upload_id, body)
+                if method == 'DELETE':
+                    return self._abort_multipart(upload_id)
+            if method == 'PUT':
+                checksum = headers.get('x-amz-checksum-sha256')
+                if checksum and base64.b64encode(hashlib.sha256(body).digest()).decode('ascii') != checksum:
+                    return error_response(400, 'BadDigest', 'The SHA256 you specified did not match the calculated checksum.')
+                etag = self.put_object(bucket, key, body, headers.get('content-type'), checksum_sha256=checksum)
+                response_headers = {'ETag': f'"{etag}"'}
+                if checksum:
+                    response_headers['x-amz-checksum-sha256'] = checksum
+                return 200, response_headers, b''
+            if method in ('GET', 'HEAD'):
+                status, response_headers, data = self._get_object(bucket, key, headers, head_only=(method == 'HEAD'))
+                # Переопределение заголовков ответа из presigned GET (response-content-disposition и т.п.)
+                if status in (200, 206):
+                    for param, header in RESPONSE_OVERRIDES.items():
+                        if param in params:
+                            response_headers[header] = params[param][0]
+                return status, response_headers, data
+            if method == 'DELETE':
+                self.delete_object(bucket, key)
+                return 204, {}, b''
+        except ValueError as e:
+            return error_response(400, 'InvalidArgument', str(e))
+        return error_response(405, 'MethodNotAllowed', method)
+
+    def _multipart_dir(self, upload_id: str) -> str:
+        base = os.path.join(self.root, '.multipart')
+        path = os.path.abspath(os.path.join(base, upload_id))
+        if not path.startswith(base + os.sep) or not os.path.isdir(path):
+            raise FileNotFoundError(upload_id)
+        return path
+
+    def _create_multipart(self, bucket: str, key: str, headers: Dict[str, str]) -> Response:
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.root, '.multipart', upload_id)
+        os.makedirs(path)
+        with open(os.path.join(path, 'upload.json'), 'w', encoding='utf-8') as f:
+            json.dump({'bucket': bucket, 'key': key, 'contentType': headers.get('content-type')}, f)
+        xml = (f'<InitiateMultipartUploadResult xmlns="{S3_NS}"><Bucket>{escape(bucket)}</Bucket>'
+               f'<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+        return 200, {'Content-Type': 'application/xml'}, xml.encode('utf-8')
+
+    def _upload_part(self, upload_id: str, part_number: int, body: bytes) -> Response:
+        try:
+            path = self._multipart_dir(upload_id)
+        except FileNotFoundError:
+            return error_response(404, 'NoSuchUpload', upload_id)
+        with open(os.path.join(path, f'{part_number:05d}.part'), 'wb') as f:
+            f.write(body)
+        return 200, {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}, b''
+
+    def _complete_multipart(self, bucket: str, key: str, upload_id: str, body: bytes) -> Response:
+        try:
+            path = self._multipart_dir(upload_id)
+        except FileNotFoundError:
+            return error_response(404, 'NoSuchUpload', upload_id)
+        with open(os.path.join(path, 'upload.json'), 'r', encoding='utf-8') as f:
+            upload = json.load(f)
+        parts = []
+        for part in ElementTree.fromstring(body).iter():
+            if part.tag.endswith('Part'):
+                fields = {child.tag.split('}')[-1]: (child.text or '') for child in part}
+                parts.append((int(fields['PartNumber']), fields.get('ETag', '').strip('"')))
+        if not parts or [number for number, _ in parts] != sorted(number for number, _ in parts):
+            return error_response(400, 'InvalidPartOrder', upload_id)
+        data, digests = [], []
+        for number, etag in parts:
+            try:
+                with open(os.path.join(path, f'{number:05d}.part'), 'rb') as f:
+                    chunk = f.read()
+            except FileNotFoundError:
+                return error_response(400, 'InvalidPart', str(number))
+            digest = hashlib.md5(chunk)
+            if etag and digest.hexdigest() != etag:
+                return error_response(400, 'InvalidPart', str(number))
+            data.append(chunk)
+            digests.append(digest.digest())
+        # ETag составного объекта, как в S3: md5 от md5 частей и число частей
+        etag = f'{hashlib.md5(b"".join(digests)).hexdigest()}-{len(parts)}'
+        self.put_object(bucket, key, b''.join(data), upload.get('contentType'), etag=etag)
+        shutil.rmtree(path, ignore_errors=True)
+        xml = (f'<CompleteMultipartUploadResult xmlns="{S3_NS}"><Bucket>{escape(bucket)}</Bucket>'
+               f'<Key>{escape(key)}</Key><ETag>"{etag}"</ETag></CompleteMultipartUploadResult>')
+        return 200, {'Content-Type': 'application/xml'}, xml.encode('utf-8')
+
+    def _abort_multipart(self, upload_id: str) -> Response:
+        try:
+            shutil.rmtree(self._multipart_dir(upload_id))
+        except FileNotFoundError:
+            return error_response(404, 'NoSuchUpload', upload_id)
+        return 204, {}, b''
+
+    def _get_object(self, bucket: str, key: str, headers: Dict[str, str], head_only: bool) -> Response:
+        path = self._path(bucket, key)
+        if not os.path.isfile(path):
+            return error_response(404, 'NoSuchKey', key, head_only)
+        size = os.path.getsize(path)
+        meta = self._read_meta(bucket, key)
+        response_headers = {
+            'Content-Type': meta['contentType'],
+            'Accept-Ranges': 'bytes',
+            'Last-Modified': http_date(os.path.getmtime(path)),
+        }
+        if meta.get('etag'):
+            response_headers['ETag'] = f'"{meta["etag"]}"'
+        if meta.get('checksumSha256') and headers.get('x-amz-checksum-mode', '').upper() == 'ENABLED':
+            response_headers['x-amz-checksum-sha256'] = meta['checksumSha256']
+
+        start, end, status = 0, size - 1, 200
+        byte_range = parse_range(headers.get('range'), size)
+        if byte_range == 'invalid':
+            response_headers['Content-Range'] = f'bytes */{size}'
+            return 416, response_headers, b''
+        if byte_range:
+            start, end = byte_range
+            status = 206
+            response_headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        response_headers['Content-Length'] = str(end - start + 1 if size else 0)
+        if head_only or not size:
+            return status, response_headers, b''
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        return status, response_headers, data
+
+    def _list_objects(self, bucket: str, params: Dict[str, List[str]]) -> Response:
+        prefix = params.get('prefix', [''])[0]
+        max_keys = int(params.get('max-keys', ['1000'])[0])
+        after = params.get('continuation-token', params.get('start-after', ['']))[0]
+        keys = [item for item in self.list_keys(bucket, prefix) if item[0] > after]
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        parts = [f'<ListBucketResult xmlns="{S3_NS}"><Name>{escape(bucket)}</Name>',
+                 f'<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>',
+                 f'<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{str(truncated).lower()}</IsTruncated>']
+        if truncated:
+            parts.append(f'<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>')
+        for key, size, mtime in page:
+            parts.append(
+                f'<Contents><Key>{escape(key)}</Key><LastModified>{iso_date(mtime)}</LastModified>'
+                f'<Size>{size}</Size><StorageClass>STANDARD</StorageClass></Contents>'
+            )
+        parts.append('</ListBucketResult>')
+        return 200, {'Content-Type': 'application/xml'}, ''.join(parts).encode('utf-8')
+
+    def _delete_objects(self, bucket: str, body: bytes) -> Response:
+        root = ElementTree.fromstring(body)
+        deleted = []
+        for obj in root.iter():
+            if obj.tag.endswith('Object'):
+                key_el = next((child for child in obj if child.tag.endswith('Key')), None)
+                if key_el is not None and key_el.text:
+                    self.delete_object(bucket, key_el.text)
+                    deleted.append(key_el.text)
+        result = ''.join(f'<Deleted><Key>{escape(key)}</Key></Deleted>' for key in deleted)
+        xml = f'<DeleteResult xmlns="{S3_NS}">{result}</DeleteResult>'
+        return 200, {'Content-Type': 'application/xml'}, xml.encode('utf-8')
+
+def parse_range(header: Optional[str], size: int):
+    '''Разбирает заголовок Range: bytes=a-b | bytes=a- | bytes=-n (один диапазон)'''
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first == '':
+            length = int(last)
+            if length <= 0:
+                return 'invalid'
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return 'invalid'
+    return start, min(end, size - 1)
+
+def error_response(status: int, code: str, message: str, head_only: bool = False) -> Response:
+    if head_only:
+        return status, {}, b''
+    xml = f'<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>'
+    return status, {'Content-Type': 'application/xml'}, xml.encode('utf-8')
+
+def http_date(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+def iso_date(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
@@ -0,0 +1,247 @@
+'''
+Локальный HTTP сервер, который поднимает все функции из backend/ в одном процессе
+Нужен для нагрузочного тестирования без облачного рантайма функций.
+
+Маршруты:
+    /<function>/...                      - handler(event, context) из backend/<function>/index.py
+    /_s3/<bucket>/<key>                  - файловая замена S3 (см. fs_s3.py)
+    /cdn/projects/<id>/bucket/<key>      - публичная раздача объектов бакета files (как CDN)
+
+HTTP запрос переводится в тот же event, что и в облаке: httpMethod, path,
+queryStringParameters, headers, body/isBase64Encoded, requestContext.identity.
+Функции подключаются к DATABASE_URL (локальный Postgres), boto3 в upload/download/lessons
+направляется на /_s3 через S3_ENDPOINT_URL и S3_PUBLIC_URL.
+
+Запуск:
+    DATABASE_URL=postgresql://... python backend/local/server.py --port 8000 --workers 4
+
+--workers N запускает N процессов на одном сокете (prefork), каждый со своим пулом соединений.
+'''
+import os
+import sys
+import json
+import time
+import base64
+import signal
+import argparse
+import importlib.util
+import traceback
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Optional, List
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+from fs_s3 import FilesystemS3
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+S3_PREFIX = '/_s3/'
+CDN_PREFIX = '/cdn/'
+CDN_BUCKET = 'files'
+
+def discover_functions() -> List[str]:
+    '''Имена функций: каталоги backend/ с index.py'''
+    return sorted(
+        name for name in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py'))
+    )
+
+def load_handler(name: str):
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    spec = importlib.util.spec_from_file_location(f"fn_{name.replace('-', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+class InvocationContext:
+    '''Минимальный аналог context облачной функции'''
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.request_id = f'{os.getpid()}-{time.monotonic_ns()}'
+        self.memory_limit_in_mb = 128
+
+def build_event(method: str, path: str, query: str, headers: Dict[str, str],
+                body: bytes, client_ip: str) -> Dict[str, Any]:
+    '''Переводит HTTP запрос в event облачной функции'''
+    try:
+        body_text, is_base64 = body.decode('utf-8'), False
+    except UnicodeDecodeError:
+        body_text, is_base64 = base64.b64encode(body).decode('ascii'), True
+    return {
+        'httpMethod': method,
+        'path': path,
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(query, keep_blank_values=True)),
+        'body': body_text,
+        'isBase64Encoded': is_base64,
+        'requestContext': {
+            'requestId': f'{os.getpid()}-{time.monotonic_ns()}',
+            'identity': {
+                'sourceIp': client_ip,
+                'userAgent': headers.get('User-Agent', ''),
+            },
+        },
+    }
+
+class LocalRuntime:
+    '''
+    Args:
+        functions - загруженные handler по имени функции
+        s3 - файловое хранилище для /_s3 и /cdn
+    '''
+    def __init__(self, functions: Dict[str, Any], s3: FilesystemS3):
+        self.functions = functions
+        self.s3 = s3
+
+    def invoke(self, name: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        handler = self.functions.get(name)
+        if handler is None:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8'},
+                'body': json.dumps({'error': f'Function {name} not found'}),
+            }
+        try:
+            return handler(event, InvocationContext(name))
+        except Exception:
+            traceback.print_exc()
+            return {
+                'statusCode': 502,
+                'headers': {'Content-Type': 'application/json; charset=utf-8'},
+                'body': json.dumps({'error': 'Function raised an unhandled exception'}),
+            }
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    runtime: LocalRuntime = None
+    quiet = False
+
+    def log_message(self, format: str, *args) -> None:
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _read_body(self) -> bytes:
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b''.join(chunks)
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status: int, headers: Dict[str, str], body: bytes, head_only: bool = False) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            if name.lower() != 'content-length':
+                self.send_header(name, str(value))
+        self.send_header('Content-Length', headers.get('Content-Length') or str(len(body)))
+        self.end_headers()
+        if body and not head_only:
+            self.wfile.write(body)
+
+    def _dispatch(self) -> None:
+        split = urlsplit(self.path)
+        path = unquote(split.path)
+        body = self._read_body()
+        headers = {name: value for name, value in self.headers.items()}
+
+        if path.startswith(S3_PREFIX):
+            bucket, _, key = path[len(S3_PREFIX):].partition('/')
+            lower_headers = {name.lower(): value for name, value in headers.items()}
+            status, response_headers, data = self.runtime.s3.handle(
+                self.command, bucket, key, split.query, lower_headers, body
+            )
+            self._send(status, response_headers, data, head_only=(self.command == 'HEAD'))
+            return
+
+        if path.startswith(CDN_PREFIX) and '/bucket/' in path:
+            key = path.split('/bucket/', 1)[1]
+            lower_headers = {name.lower(): value for name, value in headers.items()}
+            status, response_headers, data = self.runtime.s3.handle(
+                self.command if self.command == 'HEAD' else 'GET', CDN_BUCKET, key, '', lower_headers, b''
+            )
+            response_headers['Access-Control-Allow-Origin'] = '*'
+            self._send(status, response_headers, data, head_only=(self.command == 'HEAD'))
+            return
+
+        name, _, rest = path.lstrip('/').partition('/')
+        event = build_event(self.command, '/' + rest, split.query, headers, body, self.client_address[0])
+        response = self.runtime.invoke(name, event)
+
+        response_body = response.get('body') or ''
+        if response.get('isBase64Encoded'):
+            data = base64.b64decode(response_body)
+        elif isinstance(response_body, (dict, list)):
+            data = json.dumps(response_body).encode('utf-8')
+        else:
+            data = str(response_body).encode('utf-8')
+        self._send(int(response.get('statusCode', 200)), response.get('headers') or {}, data,
+                   head_only=(self.command == 'HEAD'))
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_OPTIONS = do_HEAD = _dispatch
+
+def configure_environment(base_url: str) -> None:
+    '''Направляет функции на локальную замену S3, если переменные не заданы явно'''
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'local')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'local')
+    os.environ.setdefault('S3_ENDPOINT_URL', base_url + S3_PREFIX.rstrip('/'))
+    os.environ.setdefault('S3_PUBLIC_URL', f"{base_url}{CDN_PREFIX}projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket")
+
+def serve(server: ThreadingHTTPServer) -> None:
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def run_workers(server: ThreadingHTTPServer, workers: int) -> None:
+    '''Prefork: дочерние процессы принимают соединения на уже открытом сокете'''
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            serve(server)
+            os._exit(0)
+        children.append(pid)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Локальный рантайм функций backend/')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1, help='Число процессов (prefork)')
+    parser.add_argument('--s3-dir', default=os.environ.get('LOCAL_S3_DIR', '.local-s3'),
+                        help='Каталог файловой замены S3')
+    parser.add_argument('--functions', default='', help='Список функций через запятую (по умолчанию все)')
+    parser.add_argument('--quiet', action='store_true', help='Не печатать access log')
+    args = parser.parse_args(argv)
+
+    configure_environment(f'http://{args.host}:{args.port}')
+    if 'DATABASE_URL' not in os.environ:
+        print('[WARNING] DATABASE_URL is not set, functions with database access will fail')
+
+    names = [name for name in args.functions.split(',') if name] or discover_functions()
+    functions = {name: load_handler(name) for name in names}
+
+    RequestHandler.runtime = LocalRuntime(functions, FilesystemS3(args.s3_dir))
+    RequestHandler.quiet = args.quiet
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    server.daemon_threads = True
+    print(f"Serving {', '.join(names)} on http://{args.host}:{args.port} ({args.workers} worker(s))")
+
+    if args.workers > 1:
+        run_workers(server, args.workers)
+    else:
+        serve(server)
+    server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,25 @@
 import json
 import os
+import sys
 import psycopg2
 import jwt
 from datetime import datetime
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.logger import log_action
+from common.pagination import wants_page, parse_page, split_page, parse_bool
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
-def log_action(conn, level: str, action: str, message: str, user_id: Optional[int] = None, 
-               ip_address: Optional[str] = None, user_agent: Optional[str] = None, 
-               details: Optional[Dict[str, Any]] = None) -> None:
-    try:
-        with conn.cursor() as cur:
-            cur.execute('''
-                INSERT INTO system_logs (level, action, message, user_id, ip_address, user_agent, details)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (level, action, message, user_id, ip_address, user_agent, json.dumps(details) if details else None))
-            conn.commit()
-    except Exception as e:
-        print(f"[WARNING] Failed to create log: {e}")
+# Завершенные уроки читаются из lesson_completions (массив course_progress_v2.completed_lesson_ids больше не ведется)
+COMPLETED_LESSON_IDS_SQL = (
+    "(SELECT COALESCE(jsonb_agg(lc.lesson_id::text ORDER BY lc.completed_at, lc.id), '[]'::jsonb) "
+    "FROM lesson_completions lc WHERE lc.user_id = cp.user_id AND lc.course_id = cp.course_id)"
+)
 
 class CompleteLessonRequest(BaseModel):
     courseId: int = Field(..., ge=1)
@@ -31,10 +30,6 @@ class SubmitTestRequest(BaseModel):
     testId: str = Field(..., min_length=1)
     answers: Dict[str, Any]
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
-
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -67,11 +62,63 @@ def format_progress_response(progress_row: tuple) -> Dict[str, Any]:
         'earnedRewards': progress_row[9] if len(progress_row) > 9 and progress_row[9] else [],
     }
 
+def reset_course_progress(cur, course_id: int, reset_type: str) -> Dict[str, int]:
+    '''
+    Сбрасывает прогресс всех слушателей курса постоянным числом запросов (не зависит от числа слушателей)
+    Args:
+        reset_type - reset_all: удалить весь прогресс; reset_tests: только результаты тестов
+                     и тестовые уроки в прогрессе; keep: ничего не менять
+    Returns: число затронутых строк по таблицам
+    '''
+    affected = {}
+    if reset_type not in ('reset_all', 'reset_tests'):
+        return affected
+    
+    # Результаты тестов (из обеих таблиц) и попытки удаляются в обоих режимах
+    cur.execute("DELETE FROM test_results WHERE course_id = %s", (course_id,))
+    affected['testResults'] = cur.rowcount
+    cur.execute("DELETE FROM test_results_v2 WHERE course_id = %s", (course_id,))
+    affected['testResultsV2'] = cur.rowcount
+    cur.execute("DELETE FROM test_attempts_v2 WHERE course_id = %s", (course_id,))
+    affected['testAttempts'] = cur.rowcount
+    
+    if reset_type == 'reset_all':
+        cur.execute("DELETE FROM lesson_completions WHERE course_id = %s", (course_id,))
+        affected['lessonCompletions'] = cur.rowcount
+        # Удаляем весь прогресс по курсу (должно быть последним)
+        cur.execute("DELETE FROM course_progress_v2 WHERE course_id = %s", (course_id,))
+        affected['progressDeleted'] = cur.rowcount
+        return affected
+    
+    cur.execute(
+        "DELETE FROM lesson_completions WHERE course_id = %s AND lesson_id IN "
+        "(SELECT id FROM lessons_v2 WHERE course_id = %s AND type = 'test')",
+        (course_id, course_id)
+    )
+    affected['lessonCompletions'] = cur.rowcount
+    
+    # Счетчики всех слушателей пересчитываются по оставшимся завершениям одним UPDATE
+    cur.execute(
+        "UPDATE course_progress_v2 cp SET "
+        "completed_lessons = (SELECT COUNT(*) FROM lesson_completions lc "
+        "    WHERE lc.user_id = cp.user_id AND lc.course_id = cp.course_id), "
+        "test_score = 0, "
+        "completed = false, "
+        "completed_at = NULL, "
+        "earned_rewards = '[]'::jsonb "
+        "WHERE cp.course_id = %s AND cp.completed_lessons > 0",
+        (course_id,)
+    )
+    affected['progressUpdated'] = cur.rowcount
+    return affected
+
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Отслеживание прогресса обучения
     GET ?userId=x - прогресс пользователя по всем курсам
     GET ?userId=x&courseId=y - прогресс по конкретному курсу
+    GET (админ) - весь прогресс, фильтры courseId, completed; постранично с limit и cursor
     POST ?action=complete - отметить урок завершенным
     POST ?action=submit - отправить результаты теста
     POST ?action=reset - сбросить прогресс по курсу (только админ)
@@ -127,7 +174,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 "SELECT cp.course_id, cp.user_id, cp.completed_lessons, "
                 "(SELECT COUNT(*) FROM lessons_v2 WHERE course_id = cp.course_id) as total_lessons, "
                 "cp.test_score, cp.completed, "
-                "cp.completed_lesson_ids, cp.last_accessed_lesson, cp.started_at, cp.earned_rewards "
+                + COMPLETED_LESSON_IDS_SQL + ", cp.last_accessed_lesson, cp.started_at, cp.earned_rewards "
                 "FROM course_progress_v2 cp WHERE cp.user_id = %s AND cp.course_id = %s",
                 (int(user_id), course_id_int)
             )
@@ -144,7 +191,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            # Пересчитываем completed_lessons из массива
+            # completed_lessons по списку завершенных уроков
             completed_lesson_ids = progress[6] if progress[6] else []
             actual_completed = len(completed_lesson_ids)
             
@@ -180,7 +227,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 "SELECT cp.course_id, cp.user_id, cp.completed_lessons, "
                 "(SELECT COUNT(*) FROM lessons_v2 WHERE course_id = cp.course_id) as total_lessons, "
                 "cp.test_score, cp.completed, "
-                "cp.completed_lesson_ids, cp.last_accessed_lesson, cp.started_at, cp.earned_rewards "
+                + COMPLETED_LESSON_IDS_SQL + ", cp.last_accessed_lesson, cp.started_at, cp.earned_rewards "
                 "FROM course_progress_v2 cp WHERE cp.user_id = %s ORDER BY cp.started_at DESC",
                 (int(user_id),)
             )
@@ -216,14 +263,57 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        # GET без параметров - весь прогресс (только для админа)
-        cur.execute(
+        # GET без userId - весь прогресс (только для админа)
+        if payload.get('role') != 'admin':
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ запрещен'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        try:
+            limit, after = parse_page(query_params, key_size=1) if wants_page(query_params) else (None, None)
+            conditions, params = [], []
+            if course_id_int:
+                conditions.append("course_id = %s")
+                params.append(course_id_int)
+            completed_filter = parse_bool(query_params.get('completed'))
+            if completed_filter is not None:
+                conditions.append("completed = %s")
+                params.append(completed_filter)
+            if after:
+                conditions.append("id < %s")
+                params.append(int(after[0]))
+        except (ValueError, TypeError) as e:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        where = ("WHERE " + " AND ".join(conditions) + " ") if conditions else ""
+        columns = (
             "SELECT course_id, user_id, completed_lessons, total_lessons, test_score, completed, "
-            "completed_lesson_ids, last_accessed_lesson, started_at, earned_rewards "
-            "FROM course_progress_v2 ORDER BY started_at DESC"
+            + COMPLETED_LESSON_IDS_SQL + ", last_accessed_lesson, started_at, earned_rewards, id "
+            "FROM course_progress_v2 cp "
         )
-        progress_rows = cur.fetchall()
-        progress_list = [format_progress_response(p) for p in progress_rows]
+        if limit is None:
+            cur.execute(columns + where + "ORDER BY started_at DESC", params)
+            response_data = {'progress': [format_progress_response(p) for p in cur.fetchall()]}
+        else:
+            # Keyset по id: страница не зависит от объема таблицы
+            cur.execute(columns + where + "ORDER BY id DESC LIMIT %s", params + [limit + 1])
+            progress_rows, next_cursor = split_page(cur.fetchall(), limit, key=lambda row: [row[10]])
+            response_data = {
+                'progress': [format_progress_response(p) for p in progress_rows],
+                'nextCursor': next_cursor
+            }
         
         cur.close()
         conn.close()
@@ -231,7 +321,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'progress': progress_list}, ensure_ascii=False),
+            'body': json.dumps(response_data, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
@@ -298,8 +388,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         cur.execute(
             "SELECT course_id, user_id, completed_lessons, total_lessons, test_score, completed, "
-            "completed_lesson_ids, last_accessed_lesson, started_at, earned_rewards "
-            "FROM course_progress_v2 WHERE user_id = %s AND course_id = %s",
+            + COMPLETED_LESSON_IDS_SQL + ", last_accessed_lesson, started_at, earned_rewards "
+            "FROM course_progress_v2 cp WHERE user_id = %s AND course_id = %s",
             (payload['user_id'], course_id)
         )
         progress = cur.fetchone()
@@ -320,10 +410,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         complete_req = CompleteLessonRequest(**body_data)
         
         course_id = complete_req.courseId
+        user_id_int = int(payload['user_id'])
         
         # Проверка доступа к курсу
         cur.execute(
-            "SELECT access_type FROM courses_v2 WHERE id = %s",
+            "SELECT access_type, title FROM courses_v2 WHERE id = %s",
             (course_id,)
         )
         course_data = cur.fetchone()
@@ -338,10 +429,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        access_type = course_data[0]
+        access_type, course_title = course_data
         
         if access_type == 'closed':
-            user_id_int = int(payload['user_id'])
             cur.execute(
                 "SELECT id FROM course_assignments_v2 WHERE course_id = %s AND user_id = %s",
                 (course_id, user_id_int)
@@ -371,116 +461,81 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        # Получаем текущий прогресс
+        # Создаем прогресс если его нет
+        now = datetime.utcnow()
         cur.execute(
-            "SELECT id, completed_lesson_ids FROM course_progress_v2 WHERE user_id = %s AND course_id = %s",
-            (int(payload['user_id']), course_id)
+            "INSERT INTO course_progress_v2 (course_id, user_id, completed_lessons, total_lessons, "
+            "completed, started_at, created_at, updated_at) "
+            "SELECT %s, %s, 0, lessons_count, false, %s, %s, %s FROM courses_v2 WHERE id = %s "
+            "ON CONFLICT (course_id, user_id) DO NOTHING",
+            (course_id, user_id_int, now, now, now, course_id)
         )
-        progress = cur.fetchone()
         
-        if not progress:
-            # Создаем прогресс если его нет
-            now = datetime.utcnow()
-            
+        # Идемпотентная запись о завершении: повторный вызов ничего не меняет
+        cur.execute(
+            "INSERT INTO lesson_completions (user_id, course_id, lesson_id) VALUES (%s, %s, %s) "
+            "ON CONFLICT (user_id, lesson_id) DO NOTHING RETURNING id",
+            (user_id_int, course_id, int(complete_req.lessonId))
+        )
+        
+        if cur.fetchone():
+            # Урок засчитан впервые - счетчик увеличивается на единицу в одном UPDATE под блокировкой
+            # строки (параллельные завершения не теряют друг друга), число уроков курса - courses_v2.lessons_count
             cur.execute(
-                "INSERT INTO course_progress_v2 (course_id, user_id, completed_lessons, total_lessons, "
-                "completed, started_at, completed_lesson_ids, last_accessed_lesson, created_at, updated_at) "
-                "SELECT %s, %s, 1, lessons_count, false, %s, %s, %s, %s, %s FROM courses_v2 WHERE id = %s "
-                "RETURNING id",
-                (course_id, int(payload['user_id']), now, 
-                 json.dumps([complete_req.lessonId]), complete_req.lessonId, now, now, course_id)
+                "UPDATE course_progress_v2 cp SET "
+                "completed_lessons = COALESCE(cp.completed_lessons, 0) + 1, "
+                "total_lessons = c.lessons_count, "
+                "last_accessed_lesson = %(lesson_id)s, "
+                "completed = COALESCE(cp.completed_lessons, 0) + 1 >= c.lessons_count, "
+                "completed_at = CASE WHEN COALESCE(cp.completed_lessons, 0) + 1 >= c.lessons_count "
+                "THEN NOW() ELSE NULL END, "
+                "updated_at = NOW() "
+                "FROM courses_v2 c "
+                "WHERE c.id = cp.course_id AND cp.user_id = %(user_id)s AND cp.course_id = %(course_id)s "
+                "RETURNING cp.id, cp.completed",
+                {'course_id': course_id, 'user_id': user_id_int, 'lesson_id': complete_req.lessonId}
             )
-            progress_id = cur.fetchone()[0]
-        else:
-            progress_id = progress[0]
-            completed_lesson_ids = progress[1] if progress[1] else []
+            progress_id, is_course_completed = cur.fetchone()
             
-            # Добавляем урок если его еще нет
-            if complete_req.lessonId not in completed_lesson_ids:
-                completed_lesson_ids.append(complete_req.lessonId)
-                
-                # Проверяем, завершен ли курс (все уроки пройдены)
+            # Если курс завершен, выдаем награды (избегаем дубликатов)
+            if is_course_completed:
                 cur.execute(
-                    "SELECT COUNT(*) FROM lessons_v2 WHERE course_id = %s",
-                    (course_id,)
+                    "WITH new_rewards AS ("
+                    "    SELECT r.id, r.name FROM rewards_v2 r, course_progress_v2 cp "
+                    "    WHERE r.course_id = %s AND cp.id = %s "
+                    "    AND NOT COALESCE(cp.earned_rewards, '[]'::jsonb) @> jsonb_build_array(r.id)"
+                    "), "
+                    "updated AS ("
+                    "    UPDATE course_progress_v2 SET earned_rewards = "
+                    "    COALESCE(earned_rewards, '[]'::jsonb) || (SELECT jsonb_agg(id) FROM new_rewards) "
+                    "    WHERE id = %s AND EXISTS (SELECT 1 FROM new_rewards)"
+                    ") "
+                    "SELECT id, name FROM new_rewards",
+                    (course_id, progress_id, progress_id)
                 )
-                total_lessons = cur.fetchone()[0]
-                is_course_completed = len(completed_lesson_ids) >= total_lessons
+                new_rewards = cur.fetchall()
                 
-                cur.execute(
-                    "UPDATE course_progress_v2 SET completed_lessons = %s, completed_lesson_ids = %s, "
-                    "last_accessed_lesson = %s, completed = %s, completed_at = %s, updated_at = NOW() WHERE id = %s",
-                    (len(completed_lesson_ids), json.dumps(completed_lesson_ids), 
-                     complete_req.lessonId, is_course_completed, 
-                     datetime.utcnow() if is_course_completed else None, progress_id)
-                )
+                # Логируем получение наград
+                for reward_id, reward_title in new_rewards:
+                    log_action('success', 'reward.earned', 
+                              f"Получена награда '{reward_title}' за завершение курса '{course_title}'",
+                              user_id=user_id_int,
+                              details={'reward_id': reward_id, 'course_id': course_id})
                 
-                # Если курс завершен, выдаем награды
-                if is_course_completed:
-                    # Ищем награды, привязанные к этому курсу
-                    cur.execute(
-                        "SELECT id FROM rewards_v2 WHERE course_id = %s",
-                        (course_id,)
-                    )
-                    reward_ids = [row[0] for row in cur.fetchall()]
-                    
-                    if reward_ids:
-                        # Получаем текущие награды пользователя
-                        cur.execute(
-                            "SELECT earned_rewards FROM course_progress_v2 WHERE id = %s",
-                            (progress_id,)
-                        )
-                        current_rewards = cur.fetchone()[0] or []
-                        
-                        # Добавляем новые награды (избегаем дубликатов)
-                        updated_rewards = list(set(current_rewards + reward_ids))
-                        
-                        # Обновляем награды в прогрессе
-                        cur.execute(
-                            "UPDATE course_progress_v2 SET earned_rewards = %s WHERE id = %s",
-                            (json.dumps(updated_rewards), progress_id)
-                        )
-                        
-                        # Логируем получение наград
-                        new_rewards = [r for r in reward_ids if r not in current_rewards]
-                        if new_rewards:
-                            try:
-                                cur.execute("SELECT title FROM courses_v2 WHERE id = %s", (course_id,))
-                                course_row = cur.fetchone()
-                                course_title = course_row[0] if course_row else f"Курс #{course_id}"
-                                
-                                for reward_id in new_rewards:
-                                    cur.execute("SELECT title FROM rewards_v2 WHERE id = %s", (reward_id,))
-                                    reward_row = cur.fetchone()
-                                    reward_title = reward_row[0] if reward_row else f"Награда #{reward_id}"
-                                    
-                                    log_action(conn, 'success', 'reward.earned', 
-                                              f"Получена награда '{reward_title}' за завершение курса '{course_title}'",
-                                              user_id=int(payload['user_id']),
-                                              details={'reward_id': reward_id, 'course_id': course_id})
-                            except Exception as e:
-                                print(f"[WARNING] Failed to log reward: {e}")
-                    
-                    # Логируем завершение курса
-                    try:
-                        cur.execute("SELECT title FROM courses_v2 WHERE id = %s", (course_id,))
-                        course_row = cur.fetchone()
-                        course_title = course_row[0] if course_row else f"Курс #{course_id}"
-                        log_action(conn, 'success', 'course.complete', 
-                                  f"Завершен курс '{course_title}'",
-                                  user_id=int(payload['user_id']),
-                                  details={'course_id': course_id})
-                    except Exception as e:
-                        print(f"[WARNING] Failed to log course completion: {e}")
+                # Логируем завершение курса
+                log_action('success', 'course.complete', 
+                          f"Завершен курс '{course_title}'",
+                          user_id=user_id_int,
+                          details={'course_id': course_id})
         
         conn.commit()
         
         # Возвращаем обновленный прогресс
         cur.execute(
             "SELECT course_id, user_id, completed_lessons, total_lessons, test_score, completed, "
-            "completed_lesson_ids, last_accessed_lesson, started_at, earned_rewards "
-            "FROM course_progress_v2 WHERE user_id = %s AND course_id = %s",
-            (int(payload['user_id']), course_id)
+            + COMPLETED_LESSON_IDS_SQL + ", last_accessed_lesson, started_at, earned_rewards "
+            "FROM course_progress_v2 cp WHERE user_id = %s AND course_id = %s",
+            (user_id_int, course_id)
         )
         progress = cur.fetchone()
         progress_data = format_progress_response(progress)
@@ -582,81 +637,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        if reset_type == 'reset_all':
-            # Удаляем все результаты тестов по курсу (из обеих таблиц)
-            cur.execute(
-                "DELETE FROM test_results WHERE course_id = %s",
-                (reset_course_id,)
-            )
-            cur.execute(
-                "DELETE FROM test_results_v2 WHERE course_id = %s",
-                (reset_course_id,)
-            )
-            # Удаляем все попытки тестов по курсу
-            cur.execute(
-                "DELETE FROM test_attempts_v2 WHERE course_id = %s",
-                (reset_course_id,)
-            )
-            # Удаляем весь прогресс по курсу (должно быть последним)
-            cur.execute(
-                "DELETE FROM course_progress_v2 WHERE course_id = %s",
-                (reset_course_id,)
-            )
-        elif reset_type == 'reset_tests':
-            # Удаляем только результаты тестов (по course_id, из обеих таблиц)
-            cur.execute(
-                "DELETE FROM test_results WHERE course_id = %s",
-                (reset_course_id,)
-            )
-            cur.execute(
-                "DELETE FROM test_results_v2 WHERE course_id = %s",
-                (reset_course_id,)
-            )
-            # Удаляем все попытки тестов по курсу
-            cur.execute(
-                "DELETE FROM test_attempts_v2 WHERE course_id = %s",
-                (reset_course_id,)
-            )
-            # Получаем ID всех уроков типа 'test' для этого курса
-            cur.execute(
-                "SELECT id FROM lessons_v2 WHERE course_id = %s AND type = 'test'",
-                (reset_course_id,)
-            )
-            test_lesson_ids = [str(row[0]) for row in cur.fetchall()]
-            
-            # Для каждого прогресса удаляем из completed_lesson_ids только тестовые уроки
-            cur.execute(
-                "SELECT user_id, completed_lesson_ids FROM course_progress_v2 WHERE course_id = %s",
-                (reset_course_id,)
-            )
-            progress_rows = cur.fetchall()
-            
-            for user_id, completed_ids in progress_rows:
-                if completed_ids:
-                    # Убираем ID тестовых уроков из массива
-                    updated_ids = [lid for lid in completed_ids if lid not in test_lesson_ids]
-                    
-                    # Обновляем прогресс
-                    cur.execute(
-                        "UPDATE course_progress_v2 SET "
-                        "completed_lesson_ids = %s, "
-                        "completed_lessons = %s, "
-                        "test_score = 0, "
-                        "completed = false, "
-                        "earned_rewards = '[]'::jsonb "
-                        "WHERE course_id = %s AND user_id = %s",
-                        (json.dumps(updated_ids), len(updated_ids), reset_course_id, user_id)
-                    )
-        # Если reset_type == 'keep', ничего не делаем
+        # resetType=keep ничего не меняет, остальные режимы - постоянное число запросов
+        affected = reset_course_progress(cur, int(reset_course_id), reset_type)
         
         conn.commit()
         cur.close()
         conn.close()
         
+        if affected:
+            log_action('warning', 'progress.reset',
+                      f"Сброшен прогресс курса #{reset_course_id} ({reset_type})",
+                      user_id=payload.get('user_id'),
+                      details={'course_id': int(reset_course_id), 'reset_type': reset_type, 'affected': affected})
+        
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Прогресс успешно сброшен'}, ensure_ascii=False),
+            'body': json.dumps({'message': 'Прогресс успешно сброшен', 'affected': affected}, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
@@ -698,6 +695,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             (int(user_id), course_id_int)
         )
         
+        cur.execute(
+            "DELETE FROM lesson_completions WHERE user_id = %s AND course_id = %s",
+            (int(user_id), course_id_int)
+        )
+        
         # Удаляем прогресс пользователя по курсу
         cur.execute(
             "DELETE FROM course_progress_v2 WHERE user_id = %s AND course_id = %s",
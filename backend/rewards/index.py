@@ -1,9 +1,13 @@
 import json
 import os
+import sys
 import psycopg2
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field, ValidationError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+
 class RewardCreate(BaseModel):
     name: str = Field(..., min_length=1)
     icon: str = Field(..., min_length=1)
@@ -22,10 +26,33 @@ class RewardUpdate(BaseModel):
     condition: Optional[str] = None
     bonuses: Optional[List[str]] = None
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
+# earnedCount считается в том же запросе: LATERAL-подзапрос на каждую награду
+# использует GIN-индекс idx_course_progress_v2_earned_rewards по оператору @>
+REWARDS_QUERY = (
+    "SELECT r.id, r.name, r.icon, r.color, r.course_id, r.description, r.condition, r.bonuses, r.created_at, "
+    "ec.earned_count "
+    "FROM rewards_v2 r "
+    "CROSS JOIN LATERAL ("
+    "    SELECT COUNT(*) AS earned_count FROM course_progress_v2 cp "
+    "    WHERE cp.earned_rewards @> jsonb_build_array(r.id)"
+    ") ec "
+)
+
+def format_reward_response(row: tuple) -> Dict[str, Any]:
+    return {
+        'id': row[0],
+        'name': row[1],
+        'icon': row[2],
+        'color': row[3],
+        'courseId': row[4],
+        'description': row[5],
+        'condition': row[6],
+        'bonuses': row[7] if row[7] else [],
+        'createdAt': row[8].isoformat() if row[8] else None,
+        'earnedCount': row[9]
+    }
 
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление наградами: получение, создание, обновление, удаление наград
@@ -57,11 +84,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         course_id = query_params.get('courseId')
         
         if reward_id:
-            cur.execute(
-                "SELECT id, name, icon, color, course_id, description, condition, bonuses, created_at "
-                "FROM rewards_v2 WHERE id = %s",
-                (reward_id,)
-            )
+            cur.execute(REWARDS_QUERY + "WHERE r.id = %s", (reward_id,))
             row = cur.fetchone()
             
             if not row:
@@ -74,25 +97,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            # Считаем сколько пользователей получили эту награду через JSONB
-            cur.execute(
-                "SELECT COUNT(*) FROM course_progress_v2 WHERE earned_rewards @> %s::jsonb",
-                (f'[{reward_id}]',)
-            )
-            earned_count = cur.fetchone()[0]
-            
-            reward = {
-                'id': row[0],
-                'name': row[1],
-                'icon': row[2],
-                'color': row[3],
-                'courseId': row[4],
-                'description': row[5],
-                'condition': row[6],
-                'bonuses': row[7] if row[7] else [],
-                'createdAt': row[8].isoformat() if row[8] else None,
-                'earnedCount': earned_count
-            }
+            reward = format_reward_response(row)
             
             cur.close()
             conn.close()
@@ -105,40 +110,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         if course_id:
-            cur.execute(
-                "SELECT id, name, icon, color, course_id, description, condition, bonuses, created_at "
-                "FROM rewards_v2 WHERE course_id = %s ORDER BY created_at DESC",
-                (course_id,)
-            )
+            cur.execute(REWARDS_QUERY + "WHERE r.course_id = %s ORDER BY r.created_at DESC", (course_id,))
         else:
-            cur.execute(
-                "SELECT id, name, icon, color, course_id, description, condition, bonuses, created_at "
-                "FROM rewards_v2 ORDER BY created_at DESC"
-            )
+            cur.execute(REWARDS_QUERY + "ORDER BY r.created_at DESC")
         
-        rows = cur.fetchall()
-        
-        rewards = []
-        for row in rows:
-            # Считаем сколько пользователей получили эту награду через JSONB
-            cur.execute(
-                "SELECT COUNT(*) FROM course_progress_v2 WHERE earned_rewards @> %s::jsonb",
-                (f'[{row[0]}]',)
-            )
-            earned_count = cur.fetchone()[0]
-            
-            rewards.append({
-                'id': row[0],
-                'name': row[1],
-                'icon': row[2],
-                'color': row[3],
-                'courseId': row[4],
-                'description': row[5],
-                'condition': row[6],
-                'bonuses': row[7] if row[7] else [],
-                'createdAt': row[8].isoformat() if row[8] else None,
-                'earnedCount': earned_count
-            })
+        rewards = [format_reward_response(row) for row in cur.fetchall()]
         
         cur.close()
         conn.close()
@@ -1,11 +1,16 @@
 import json
 import os
+import sys
 import psycopg2
 import jwt
 from datetime import datetime
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.prepared import register_statement, execute_prepared
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
@@ -16,10 +21,6 @@ class RecordAttemptRequest(BaseModel):
     score: int = Field(..., ge=0, le=100)
     passed: bool
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
-
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -38,13 +39,102 @@ def require_auth(headers: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Opt
     
     return payload, None
 
-def escape_sql_string(value: str) -> str:
-    return value.replace("'", "''")
+# Лимит из tests_v2 и счетчики пользователя по урокам-тестам одним запросом
+ATTEMPTS_STATUS_SELECT = (
+    "SELECT l.id, l.test_id, t.attempts, a.attempts_used, a.max_attempts, a.best_score, a.last_attempt_at "
+    "FROM lessons_v2 l "
+    "LEFT JOIN tests_v2 t ON t.id = l.test_id "
+    "LEFT JOIN test_attempts_v2 a ON a.user_id = %(user_id)s AND a.lesson_id = l.id::text "
+)
+
+# Горячие запросы готовятся один раз на соединение пула (PREPARE) и дальше только выполняются
+LESSON_ATTEMPTS = register_statement(
+    'attempts_lesson_status',
+    ATTEMPTS_STATUS_SELECT + "WHERE l.id = %(lesson_num)s",
+    ('integer', 'integer')
+)
+
+COURSE_ATTEMPTS = register_statement(
+    'attempts_course_status',
+    ATTEMPTS_STATUS_SELECT + "WHERE l.course_id = %(course_id)s AND l.test_id IS NOT NULL ORDER BY l.\"order\", l.id",
+    ('integer', 'integer')
+)
+
+# Списание попытки одним оператором: вставка первой попытки или увеличение счетчика.
+# Проверка лимита выполняется в ON CONFLICT ... WHERE под блокировкой строки,
+# поэтому параллельные старты не могут превысить лимит
+START_ATTEMPT = register_statement(
+    'attempts_start',
+    "WITH lesson AS ("
+    "    SELECT l.test_id, l.course_id, COALESCE(t.attempts, 0) AS max_attempts "
+    "    FROM lessons_v2 l LEFT JOIN tests_v2 t ON t.id = l.test_id "
+    "    WHERE l.id = %(lesson_num)s AND l.test_id IS NOT NULL"
+    "), started AS ("
+    "    INSERT INTO test_attempts_v2 (user_id, test_id, lesson_id, course_id, "
+    "    attempts_used, max_attempts, created_at, last_attempt_at) "
+    "    SELECT %(user_id)s, test_id, %(lesson_id)s, course_id, 1, max_attempts, NOW(), NOW() FROM lesson "
+    "    ON CONFLICT (user_id, lesson_id) DO UPDATE SET "
+    "    attempts_used = test_attempts_v2.attempts_used + 1, "
+    "    max_attempts = EXCLUDED.max_attempts, "
+    "    last_attempt_at = NOW() "
+    "    WHERE EXCLUDED.max_attempts <= 0 OR test_attempts_v2.attempts_used < EXCLUDED.max_attempts "
+    "    RETURNING attempts_used, max_attempts"
+    ") "
+    "SELECT lesson.max_attempts, started.attempts_used, started.max_attempts "
+    "FROM lesson LEFT JOIN started ON true",
+    ('integer', 'integer', 'text')
+)
+
+ATTEMPTS_USED = register_statement(
+    'attempts_used',
+    "SELECT attempts_used FROM test_attempts_v2 WHERE user_id = %(user_id)s AND lesson_id = %(lesson_id)s",
+    ('integer', 'text')
+)
+
+# Результат попытки: лучший балл обновляется в том же операторе, что и вставка записи
+RECORD_ATTEMPT = register_statement(
+    'attempts_record',
+    "INSERT INTO test_attempts_v2 (user_id, test_id, lesson_id, course_id, "
+    "attempts_used, max_attempts, best_score, created_at, last_attempt_at) "
+    "SELECT %(user_id)s, %(test_id)s, %(lesson_id)s, %(course_id)s, 1, "
+    "COALESCE((SELECT attempts FROM tests_v2 WHERE id = %(test_id)s), 0), %(score)s, NOW(), NOW() "
+    "ON CONFLICT (user_id, lesson_id) DO UPDATE SET "
+    "best_score = GREATEST(test_attempts_v2.best_score, EXCLUDED.best_score), "
+    "last_attempt_at = NOW()",
+    ('integer', 'integer', 'text', 'integer', 'integer')
+)
 
+RESET_ATTEMPTS = register_statement(
+    'attempts_reset',
+    "DELETE FROM test_attempts_v2 WHERE user_id = %(user_id)s AND lesson_id = %(lesson_id)s",
+    ('integer', 'text')
+)
+
+def format_attempts_response(max_attempts: Optional[int], attempts_row: tuple) -> Dict[str, Any]:
+    '''Статус попыток урока: attempts_row - (attempts_used, max_attempts, best_score, last_attempt_at) или None'''
+    attempts_used, stored_max, best_score, last_attempt = attempts_row
+    if attempts_used is not None:
+        remaining_attempts = stored_max - attempts_used
+    else:
+        attempts_used = 0
+        remaining_attempts = max_attempts if max_attempts else 999
+        best_score = 0
+        last_attempt = None
+    return {
+        'attemptsUsed': attempts_used,
+        'remainingAttempts': remaining_attempts,
+        'maxAttempts': max_attempts if max_attempts else None,
+        'bestScore': best_score,
+        'lastAttemptAt': last_attempt.isoformat() if last_attempt else None,
+        'hasUnlimitedAttempts': max_attempts is None or max_attempts == 0
+    }
+
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     API для работы с попытками тестов:
     GET ?lessonId=x - получить информацию о попытках теста
+    GET ?courseId=x - попытки по всем урокам-тестам курса (админ может указать userId)
     POST ?action=record - записать результат попытки
     POST ?action=start - начать новую попытку (уменьшить счетчик)
     DELETE ?userId=x&lessonId=y - сбросить попытки пользователя (только админ)
@@ -81,6 +171,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     conn = get_db_connection()
     cur = conn.cursor()
     
+    if method == 'GET' and query_params.get('courseId'):
+        course_id = query_params.get('courseId')
+        target_user_id = user_id
+        if query_params.get('userId') and payload.get('role') == 'admin':
+            target_user_id = int(query_params.get('userId'))
+        
+        if not course_id.isdigit():
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'courseId должен быть числом'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Один запрос вместо GET ?lessonId= на каждый урок-тест курса
+        execute_prepared(cur, COURSE_ATTEMPTS, {'user_id': target_user_id, 'course_id': int(course_id)})
+        rows = cur.fetchall()
+        
+        cur.close()
+        conn.close()
+        
+        attempts = []
+        for row in rows:
+            status = format_attempts_response(row[2], row[3:7])
+            status['lessonId'] = str(row[0])
+            status['testId'] = row[1]
+            attempts.append(status)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'attempts': attempts}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'GET':
         lesson_id = query_params.get('lessonId')
         if not lesson_id:
@@ -93,13 +220,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        lesson_id_safe = escape_sql_string(str(lesson_id))
-        
-        # Получаем данные урока
-        cur.execute(f"SELECT test_id, course_id FROM lessons_v2 WHERE id = '{lesson_id_safe}'")
-        lesson_data = cur.fetchone()
+        # Урок, лимит попыток теста и счетчики пользователя - одним запросом
+        status_row = None
+        if str(lesson_id).isdigit():
+            execute_prepared(cur, LESSON_ATTEMPTS, {'user_id': user_id, 'lesson_num': int(lesson_id)})
+            status_row = cur.fetchone()
         
-        if not lesson_data or not lesson_data[0]:
+        if not status_row or not status_row[1]:
             cur.close()
             conn.close()
             return {
@@ -109,43 +236,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        test_id, course_id = lesson_data
-        
-        # Получаем количество разрешенных попыток из tests_v2
-        test_id_safe = escape_sql_string(str(test_id))
-        cur.execute(f"SELECT attempts FROM tests_v2 WHERE id = '{test_id_safe}'")
-        test_data = cur.fetchone()
-        max_attempts = test_data[0] if test_data else None
-        
-        cur.execute(
-            f"SELECT attempts_used, max_attempts, best_score, last_attempt_at "
-            f"FROM t_p8600777_corporate_training_p.test_attempts_v2 WHERE user_id = {user_id} AND lesson_id = '{lesson_id_safe}'"
-        )
-        attempts_data = cur.fetchone()
-        
-        if attempts_data:
-            attempts_used, stored_max, best_score, last_attempt = attempts_data
-            remaining_attempts = stored_max - attempts_used
-        else:
-            attempts_used = 0
-            remaining_attempts = max_attempts if max_attempts else 999
-            best_score = 0
-            last_attempt = None
-        
         cur.close()
         conn.close()
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'attemptsUsed': attempts_used,
-                'remainingAttempts': remaining_attempts,
-                'maxAttempts': max_attempts if max_attempts else None,
-                'bestScore': best_score,
-                'lastAttemptAt': last_attempt.isoformat() if last_attempt else None,
-                'hasUnlimitedAttempts': max_attempts is None or max_attempts == 0
-            }, ensure_ascii=False),
+            'body': json.dumps(format_attempts_response(status_row[2], status_row[3:7]), ensure_ascii=False),
             'isBase64Encoded': False
         }
     
@@ -163,13 +260,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        lesson_id_safe = escape_sql_string(str(lesson_id))
-        
-        # Получаем данные урока
-        cur.execute(f"SELECT test_id, course_id FROM lessons_v2 WHERE id = '{lesson_id_safe}'")
-        lesson_data = cur.fetchone()
+        result = None
+        if str(lesson_id).isdigit():
+            execute_prepared(cur, START_ATTEMPT, {'user_id': user_id, 'lesson_id': str(lesson_id), 'lesson_num': int(lesson_id)})
+            result = cur.fetchone()
+            conn.commit()
         
-        if not lesson_data:
+        if not result:
             cur.close()
             conn.close()
             return {
@@ -179,55 +276,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        test_id, course_id = lesson_data
-        
-        # Получаем количество разрешенных попыток из tests_v2
-        test_id_safe = escape_sql_string(str(test_id))
-        cur.execute(f"SELECT attempts FROM tests_v2 WHERE id = '{test_id_safe}'")
-        test_data = cur.fetchone()
-        max_attempts = test_data[0] if test_data else None
+        max_attempts, new_attempts_used, stored_max = result
         
-        cur.execute(
-            f"SELECT attempts_used, max_attempts FROM test_attempts_v2 "
-            f"WHERE user_id = {user_id} AND lesson_id = '{lesson_id_safe}'"
-        )
-        existing = cur.fetchone()
-        
-        if existing:
-            attempts_used, stored_max = existing
-            if max_attempts and max_attempts > 0 and attempts_used >= max_attempts:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 403,
-                    'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Исчерпаны все попытки', 'attemptsUsed': attempts_used, 'maxAttempts': max_attempts}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            
-            cur.execute(
-                f"UPDATE t_p8600777_corporate_training_p.test_attempts_v2 SET attempts_used = attempts_used + 1, "
-                f"last_attempt_at = NOW() WHERE user_id = {user_id} AND lesson_id = '{lesson_id_safe}' "
-                f"RETURNING attempts_used, max_attempts"
-            )
-        else:
-            max_attempts_value = max_attempts if max_attempts and max_attempts > 0 else 0
-            cur.execute(
-                f"INSERT INTO test_attempts_v2 (user_id, test_id, lesson_id, course_id, "
-                f"attempts_used, max_attempts, created_at, last_attempt_at) "
-                f"VALUES ({user_id}, {test_id}, '{lesson_id_safe}', {course_id}, 1, {max_attempts_value}, NOW(), NOW()) "
-                f"RETURNING attempts_used, max_attempts"
-            )
-        
-        conn.commit()
-        result = cur.fetchone()
+        if new_attempts_used is None:
+            # Попытка отклонена условием в ON CONFLICT - лимит исчерпан.
+            # Снимок оператора мог не видеть параллельную попытку, поэтому счетчик читаем отдельно
+            execute_prepared(cur, ATTEMPTS_USED, {'user_id': user_id, 'lesson_id': str(lesson_id)})
+            # Строку попыток могли удалить между операторами (сброс прогресса) - тогда попыток 0
+            used_row = cur.fetchone()
+            current_attempts = used_row[0] if used_row else 0
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Исчерпаны все попытки', 'attemptsUsed': current_attempts, 'maxAttempts': max_attempts}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
         
-        if result:
-            new_attempts_used, stored_max = result
-            remaining = stored_max - new_attempts_used
-        else:
-            new_attempts_used = 1
-            remaining = (max_attempts - 1) if max_attempts else 999
+        remaining = stored_max - new_attempts_used
         
         cur.close()
         conn.close()
@@ -259,37 +326,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        lesson_id_safe = escape_sql_string(str(record_req.lessonId))
-        
-        cur.execute(
-            f"SELECT attempts_used, best_score FROM test_attempts_v2 "
-            f"WHERE user_id = {user_id} AND lesson_id = '{lesson_id_safe}'"
-        )
-        existing = cur.fetchone()
-        
-        if existing:
-            current_attempts, current_best = existing
-            new_best = max(current_best, record_req.score)
-            
-            cur.execute(
-                f"UPDATE t_p8600777_corporate_training_p.test_attempts_v2 SET best_score = {new_best}, "
-                f"last_attempt_at = NOW() WHERE user_id = {user_id} AND lesson_id = '{lesson_id_safe}'"
-            )
-        else:
-            max_attempts_val = 0
-            cur.execute(
-                f"SELECT attempts_allowed FROM t_p8600777_corporate_training_p.tests_v2 WHERE id = {record_req.testId}"
-            )
-            test_data = cur.fetchone()
-            if test_data and test_data[0]:
-                max_attempts_val = test_data[0]
-            
-            cur.execute(
-                f"INSERT INTO t_p8600777_corporate_training_p.test_attempts_v2 (user_id, test_id, lesson_id, course_id, "
-                f"attempts_used, max_attempts, best_score, created_at, last_attempt_at) "
-                f"VALUES ({user_id}, {record_req.testId}, '{lesson_id_safe}', {record_req.courseId}, "
-                f"1, {max_attempts_val}, {record_req.score}, NOW(), NOW())"
-            )
+        execute_prepared(cur, RECORD_ATTEMPT, {
+            'user_id': user_id,
+            'test_id': record_req.testId,
+            'lesson_id': str(record_req.lessonId),
+            'course_id': record_req.courseId,
+            'score': record_req.score,
+        })
         
         conn.commit()
         cur.close()
@@ -328,12 +371,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        reset_lesson_id_safe = escape_sql_string(str(reset_lesson_id))
-        
         # Удаляем запись о попытках
-        cur.execute(
-            f"DELETE FROM test_attempts_v2 WHERE user_id = {int(reset_user_id)} AND lesson_id = '{reset_lesson_id_safe}'"
-        )
+        execute_prepared(cur, RESET_ATTEMPTS, {'user_id': int(reset_user_id), 'lesson_id': str(reset_lesson_id)})
         
         conn.commit()
         cur.close()
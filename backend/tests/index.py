@@ -1,26 +1,64 @@
 import json
 import os
+import sys
 import psycopg2
 import jwt
 from datetime import datetime
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.logger import log_action
+from common.grading import AnswerKeyCache, compile_answer_key
+from common.regrade import regrade_test, REGRADE_BATCH_SIZE
+from common.item_analysis import AnalyticsCache
+from common.prepared import register_statement, execute_prepared
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
-def log_action(conn, level: str, action: str, message: str, user_id: Optional[int] = None, 
-               ip_address: Optional[str] = None, user_agent: Optional[str] = None, 
-               details: Optional[Dict[str, Any]] = None) -> None:
-    try:
-        with conn.cursor() as cur:
-            cur.execute('''
-                INSERT INTO system_logs (level, action, message, user_id, ip_address, user_agent, details)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (level, action, message, user_id, ip_address, user_agent, json.dumps(details) if details else None))
-            conn.commit()
-    except Exception as e:
-        print(f"[WARNING] Failed to create log: {e}")
+# Скомпилированные ключи ответов переживают теплые вызовы функции
+ANSWER_KEYS = AnswerKeyCache()
+# Отчеты анализа заданий пересчитываются только при новых попытках или правках теста
+ANALYTICS = AnalyticsCache()
+
+QUESTION_COLUMNS = (
+    "id, test_id, type, text, options, correct_answer, points, \"order\", "
+    "matching_pairs, text_check_type, image_url"
+)
+
+# Горячие запросы студенческого пути готовятся один раз на соединение пула
+GET_TEST = register_statement(
+    'tests_get',
+    "SELECT id, course_id, lesson_id, title, description, pass_score, time_limit, "
+    "attempts, questions_count, status, created_at, updated_at FROM tests_v2 WHERE id = %(test_id)s",
+    ('integer',)
+)
+
+GET_QUESTIONS = register_statement(
+    'tests_questions',
+    f"SELECT {QUESTION_COLUMNS} FROM questions_v2 WHERE test_id = %(test_id)s ORDER BY \"order\"",
+    ('integer',)
+)
+
+LATEST_RESULT = register_statement(
+    'tests_latest_result',
+    "SELECT id, user_id, test_id, lesson_id, course_id, score, earned_points, "
+    "total_points, passed, answers, results, completed_at "
+    "FROM t_p8600777_corporate_training_p.test_results WHERE user_id = %(user_id)s AND lesson_id = %(lesson_id)s "
+    "ORDER BY completed_at DESC LIMIT 1",
+    ('integer', 'text')
+)
+
+INSERT_RESULT = register_statement(
+    'tests_insert_result',
+    "INSERT INTO t_p8600777_corporate_training_p.test_results (user_id, test_id, lesson_id, course_id, score, "
+    "earned_points, total_points, passed, answers, results, completed_at) "
+    "VALUES (%(user_id)s, %(test_id)s, %(lesson_id)s, %(course_id)s, %(score)s, %(earned_points)s, "
+    "%(total_points)s, %(passed)s, %(answers)s, %(results)s, NOW())",
+    ('integer', 'integer', 'text', 'integer', 'integer', 'integer', 'integer', 'boolean', 'jsonb', 'jsonb')
+)
 
 class CreateTestRequest(BaseModel):
     title: str = Field(..., min_length=1)
@@ -65,9 +103,10 @@ class CheckTestRequest(BaseModel):
     lessonId: str = Field(..., min_length=1)
     answers: Dict[str, Any] = Field(...)
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
+class RegradeTestRequest(BaseModel):
+    testId: int = Field(..., ge=1)
+    afterId: int = Field(default=0, ge=0)
+    batchSize: int = Field(default=REGRADE_BATCH_SIZE, ge=1, le=10000)
 
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
@@ -133,15 +172,18 @@ def format_question_response(question_row: tuple, hide_correct_answer: bool = Fa
     
     return question
 
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление тестами и вопросами
     GET ?id=x - один тест
     GET ?testId=x&action=questions - вопросы теста
     GET ?action=results&lessonId=x - результаты теста пользователя
+    GET ?action=analytics&testId=x - статистика по вопросам теста: трудность, дискриминация, дистракторы (админ)
     POST - создать тест (админ)
     POST ?action=question - создать вопрос (админ)
     POST ?action=check - проверить ответы теста (студент)
+    POST ?action=regrade - перепроверить сохраненные результаты по текущим ответам (админ)
     PUT ?id=x - обновить тест (админ)
     PUT ?action=question&questionId=x - обновить вопрос (админ)
     DELETE ?id=x - удалить тест и его вопросы (админ)
@@ -201,13 +243,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             user_id = payload.get('user_id')
         
         # Получаем последний результат пользователя для этого конкретного урока
-        cur.execute(
-            "SELECT id, user_id, test_id, lesson_id, course_id, score, earned_points, "
-            "total_points, passed, answers, results, completed_at "
-            "FROM t_p8600777_corporate_training_p.test_results WHERE user_id = %s AND lesson_id = %s "
-            "ORDER BY completed_at DESC LIMIT 1",
-            (user_id, lesson_id)
-        )
+        execute_prepared(cur, LATEST_RESULT, {'user_id': user_id, 'lesson_id': str(lesson_id)})
         result_row = cur.fetchone()
         
         if not result_row:
@@ -245,14 +281,51 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    if method == 'GET' and action == 'analytics':
+        admin_error = require_admin(headers)
+        if admin_error:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': admin_error['statusCode'],
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': admin_error['error']}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        if not test_id_param or not test_id_param.isdigit():
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'testId обязателен'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        report, cached = ANALYTICS.get(cur, int(test_id_param))
+        cur.close()
+        conn.close()
+        
+        if not report:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Тест не найден'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'analytics': report, 'cached': cached}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'GET' and action == 'questions' and test_id_param:
         test_id_int = int(test_id_param)
         
-        cur.execute(
-            "SELECT id, test_id, type, text, options, correct_answer, points, \"order\", "
-            "matching_pairs, text_check_type, image_url FROM questions_v2 WHERE test_id = %s ORDER BY \"order\"",
-            (test_id_int,)
-        )
+        execute_prepared(cur, GET_QUESTIONS, {'test_id': test_id_int})
         questions = cur.fetchall()
         questions_list = [format_question_response(q) for q in questions]
         
@@ -267,11 +340,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     if method == 'GET' and test_id:
-        cur.execute(
-            "SELECT id, course_id, lesson_id, title, description, pass_score, time_limit, "
-            "attempts, questions_count, status, created_at, updated_at FROM tests_v2 WHERE id = %s",
-            (int(test_id),)
-        )
+        execute_prepared(cur, GET_TEST, {'test_id': int(test_id)})
         test = cur.fetchone()
         
         if not test:
@@ -287,11 +356,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         test_data = format_test_response(test)
         
         # Загружаем вопросы теста
-        cur.execute(
-            "SELECT id, test_id, type, text, options, correct_answer, points, \"order\", "
-            "matching_pairs, text_check_type, image_url FROM questions_v2 WHERE test_id = %s ORDER BY \"order\"",
-            (int(test_id),)
-        )
+        execute_prepared(cur, GET_QUESTIONS, {'test_id': int(test_id)})
         questions = cur.fetchall()
         
         # Скрываем правильные ответы для студентов
@@ -327,6 +392,60 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    if method == 'POST' and action == 'regrade':
+        # Перепроверка сохраненных результатов после исправления правильных ответов
+        admin_error = require_admin(headers)
+        if admin_error:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': admin_error['statusCode'],
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': admin_error['error']}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        try:
+            body = json.loads(event.get('body') or '{}')
+            regrade_req = RegradeTestRequest(**body)
+        except Exception as e:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Некорректные данные: {str(e)}'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        answer_key = compile_answer_key(cur, regrade_req.testId)
+        if not answer_key:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Тест не найден'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        conn.commit()
+        
+        stats = regrade_test(conn, answer_key, after_id=regrade_req.afterId, batch_size=regrade_req.batchSize)
+        
+        log_action('info', 'test.regrade',
+                  f"Перепроверен тест '{answer_key.title}': {stats['processed']} результатов, изменено {stats['changed']}",
+                  user_id=payload.get('user_id'), details=stats)
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(stats, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'POST' and action == 'check':
         # Проверка ответов теста
         body_data = json.loads(event.get('body', '{}'))
@@ -343,15 +462,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        # Получаем вопросы теста с правильными ответами
-        cur.execute(
-            "SELECT id, test_id, type, text, options, correct_answer, points, \"order\", "
-            "matching_pairs, text_check_type, image_url FROM questions_v2 WHERE test_id = %s ORDER BY \"order\"",
-            (check_req.testId,)
-        )
-        questions = cur.fetchall()
+        # Ключ ответов из кэша процесса: один запрос сверяет версию теста и находит урок
+        answer_key, course_id_val = ANSWER_KEYS.get(cur, check_req.testId, check_req.lessonId)
         
-        if not questions:
+        if not answer_key or not answer_key.questions:
             cur.close()
             conn.close()
             return {
@@ -361,70 +475,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        earned_points = 0
-        total_points = 0
-        results = []
-        
-        print(f'=== DEBUG: Проверка теста {check_req.testId} ===')
-        print(f'Ответы пользователя: {check_req.answers}')
-        
-        for q in questions:
-            question_id = str(q[0])
-            question_type = q[2]
-            correct_answer = q[5]
-            points = q[6]
-            matching_pairs = q[8]
-            
-            total_points += points
-            user_answer = check_req.answers.get(question_id)
-            is_correct = False
-            
-            print(f'Вопрос {question_id} ({question_type}):')
-            print(f'  Ответ пользователя: {user_answer} (тип: {type(user_answer).__name__})')
-            print(f'  Правильный ответ: {correct_answer} (тип: {type(correct_answer).__name__})')
-            print(f'  Баллы: {points}')
-            
-            if question_type == 'single':
-                # Для single choice сравниваем числовые индексы
-                is_correct = user_answer == correct_answer
-            
-            elif question_type == 'multiple':
-                # Для multiple choice сравниваем массивы
-                if isinstance(correct_answer, list) and isinstance(user_answer, list):
-                    is_correct = sorted(correct_answer) == sorted(user_answer)
-            
-            elif question_type == 'matching':
-                # Для matching проверяем порядок правых элементов
-                if matching_pairs and isinstance(user_answer, list):
-                    correct_order = [p['right'] for p in matching_pairs]
-                    is_correct = user_answer == correct_order
-            
-            elif question_type == 'text':
-                # Для текстовых вопросов сравниваем с правильным ответом (если задан)
-                if isinstance(correct_answer, str) and isinstance(user_answer, str):
-                    is_correct = user_answer.strip().lower() == correct_answer.strip().lower()
-                else:
-                    is_correct = False
-            
-            if is_correct:
-                earned_points += points
-            
-            results.append({
-                'questionId': question_id,
-                'isCorrect': is_correct,
-                'points': points if is_correct else 0
-            })
-        
-        score = round((earned_points / total_points * 100)) if total_points > 0 else 0
-        
-        # Используем переданный lessonId и получаем course_id из таблицы lessons
-        cur.execute(
-            "SELECT course_id FROM t_p8600777_corporate_training_p.lessons_v2 WHERE id = %s LIMIT 1",
-            (check_req.lessonId,)
-        )
-        lesson_data = cur.fetchone()
-        
-        if not lesson_data:
+        if course_id_val is None:
             cur.close()
             conn.close()
             return {
@@ -434,52 +485,39 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        course_id_val = lesson_data[0]
-        
-        # Получаем passing score из теста
-        cur.execute("SELECT pass_score FROM t_p8600777_corporate_training_p.tests_v2 WHERE id = %s", (check_req.testId,))
-        test_info = cur.fetchone()
-        passing_score = test_info[0] if test_info else 70
-        passed = score >= passing_score
+        graded = answer_key.grade(check_req.answers)
+        score = graded['score']
+        earned_points = graded['earnedPoints']
+        total_points = graded['totalPoints']
+        passed = graded['passed']
+        results = graded['results']
         
         # Сохраняем результат теста
         user_id = payload.get('user_id')
         if user_id and course_id_val:
-            cur.execute(
-                "INSERT INTO t_p8600777_corporate_training_p.test_results (user_id, test_id, lesson_id, course_id, score, "
-                "earned_points, total_points, passed, answers, results, completed_at) "
-                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())",
-                (
-                    user_id,
-                    check_req.testId,
-                    check_req.lessonId,
-                    course_id_val,
-                    score,
-                    earned_points,
-                    total_points,
-                    passed,
-                    json.dumps(check_req.answers),
-                    json.dumps(results)
-                )
-            )
+            execute_prepared(cur, INSERT_RESULT, {
+                'user_id': user_id,
+                'test_id': check_req.testId,
+                'lesson_id': check_req.lessonId,
+                'course_id': course_id_val,
+                'score': score,
+                'earned_points': earned_points,
+                'total_points': total_points,
+                'passed': passed,
+                'answers': json.dumps(check_req.answers),
+                'results': json.dumps(results)
+            })
             conn.commit()
             
             # Логируем прохождение теста
-            test_title = f"Тест #{check_req.testId}"
-            try:
-                cur.execute("SELECT title FROM t_p8600777_corporate_training_p.tests_v2 WHERE id = %s", (check_req.testId,))
-                test_row = cur.fetchone()
-                if test_row:
-                    test_title = test_row[0]
-            except:
-                pass
+            test_title = answer_key.title
             
             log_level = 'success' if passed else 'warning'
             log_message = f"Пройден тест '{test_title}': {score}% ({earned_points}/{total_points} баллов)"
             if not passed:
                 log_message = f"Не пройден тест '{test_title}': {score}% ({earned_points}/{total_points} баллов)"
             
-            log_action(conn, log_level, 'test.submit', log_message, user_id=user_id,
+            log_action(log_level, 'test.submit', log_message, user_id=user_id,
                       details={'test_id': check_req.testId, 'score': score, 'passed': passed})
         
         cur.close()
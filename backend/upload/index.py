@@ -1,21 +1,416 @@
 import json
 import os
-import boto3
+import sys
+import math
 import base64
 import uuid
-from typing import Dict, Any
+import hashlib
+import jwt
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+from botocore.exceptions import ClientError
 from pydantic import BaseModel, Field
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.file_store import (
+    acquire_object, register_object, find_object, sha256_object, get_variants, set_variants,
+    checksum_to_hex, hex_to_checksum, DEDUP_HASH_MAX_BYTES
+)
+from common.file_locations import remember_location
+from common.storage import get_s3_client, delete_keys
+from common.image_variants import wants_variants, store_variants, srcset_response, variant_keys
+
+JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
+JWT_ALGORITHM = 'HS256'
+BUCKET = 'files'
+# Срок действия presigned URL, секунды
+UPLOAD_URL_EXPIRES = int(os.environ.get('UPLOAD_URL_EXPIRES', '3600'))
+# Файлы от этого размера загружаются частями (видео); S3: часть от 5 МБ, не больше 10000 частей
+MULTIPART_THRESHOLD = int(os.environ.get('UPLOAD_MULTIPART_THRESHOLD', str(64 * 1024 * 1024)))
+MULTIPART_PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE', str(16 * 1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', str(5 * 1024 * 1024 * 1024)))
+MAX_PARTS = 10000
+
+UPLOAD_COLUMNS = (
+    "SELECT id, object_key, filename, content_type, size, multipart_upload_id, status, cdn_url, created_by, "
+    "content_hash FROM file_uploads "
+)
+
 class UploadRequest(BaseModel):
     file: str = Field(..., min_length=1)
     filename: str = Field(..., min_length=1)
     contentType: str = Field(default='image/jpeg')
 
+class PresignRequest(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=255)
+    contentType: str = Field(default='application/octet-stream', min_length=1, max_length=255)
+    size: int = Field(..., ge=0, le=MAX_UPLOAD_SIZE)
+    multipart: Optional[bool] = None
+    # SHA-256 содержимого, посчитанный клиентом: входит в подпись PUT, хранилище сверяет его с телом
+    sha256: Optional[str] = Field(None, pattern='^[0-9a-fA-F]{64}$')
+
+class UploadedPart(BaseModel):
+    partNumber: int = Field(..., ge=1, le=MAX_PARTS)
+    etag: str = Field(..., min_length=1)
+
+class ConfirmUploadRequest(BaseModel):
+    uploadId: int = Field(..., ge=1)
+    parts: Optional[List[UploadedPart]] = None
+
+class AbortUploadRequest(BaseModel):
+    uploadId: int = Field(..., ge=1)
+
+def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        return payload
+    except:
+        return None
+
+def public_base_url() -> str:
+    return os.environ.get('S3_PUBLIC_URL') or f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket"
+
+def build_object_key(filename: str, content_type: str, name: Optional[str] = None) -> str:
+    '''Ключ объекта: images/ videos/ documents/ files/ + name (по умолчанию uuid) + расширение'''
+    file_ext = filename.split('.')[-1] if '.' in filename else 'jpg'
+    
+    # Определяем папку в зависимости от типа файла
+    if content_type.startswith('image/'):
+        folder = 'images'
+    elif content_type.startswith('video/'):
+        folder = 'videos'
+    elif 'pdf' in content_type or file_ext.lower() == 'pdf':
+        folder = 'documents'
+    elif 'word' in content_type or 'document' in content_type or file_ext.lower() in ['doc', 'docx']:
+        folder = 'documents'
+    else:
+        folder = 'files'
+    
+    return f"{folder}/{name or uuid.uuid4()}.{file_ext}"
+
+def format_upload_response(upload_row: tuple) -> Dict[str, Any]:
+    return {
+        'uploadId': upload_row[0],
+        'key': upload_row[1],
+        'filename': upload_row[2],
+        'contentType': upload_row[3],
+        'size': upload_row[4],
+        'multipart': upload_row[5] is not None,
+        'status': upload_row[6],
+        'url': upload_row[7],
+        'sha256': upload_row[9],
+    }
+
+def render_variants(s3, object_key: str, data: bytes) -> Optional[Dict[str, Any]]:
+    '''
+    Уменьшенные копии загруженного изображения рядом с оригиналом
+    Ошибка хранилища не отменяет загрузку: клиент использует оригинал
+    '''
+    try:
+        return store_variants(s3, BUCKET, object_key, data)
+    except ClientError as e:
+        print(f'Failed to store variants for {object_key}: {e}')
+        return None
+
+def generate_variants(cur, s3, content_hash: str, object_key: str, data: bytes) -> Optional[Dict[str, Any]]:
+    '''Уменьшенные копии изображения, записываются в file_objects'''
+    variants = render_variants(s3, object_key, data)
+    set_variants(cur, content_hash, variants)
+    return variants
+
+def with_variants(response_data: Dict[str, Any], variants: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    '''Добавляет к ответу width, height, variants и srcset (если изображение обработано)'''
+    image_data = srcset_response(variants, public_base_url(), response_data['url'])
+    if image_data:
+        response_data.update(image_data)
+    return response_data
+
+def presign_upload(cur, s3, presign_req: PresignRequest, user_id: Optional[int]) -> Dict[str, Any]:
+    '''
+    Создает запись file_uploads и выдает presigned URL: один PUT или по URL на каждую часть
+    Байты файла идут из браузера прямо в хранилище, функция их не получает
+    sha256 клиента не дает ссылку на уже хранящийся файл: знание хэша не доказывает наличие содержимого.
+    Дубль находится в confirm, когда хэш сверен хранилищем или посчитан по объекту
+    '''
+    object_key = build_object_key(presign_req.filename, presign_req.contentType)
+    multipart = presign_req.multipart if presign_req.multipart is not None else presign_req.size >= MULTIPART_THRESHOLD
+    
+    response_data: Dict[str, Any] = {
+        'key': object_key,
+        'url': f"{public_base_url()}/{object_key}",
+        'multipart': multipart,
+        'deduplicated': False,
+        'expiresIn': UPLOAD_URL_EXPIRES,
+    }
+    multipart_upload_id = None
+    expected_hash = None
+    if multipart:
+        part_size = max(MULTIPART_PART_SIZE, math.ceil(presign_req.size / MAX_PARTS))
+        part_count = max(1, math.ceil(presign_req.size / part_size))
+        created = s3.create_multipart_upload(Bucket=BUCKET, Key=object_key, ContentType=presign_req.contentType)
+        multipart_upload_id = created['UploadId']
+        response_data['partSize'] = part_size
+        response_data['parts'] = [
+            {
+                'partNumber': part_number,
+                'url': s3.generate_presigned_url(
+                    'upload_part',
+                    Params={'Bucket': BUCKET, 'Key': object_key, 'UploadId': multipart_upload_id,
+                            'PartNumber': part_number},
+                    ExpiresIn=UPLOAD_URL_EXPIRES,
+                ),
+            }
+            for part_number in range(1, part_count + 1)
+        ]
+    else:
+        params = {'Bucket': BUCKET, 'Key': object_key, 'ContentType': presign_req.contentType}
+        upload_headers = {'Content-Type': presign_req.contentType}
+        if presign_req.sha256:
+            # Контрольная сумма входит в подпись: хранилище само сверяет хэш с телом PUT,
+            # confirm доверяет хэшу клиента и не перечитывает объект
+            params['ChecksumSHA256'] = hex_to_checksum(presign_req.sha256.lower())
+            upload_headers['x-amz-checksum-sha256'] = params['ChecksumSHA256']
+            expected_hash = presign_req.sha256.lower()
+        response_data['upload'] = {
+            'method': 'PUT',
+            'url': s3.generate_presigned_url('put_object', Params=params, ExpiresIn=UPLOAD_URL_EXPIRES),
+            'headers': upload_headers,
+        }
+    
+    # content_hash pending загрузки - хэш, который проверит хранилище (только для одного PUT с sha256)
+    cur.execute(
+        "INSERT INTO file_uploads (object_key, filename, content_type, size, multipart_upload_id, status, "
+        "content_hash, created_by) "
+        "VALUES (%s, %s, %s, %s, %s, 'pending', %s, %s) RETURNING id",
+        (object_key, presign_req.filename, presign_req.contentType, presign_req.size, multipart_upload_id,
+         expected_hash, user_id)
+    )
+    response_data['uploadId'] = cur.fetchone()[0]
+    return response_data
+
+def finished_upload_response(cur, conn, upload_row: tuple, action: str) -> Dict[str, Any]:
+    '''Ответ на confirm/abort загрузки, которая уже не в статусе pending; закрывает курсор и соединение'''
+    status = upload_row[6]
+    variants = get_variants(cur, upload_row[9]) if status == 'uploaded' and upload_row[9] else None
+    conn.rollback()
+    cur.close()
+    conn.close()
+    # Повторное подтверждение завершенной загрузки возвращает тот же результат
+    if action == 'confirm' and status == 'uploaded':
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(with_variants(format_upload_response(upload_row), variants), ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    return {
+        'statusCode': 409,
+        'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'error': f'Загрузка уже в статусе {status}'}, ensure_ascii=False),
+        'isBase64Encoded': False
+    }
+
+def handle_direct_upload(action: str, event: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    '''presign / confirm / abort для загрузки напрямую в хранилище'''
+    try:
+        body_data = json.loads(event.get('body') or '{}')
+        if action == 'presign':
+            request = PresignRequest(**body_data)
+        elif action == 'confirm':
+            request = ConfirmUploadRequest(**body_data)
+        else:
+            request = AbortUploadRequest(**body_data)
+    except Exception as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Некорректные данные: {str(e)}'}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    user_id = payload.get('user_id')
+    s3 = get_s3_client()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    if action == 'presign':
+        try:
+            response_data = presign_upload(cur, s3, request, user_id)
+        except ClientError as e:
+            conn.rollback()
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Ошибка загрузки: {str(e)}'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        conn.commit()
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(response_data, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    # Блокировка строки нужна только отмене; confirm читает строку без нее и блокирует перед записью
+    cur.execute(UPLOAD_COLUMNS + "WHERE id = %s" + (" FOR UPDATE" if action == 'abort' else ""), (request.uploadId,))
+    upload_row = cur.fetchone()
+    if not upload_row or (upload_row[8] != user_id and payload.get('role') != 'admin'):
+        conn.rollback()
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Загрузка не найдена'}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    upload_id, object_key, multipart_upload_id, status = upload_row[0], upload_row[1], upload_row[5], upload_row[6]
+    
+    if status != 'pending':
+        return finished_upload_response(cur, conn, upload_row, action)
+    
+    if action == 'abort':
+        try:
+            if multipart_upload_id:
+                s3.abort_multipart_upload(Bucket=BUCKET, Key=object_key, UploadId=multipart_upload_id)
+            else:
+                s3.delete_object(Bucket=BUCKET, Key=object_key)
+        except ClientError as e:
+            print(f'Failed to abort upload {object_key}: {e}')
+        cur.execute("UPDATE file_uploads SET status = 'aborted' WHERE id = %s", (upload_id,))
+        conn.commit()
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'message': 'Загрузка отменена'}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if multipart_upload_id and not request.parts:
+        conn.rollback()
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Для multipart загрузки нужен список parts с etag каждой части'}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    # Обращения к хранилищу (сборка частей, head, чтение для хэша) - без открытой транзакции
+    conn.rollback()
+    expected_hash = upload_row[9]
+    try:
+        if multipart_upload_id:
+            parts = sorted({part.partNumber: part.etag for part in request.parts}.items())
+            s3.complete_multipart_upload(
+                Bucket=BUCKET, Key=object_key, UploadId=multipart_upload_id,
+                MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag in parts]}
+            )
+        # Объект должен реально лежать в бакете: размер и etag берем из хранилища, а не от клиента
+        head = s3.head_object(Bucket=BUCKET, Key=object_key, ChecksumMode='ENABLED')
+        content_hash = None
+        image_data = None
+        if wants_variants(upload_row[3], head.get('ContentLength', 0)):
+            # Изображение читается один раз: и для хэша, и для уменьшенных копий
+            image_data = s3.get_object(Bucket=BUCKET, Key=object_key)['Body'].read()
+            content_hash = hashlib.sha256(image_data).hexdigest()
+        elif expected_hash and checksum_to_hex(head.get('ChecksumSHA256')) == expected_hash:
+            # Хэш сверен хранилищем при PUT - объект не перечитывается
+            content_hash = expected_hash
+        elif head.get('ContentLength', 0) <= DEDUP_HASH_MAX_BYTES:
+            content_hash, _ = sha256_object(s3, BUCKET, object_key)
+    except ClientError as e:
+        # Параллельный confirm мог уже собрать части и завершить загрузку
+        cur.execute(UPLOAD_COLUMNS + "WHERE id = %s", (upload_id,))
+        current_row = cur.fetchone()
+        if current_row and current_row[6] != 'pending':
+            return finished_upload_response(cur, conn, current_row, action)
+        conn.rollback()
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Файл не загружен в хранилище: {str(e)}'}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    # Уменьшенные копии - тоже до блокировки; содержимое уже хранится - копии берутся у него
+    variants = None
+    if image_data is not None and find_object(cur, content_hash) is None:
+        conn.rollback()
+        variants = render_variants(s3, object_key, image_data)
+    
+    # Строка блокируется только на время записи; параллельный confirm мог завершить загрузку раньше
+    cur.execute(UPLOAD_COLUMNS + "WHERE id = %s FOR UPDATE", (upload_id,))
+    current_row = cur.fetchone()
+    if current_row[6] != 'pending':
+        return finished_upload_response(cur, conn, current_row, action)
+    
+    stored_key = object_key
+    rendered = variants
+    if content_hash:
+        stored_key = register_object(cur, content_hash, object_key, head.get('ContentLength'), upload_row[3])
+        if stored_key != object_key:
+            variants = get_variants(cur, content_hash)
+        elif variants:
+            set_variants(cur, content_hash, variants)
+    if stored_key == object_key:
+        remember_location(cur, object_key, object_key, head.get('ContentLength'), upload_row[3],
+                          (head.get('ETag') or '').strip('"'))
+    
+    cur.execute(
+        "UPDATE file_uploads SET status = 'uploaded', object_key = %s, size = %s, etag = %s, cdn_url = %s, "
+        "content_hash = %s, confirmed_at = %s WHERE id = %s "
+        "RETURNING id, object_key, filename, content_type, size, multipart_upload_id, status, cdn_url, created_by, "
+        "content_hash",
+        (stored_key, head.get('ContentLength'), (head.get('ETag') or '').strip('"'),
+         f"{public_base_url()}/{stored_key}", content_hash, datetime.utcnow(), upload_id)
+    )
+    upload_row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    conn.close()
+    
+    # Такое содержимое уже хранилось под другим ключом - загруженная копия (и ее уменьшенные копии) не нужна
+    if stored_key != object_key:
+        try:
+            for error in delete_keys(s3, BUCKET, [object_key] + variant_keys(rendered))['errors']:
+                print(f"Failed to delete duplicate {error['key']}: {error['code']} {error['message']}")
+        except ClientError as e:
+            print(f'Failed to delete duplicate {object_key}: {e}')
+    
+    upload_data = with_variants(format_upload_response(upload_row), variants)
+    upload_data['deduplicated'] = stored_key != object_key
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(upload_data, ensure_ascii=False),
+        'isBase64Encoded': False
+    }
+
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Загрузка файлов в S3 хранилище
     POST - загрузить файл (base64 в теле запроса)
-    Возвращает CDN URL загруженного файла
+    POST ?action=presign - presigned URL для загрузки напрямую в хранилище (PUT или multipart)
+    POST ?action=confirm - проверить загруженный объект и записать CDN URL
+    POST ?action=abort - отменить незавершенную загрузку
+    Возвращает CDN URL загруженного файла; для JPEG/PNG/WebP изображений - еще
+    уменьшенные копии в WebP и JPEG (variants) и готовые строки srcset
     '''
     method: str = event.get('httpMethod', 'POST')
     
@@ -40,52 +435,85 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    query_params = event.get('queryStringParameters', {}) or {}
+    action = query_params.get('action')
+    
+    if action in ('presign', 'confirm', 'abort'):
+        headers = event.get('headers', {}) or {}
+        auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+        payload = verify_jwt_token(auth_token) if auth_token else None
+        if not payload:
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Требуется авторизация'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        return handle_direct_upload(action, event, payload)
+    
     try:
         body_data = json.loads(event.get('body', '{}'))
         upload_req = UploadRequest(**body_data)
         
         # Инициализация S3 клиента
-        s3 = boto3.client('s3',
-            endpoint_url='https://bucket.poehali.dev',
-            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
-        )
+        s3 = get_s3_client()
         
         # Декодируем base64
         file_data = base64.b64decode(upload_req.file)
+        content_hash = hashlib.sha256(file_data).hexdigest()
         
-        # Генерируем уникальное имя файла
-        file_ext = upload_req.filename.split('.')[-1] if '.' in upload_req.filename else 'jpg'
+        conn = get_db_connection()
+        cur = conn.cursor()
         
-        # Определяем папку в зависимости от типа файла
-        if upload_req.contentType.startswith('image/'):
-            folder = 'images'
-        elif upload_req.contentType.startswith('video/'):
-            folder = 'videos'
-        elif 'pdf' in upload_req.contentType or file_ext.lower() == 'pdf':
-            folder = 'documents'
-        elif 'word' in upload_req.contentType or 'document' in upload_req.contentType or file_ext.lower() in ['doc', 'docx']:
-            folder = 'documents'
-        else:
-            folder = 'files'
+        # Такой файл уже загружали - отдаем существующий URL без записи в хранилище
+        existing = acquire_object(cur, content_hash)
+        if existing:
+            conn.commit()
+            cur.close()
+            conn.close()
+            response_data = with_variants(
+                {'url': f"{public_base_url()}/{existing['key']}", 'deduplicated': True}, existing['variants']
+            )
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(response_data, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
         
-        unique_filename = f"{folder}/{uuid.uuid4()}.{file_ext}"
+        # Ключ по хэшу содержимого в папке по типу файла: параллельные загрузки одного файла пишут один объект
+        unique_filename = build_object_key(upload_req.filename, upload_req.contentType, name=content_hash)
         
         # Загружаем в S3
         s3.put_object(
-            Bucket='files',
+            Bucket=BUCKET,
             Key=unique_filename,
             Body=file_data,
             ContentType=upload_req.contentType
         )
+        stored_key = register_object(cur, content_hash, unique_filename, len(file_data), upload_req.contentType)
+        variants = None
+        if stored_key != unique_filename:
+            variants = get_variants(cur, content_hash)
+        elif wants_variants(upload_req.contentType, len(file_data)):
+            variants = generate_variants(cur, s3, content_hash, unique_filename, file_data)
+        if stored_key == unique_filename:
+            remember_location(cur, unique_filename, unique_filename, len(file_data), upload_req.contentType)
+        conn.commit()
+        cur.close()
+        conn.close()
+        if stored_key != unique_filename:
+            # Тот же файл параллельно загружен через presign - оставляем только его объект
+            s3.delete_object(Bucket=BUCKET, Key=unique_filename)
         
         # Формируем CDN URL
-        cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{unique_filename}"
+        cdn_url = f"{public_base_url()}/{stored_key}"
+        response_data = with_variants({'url': cdn_url, 'deduplicated': stored_key != unique_filename}, variants)
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'url': cdn_url}, ensure_ascii=False),
+            'body': json.dumps(response_data, ensure_ascii=False),
             'isBase64Encoded': False
         }
         
@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import psycopg2
 import bcrypt
 import jwt
@@ -7,6 +8,12 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, EmailStr, Field, ValidationError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.db import get_db_connection, pooled_handler
+from common.pagination import wants_page, parse_page, split_page, parse_bool
+from common.logger import log_action
+from common.user_import import parse_import, import_users, USER_IMPORT_MAX_ROWS
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
@@ -19,6 +26,10 @@ class CreateUserRequest(BaseModel):
     department: Optional[str] = None
     phone: Optional[str] = None
 
+class ImportUsersRequest(BaseModel):
+    format: str = Field(..., pattern='^(csv|jsonl)$')
+    content: str = Field(..., min_length=1)
+
 class UpdateUserRequest(BaseModel):
     name: Optional[str] = Field(None, min_length=1)
     position: Optional[str] = None
@@ -32,10 +43,6 @@ class UpdatePasswordRequest(BaseModel):
 class UpdateRoleRequest(BaseModel):
     role: str = Field(..., pattern='^(admin|student)$')
 
-def get_db_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
-
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -57,6 +64,30 @@ def require_admin(headers: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     
     return None
 
+USER_COLUMNS = (
+    "SELECT id, email, name, role, position, department, phone, avatar, is_active, "
+    "registration_date, last_active FROM users_v2 "
+)
+
+def build_user_filters(query_params: Dict[str, Any]) -> tuple[list, list]:
+    '''Фильтры списка пользователей: role, department, isActive, search (имя или email)'''
+    conditions, params = [], []
+    if query_params.get('role'):
+        conditions.append("role = %s")
+        params.append(query_params['role'])
+    if query_params.get('department'):
+        conditions.append("department = %s")
+        params.append(query_params['department'])
+    is_active = parse_bool(query_params.get('isActive'))
+    if is_active is not None:
+        conditions.append("is_active = %s")
+        params.append(is_active)
+    if query_params.get('search'):
+        conditions.append("(name ILIKE %s OR email ILIKE %s)")
+        pattern = '%' + query_params['search'].replace('%', r'\%').replace('_', r'\_') + '%'
+        params.extend([pattern, pattern])
+    return conditions, params
+
 def format_user_response(user_row: tuple) -> Dict[str, Any]:
     return {
         'id': user_row[0],
@@ -72,11 +103,14 @@ def format_user_response(user_row: tuple) -> Dict[str, Any]:
         'lastActive': user_row[10].isoformat() if user_row[10] else None,
     }
 
+@pooled_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     CRUD операции с пользователями (только для администраторов)
     GET ?id=x - данные пользователя, без id - все пользователи
+        (фильтры role, department, isActive, search; постранично с limit и cursor)
     POST - создание пользователя
+    POST ?action=import - массовый импорт из CSV / JSON Lines ({format, content})
     PUT ?id=x&action=password - изменение пароля
     PUT ?id=x&action=role - изменение роли
     PUT ?id=x&action=toggle - включение/отключение
@@ -143,11 +177,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     cur = conn.cursor()
     
     if method == 'GET' and not user_id:
-        cur.execute(
-            "SELECT id, email, name, role, position, department, phone, avatar, is_active, "
-            "registration_date, last_active FROM users_v2 ORDER BY registration_date DESC"
-        )
-        users = cur.fetchall()
+        try:
+            conditions, params = build_user_filters(query_params)
+            limit, after = parse_page(query_params, key_size=1) if wants_page(query_params) else (None, None)
+            after_id = int(after[0]) if after else None
+        except (ValueError, TypeError) as e:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        if limit is None:
+            where = ("WHERE " + " AND ".join(conditions) + " ") if conditions else ""
+            cur.execute(USER_COLUMNS + where + "ORDER BY registration_date DESC", params)
+            users = cur.fetchall()
+            users_list = [format_user_response(user) for user in users]
+            
+            cur.close()
+            conn.close()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'users': users_list}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Постраничный режим: keyset по id (новые пользователи первыми)
+        if after_id is not None:
+            conditions.append("id < %s")
+            params.append(after_id)
+        where = ("WHERE " + " AND ".join(conditions) + " ") if conditions else ""
+        cur.execute(USER_COLUMNS + where + "ORDER BY id DESC LIMIT %s", params + [limit + 1])
+        users, next_cursor = split_page(cur.fetchall(), limit, key=lambda row: [row[0]])
         users_list = [format_user_response(user) for user in users]
         
         cur.close()
@@ -156,7 +222,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'users': users_list}, ensure_ascii=False),
+            'body': json.dumps({'users': users_list, 'nextCursor': next_cursor}, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
@@ -188,6 +254,52 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    if method == 'POST' and action == 'import':
+        try:
+            body_data = json.loads(event.get('body') or '{}')
+            import_req = ImportUsersRequest(**body_data)
+            rows, parse_errors = parse_import(import_req.content, import_req.format)
+        except Exception as e:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Некорректные данные: {str(e)}'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        if len(rows) + len(parse_errors) > USER_IMPORT_MAX_ROWS:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 413,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'error': f'Слишком много строк: {len(rows) + len(parse_errors)}, максимум {USER_IMPORT_MAX_ROWS} за запрос. '
+                             f'Полную выгрузку загрузите командой python backend/common/user_import.py <файл>'
+                }, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Весь запрос - одна пачка и одна фиксация: частично записанного импорта не бывает
+        report = import_users(conn, rows, CreateUserRequest, parse_errors, batch_size=USER_IMPORT_MAX_ROWS)
+        
+        log_action('info', 'user.import',
+                  f"Импорт пользователей: создано {report['created']} из {report['total']}, ошибок {report['failed']}",
+                  user_id=current_user_id,
+                  details={key: value for key, value in report.items() if key != 'errors'})
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(report, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
         create_req = CreateUserRequest(**body_data)
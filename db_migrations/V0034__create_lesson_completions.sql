@@ -0,0 +1,21 @@
+-- Нормализованное хранилище завершенных уроков вместо чтения/перезаписи
+-- массива course_progress_v2.completed_lesson_ids
+CREATE TABLE IF NOT EXISTS lesson_completions (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    course_id INTEGER NOT NULL,
+    lesson_id INTEGER NOT NULL,
+    completed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    UNIQUE(user_id, lesson_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_lesson_completions_course_user ON lesson_completions(course_id, user_id);
+
+-- Переносим уже завершенные уроки из JSONB-массивов
+INSERT INTO lesson_completions (user_id, course_id, lesson_id, completed_at)
+SELECT cp.user_id::integer, cp.course_id, e.lesson_id::integer,
+       COALESCE(cp.updated_at, cp.started_at, NOW())
+FROM course_progress_v2 cp
+CROSS JOIN LATERAL jsonb_array_elements_text(COALESCE(cp.completed_lesson_ids, '[]'::jsonb)) AS e(lesson_id)
+WHERE cp.user_id::text ~ '^[0-9]+$' AND e.lesson_id ~ '^[0-9]+$'
+ON CONFLICT (user_id, lesson_id) DO NOTHING;
@@ -0,0 +1,16 @@
+-- Индексы для постраничных списков (keyset по id) с фильтрами
+
+-- users_v2: фильтры role / department, сортировка по id
+CREATE INDEX IF NOT EXISTS idx_users_v2_role_id ON users_v2(role, id);
+CREATE INDEX IF NOT EXISTS idx_users_v2_department_id ON users_v2(department, id);
+
+-- course_progress_v2: фильтр courseId (+ completed), сортировка по id
+CREATE INDEX IF NOT EXISTS idx_course_progress_v2_course_id_id ON course_progress_v2(course_id, id);
+
+-- course_assignments_v2: фильтры userId / courseId / status, сортировка по id
+CREATE INDEX IF NOT EXISTS idx_course_assignments_v2_user_id_id ON course_assignments_v2(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_course_assignments_v2_course_id_id ON course_assignments_v2(course_id, id);
+CREATE INDEX IF NOT EXISTS idx_course_assignments_v2_status_id ON course_assignments_v2(status, id);
+
+-- lessons_v2: ключ страницы (course_id, order, id)
+CREATE INDEX IF NOT EXISTS idx_lessons_v2_course_order_id ON lessons_v2(course_id, COALESCE("order", 0), id);
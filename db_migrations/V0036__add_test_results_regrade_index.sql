@@ -0,0 +1,2 @@
+-- Перепроверка результатов теста читает test_results пачками по (test_id, id)
+CREATE INDEX IF NOT EXISTS idx_test_results_test_id_id ON test_results(test_id, id);
@@ -0,0 +1,18 @@
+-- Загрузки напрямую в бакет files по presigned URL (upload ?action=presign / confirm)
+-- pending - URL выдан, uploaded - объект проверен и CDN URL записан, aborted - загрузка отменена
+CREATE TABLE IF NOT EXISTS file_uploads (
+    id SERIAL PRIMARY KEY,
+    object_key VARCHAR(512) NOT NULL UNIQUE,
+    filename VARCHAR(255) NOT NULL,
+    content_type VARCHAR(255) NOT NULL,
+    size BIGINT,
+    multipart_upload_id TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    cdn_url TEXT,
+    etag VARCHAR(255),
+    created_by INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    confirmed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_uploads_status_created ON file_uploads(status, created_at);
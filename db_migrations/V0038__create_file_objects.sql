@@ -0,0 +1,16 @@
+-- Хранилище файлов с адресацией по содержимому: один объект бакета files на каждый SHA-256,
+-- ref_count - сколько загрузок ссылаются на объект (повторная загрузка не передает байты заново)
+CREATE TABLE IF NOT EXISTS file_objects (
+    sha256 CHAR(64) PRIMARY KEY,
+    object_key VARCHAR(512) NOT NULL UNIQUE,
+    size BIGINT NOT NULL,
+    content_type VARCHAR(255),
+    ref_count INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_referenced_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Несколько загрузок одного содержимого ссылаются на один объект
+ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+ALTER TABLE file_uploads DROP CONSTRAINT IF EXISTS file_uploads_object_key_key;
+CREATE INDEX IF NOT EXISTS idx_file_uploads_object_key ON file_uploads(object_key);
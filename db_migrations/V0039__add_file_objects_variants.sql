@@ -0,0 +1,4 @@
+-- Уменьшенные копии изображений (WebP/JPEG по ширинам), построенные при загрузке в images/:
+-- {"width": 4000, "height": 3000, "items": [{"width": 320, "format": "webp", "key": "images/<имя>-320w.webp", "size": 12345}]}
+-- Повторная загрузка того же содержимого отдает готовый srcset без повторной обработки
+ALTER TABLE file_objects ADD COLUMN IF NOT EXISTS variants JSONB;
@@ -0,0 +1,13 @@
+-- Индекс расположения файлов бакета files для download: запрошенный ключ (из URL) -> ключ объекта
+-- После переносов V0032/V0033 документ мог остаться в images/ или без папки; путь ищется один раз.
+-- Заполняется сканированием бакета (backend/common/file_locations.py), дополняется upload и download
+CREATE TABLE IF NOT EXISTS file_locations (
+    requested_key VARCHAR(512) PRIMARY KEY,
+    object_key VARCHAR(512) NOT NULL,
+    size BIGINT,
+    content_type VARCHAR(255),
+    etag VARCHAR(255),
+    resolved_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_locations_object_key ON file_locations(object_key);
@@ -0,0 +1,18 @@
+-- Счетчики прогресса ведутся инкрементально: completed_lessons растет на вставке в lesson_completions,
+-- lessons_count - на создании и удалении урока. Выравниваем их с фактическими данными один раз.
+UPDATE courses_v2
+SET lessons_count = (
+  SELECT COUNT(*)
+  FROM lessons_v2
+  WHERE lessons_v2.course_id = courses_v2.id
+);
+
+UPDATE course_progress_v2 cp
+SET completed_lessons = (
+      SELECT COUNT(*)
+      FROM lesson_completions lc
+      WHERE lc.user_id = cp.user_id AND lc.course_id = cp.course_id
+    ),
+    total_lessons = c.lessons_count
+FROM courses_v2 c
+WHERE c.id = cp.course_id;